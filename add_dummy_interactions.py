@@ -1,15 +1,13 @@
 # add_dummy_interactions.py
 import streamlit as st
-from pymongo import MongoClient
 from bson.objectid import ObjectId
 import random
 from datetime import datetime, timedelta
 import uuid
-import config
+from event_counters import record_interaction
 
 # MongoDB setup
-client = MongoClient(config.MONGODB_URI)
-db = client.get_database()
+from mongo_client import db
 
 def get_random_date_within_last_days(days_range=(1, 30)):
     days_ago = random.randint(*days_range)
@@ -19,7 +17,7 @@ def get_all_users():
     return list(db.users.find())
 
 def add_dummy_order(event_id, user_id):
-    db.orders.insert_one({
+    record_interaction(db, "orders", {
         "event": ObjectId(event_id),
         "buyer": ObjectId(user_id),
         "createdAt": get_random_date_within_last_days(),
@@ -29,7 +27,7 @@ def add_dummy_order(event_id, user_id):
     })
 
 def add_dummy_like(event_id, user_id):
-    db.likes.insert_one({
+    record_interaction(db, "likes", {
         "event": ObjectId(event_id),
         "liker": ObjectId(user_id),
         "createdAt": get_random_date_within_last_days(),
@@ -37,7 +35,7 @@ def add_dummy_like(event_id, user_id):
     })
 
 def add_dummy_click(event_id, user_id):
-    db.clicks.insert_one({
+    record_interaction(db, "clicks", {
         "event": ObjectId(event_id),
         "clicker": ObjectId(user_id),
         "createdAt": get_random_date_within_last_days(),
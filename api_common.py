@@ -0,0 +1,131 @@
+# api_common.py
+"""
+Request parsing and response bodies shared by the Flask app (BACKEND.py) and
+the async app (asgi_app.py), so both serve exactly the same JSON contract.
+
+Collection endpoints accept:
+    ?limit=N          page size (keyset pagination on _id, next cursor in X-Next-After)
+    ?after=<id>       return documents with _id greater than this cursor
+    ?fields=a,b       only return these fields (_id is always included)
+    ?format=ndjson    one JSON document per line, streamed as the cursor yields
+Without limit the whole collection is streamed as a JSON array.
+"""
+from bson import json_util
+from bson.objectid import ObjectId
+
+MAX_PAGE_LIMIT = 1000
+
+JSON_MIMETYPE = "application/json"
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# Event fields the insight routes read
+INSIGHT_EVENT_PROJECTION = {"title": 1, "likeCount": 1, "clickCount": 1}
+# Denormalized counter behind each insight source
+INSIGHT_COUNTERS = {"likes": "likeCount", "clicks": "clickCount"}
+
+
+class RequestError(ValueError):
+    """Invalid query parameters; the message is returned to the client with a 400."""
+
+
+# ------------------------------
+# Collection endpoints
+def parse_collection_args(args):
+    """
+    (query, projection, limit, ndjson) from a request's query arguments
+    (Flask's and Quart's MultiDict). Raises RequestError on invalid values.
+    """
+    query = {}
+    after = args.get("after")
+    if after:
+        if not ObjectId.is_valid(after):
+            raise RequestError("Invalid after cursor.")
+        query["_id"] = {"$gt": ObjectId(after)}
+
+    projection = None
+    fields = args.get("fields")
+    if fields:
+        projection = {f.strip(): 1 for f in fields.split(",") if f.strip()}
+
+    limit = args.get("limit", type=int)
+    if limit is not None and not 0 < limit <= MAX_PAGE_LIMIT:
+        raise RequestError(f"limit must be between 1 and {MAX_PAGE_LIMIT}.")
+
+    return query, projection, limit, args.get("format") == "ndjson"
+
+
+def page_response(response_class, page, limit, ndjson):
+    """
+    Response for a materialized page of documents; `response_class` is the
+    framework's Response. Full pages carry the next cursor in X-Next-After.
+    """
+    if ndjson:
+        response = response_class("".join(ndjson_line(doc) for doc in page), mimetype=NDJSON_MIMETYPE)
+    else:
+        response = response_class(json_util.dumps(page), mimetype=JSON_MIMETYPE)
+    if len(page) == limit:
+        response.headers["X-Next-After"] = str(page[-1]["_id"])
+    return response
+
+
+def ndjson_line(doc):
+    return json_util.dumps(doc) + "\n"
+
+
+def json_array_chunks(docs):
+    """Stream an iterable of documents as one JSON array."""
+    yield "["
+    first = True
+    for doc in docs:
+        if not first:
+            yield ","
+        first = False
+        yield json_util.dumps(doc)
+    yield "]"
+
+
+async def json_array_chunks_async(docs):
+    """json_array_chunks for an async iterable (a motor cursor)."""
+    yield "["
+    first = True
+    async for doc in docs:
+        if not first:
+            yield ","
+        first = False
+        yield json_util.dumps(doc)
+    yield "]"
+
+
+# ------------------------------
+# Insights
+def insight_total(event, insights, source):
+    """Interaction total for an insight route: the denormalized counter, else the rollup's total."""
+    return event.get(INSIGHT_COUNTERS[source], insights["total"])
+
+
+def like_insights_body(event, insights, total, percentage_rank):
+    """Response body of /event_like_insights."""
+    return {
+        "dailyLikes": [{"date": date_str, "likes": count} for date_str, count in insights["daily"]],
+        "eventName": event.get("title", "Untitled Event"),
+        "lastLikeDaysAgo": insights["lastDaysAgo"],
+        "peakEngagementDaysAgo": insights["peakDaysAgo"],
+        "peakEngagementLikes": insights["peakCount"],
+        "percentageRank": percentage_rank,
+        "totalLikes": total,
+        "weeklyGrowth": insights["weeklyGrowth"]
+    }
+
+
+def click_insights_body(event, insights, total, percentage_rank):
+    """Response body of /event_click_insights."""
+    return {
+        "dailyClicks": [{"date": date, "clicks": count} for date, count in insights["daily"]],
+        "eventName": event.get("title", "Untitled Event"),
+        "lastClickDaysAgo": insights["lastDaysAgo"],
+        "peakEngagementDaysAgo": insights["peakDaysAgo"],
+        "peakEngagementClicks": insights["peakCount"],
+        "percentageRank": percentage_rank,
+        "totalClicks": total,
+        "weeklyGrowth": insights["weeklyGrowth"]
+    }
@@ -0,0 +1,168 @@
+# asgi_app.py
+"""
+Async serving mode: the same routes and JSON contract as BACKEND.py on Quart
+and the motor driver, so a slow insight or recommendation call only holds its
+own coroutine instead of a whole gunicorn worker.
+
+- request parsing and response bodies come from api_common, so both apps
+  serve the same contract;
+- the rollup, weekly and rank queries behind the insight routes are issued
+  concurrently, and /recommendations reads a user's interactions with the
+  same $unionWith aggregation as the Flask app;
+- CPU-bound scoring runs on a bounded thread pool (ASYNC_SCORING_WORKERS);
+- the model store, recommendation cache and their background threads are the
+  same ones the Flask app uses.
+
+Run with:
+    hypercorn asgi_app:app --workers 4 --bind 0.0.0.0:8000
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from quart import Quart, Response, request, jsonify
+
+import config
+from api_common import (
+    INSIGHT_EVENT_PROJECTION, JSON_MIMETYPE, NDJSON_MIMETYPE, RequestError,
+    click_insights_body, insight_total, json_array_chunks_async, like_insights_body,
+    ndjson_line, page_response, parse_collection_args,
+)
+from logging_setup import configure_logging
+from metrics import METRICS_ENABLED, render_metrics
+from db_indexes import ensure_indexes
+from event_insights import get_interaction_insights_async, percentage_rank_async
+from mongo_client import db, get_async_db
+from rec_cache import RecommendationCache, start_invalidation_watcher, start_cache_warmer
+from rec_model_store import get_model_store, start_model_refresher
+
+# Threads available for recommendation scoring per worker process
+SCORING_WORKERS = getattr(config, "ASYNC_SCORING_WORKERS", os.cpu_count() or 1)
+
+configure_logging()
+
+app = Quart(__name__)
+
+# Startup work is synchronous and shared with the Flask app
+ensure_indexes(db)
+model_store = get_model_store(db)
+start_model_refresher(db)
+
+rec_cache = RecommendationCache()
+start_invalidation_watcher(rec_cache, db)
+start_cache_warmer(rec_cache, db)
+
+scoring_executor = ThreadPoolExecutor(max_workers=SCORING_WORKERS, thread_name_prefix="rec-scoring")
+
+
+@app.after_serving
+async def shutdown_executor():
+    scoring_executor.shutdown(wait=False)
+
+
+@app.route("/")
+async def hello_world():
+    return "Hello, World! This is EventPro Async Backend"
+
+# ------------------------------
+# Collection endpoints (same query parameters as BACKEND.py, see api_common)
+async def stream_collection(name):
+    try:
+        query, projection, limit, ndjson = parse_collection_args(request.args)
+    except RequestError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cursor = get_async_db()[name].find(query, projection).sort("_id", 1)
+
+    if limit is not None:
+        return page_response(Response, await cursor.to_list(limit), limit, ndjson)
+
+    if ndjson:
+        async def generate():
+            async for doc in cursor:
+                yield ndjson_line(doc)
+        return Response(generate(), mimetype=NDJSON_MIMETYPE)
+    return Response(json_array_chunks_async(cursor), mimetype=JSON_MIMETYPE)
+
+@app.route("/users", methods=["GET"])
+async def get_users():
+    return await stream_collection("users")
+
+@app.route("/orders", methods=["GET"])
+async def get_orders():
+    return await stream_collection("orders")
+
+@app.route("/likes", methods=["GET"])
+async def get_likes():
+    return await stream_collection("likes")
+
+@app.route("/events", methods=["GET"])
+async def get_events():
+    return await stream_collection("events")
+
+@app.route("/clicks", methods=["GET"])
+async def get_clicks():
+    return await stream_collection("clicks")
+
+@app.route("/categories", methods=["GET"])
+async def get_categories():
+    return await stream_collection("categories")
+
+# ------------------------------
+# Insights
+async def load_insights(source, event_id):
+    """The event document and its rollup insights, fetched concurrently."""
+    adb = get_async_db()
+    event_oid = ObjectId(event_id)
+    event, insights = await asyncio.gather(
+        adb.events.find_one({"_id": event_oid}, INSIGHT_EVENT_PROJECTION),
+        get_interaction_insights_async(adb, source, event_oid, datetime.utcnow()),
+    )
+    return adb, event, insights
+
+@app.route("/event_like_insights/<event_id>", methods=["GET"])
+async def get_event_like_insights(event_id):
+    adb, event, insights = await load_insights("likes", event_id)
+    if not event:
+        return {"error": "Event not found."}
+
+    total_likes = insight_total(event, insights, "likes")
+    percentage_rank = await percentage_rank_async(adb.events, event["_id"], "likeCount", total_likes)
+    return like_insights_body(event, insights, total_likes, percentage_rank)
+
+@app.route("/event_click_insights/<event_id>", methods=["GET"])
+async def get_event_clicks_insights(event_id):
+    adb, event, insights = await load_insights("clicks", event_id)
+    if not event:
+        return jsonify({"error": "Event not found."}), 404
+
+    total_clicks = insight_total(event, insights, "clicks")
+    percentage_rank = await percentage_rank_async(adb.events, event["_id"], "clickCount", total_clicks)
+    return jsonify(click_insights_body(event, insights, total_clicks, percentage_rank))
+
+# ------------------------------
+# Recommendations
+@app.route("/recommendations", methods=["GET"])
+async def get_recommendations():
+    user_id = request.args.get("userId")
+    if not user_id:
+        return jsonify({"error": "Missing userId"}), 400
+
+    recommended_ids = await rec_cache.get_or_compute_async(
+        user_id, get_async_db(), model_store, top_n=10, executor=scoring_executor
+    )
+    return jsonify({"data": recommended_ids})
+
+@app.route("/recommendations/cache_stats", methods=["GET"])
+async def get_recommendation_cache_stats():
+    return jsonify(rec_cache.stats())
+
+if METRICS_ENABLED:
+    @app.route("/metrics", methods=["GET"])
+    async def prometheus_metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+if __name__ == "__main__":
+    app.run(debug=True, use_reloader=False)
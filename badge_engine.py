@@ -0,0 +1,391 @@
+# badge_engine.py
+"""
+Evaluates several badges in one pass.
+
+This is the only implementation of the badge rules: badge_functions, the
+admin app and badge_worker all call run_badge_rules (between runs the worker
+keeps top_rated / popular_choice in memory with the same ranking). The sources behind the
+built-in rules are index queries and aggregations that run concurrently on
+the server; only the events that hold or win a badge are read back to work
+out the changes, which are written with a single unordered bulk_write. Rules
+that declare `fields` additionally get every event with those fields.
+
+New badges plug in with the two decorators:
+
+    @register_source("my_totals")
+    def my_totals(db, full=False): ...
+
+    @register_badge_rule("my_badge", fields=("someField",), sources=("my_totals",))
+    def my_badge(events, data): return winner_ids, scope_ids_or_None
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+import config
+from mongo_client import db
+from db_indexes import ensure_indexes
+from logging_setup import kv
+from engagement_rollup import STATS_COLLECTION, DATE_FORMAT, run_rollup, get_high_water
+
+logger = logging.getLogger(__name__)
+
+# Per-badge bookkeeping (e.g. high-water marks for incremental runs)
+BADGE_STATE_COLLECTION = "badge_state"
+
+# Incremental limited_seats runs fall back to a full pass this often (seconds)
+LIMITED_SEATS_FULL_INTERVAL = timedelta(seconds=getattr(config, "LIMITED_SEATS_FULL_SECONDS", 86400))
+# Event edits are re-read this far behind the previous run, for writers with skewed clocks
+CHANGE_LAG = timedelta(minutes=5)
+# Events a full limited_seats pass reads: those that can qualify (a positive or
+# string maximumTickets) and the current holders, through the maximumTickets
+# and badges indexes. No other event can win the badge or has it to lose.
+LIMITED_SEATS_FULL_MATCH = {"$or": [
+    {"maximumTickets": {"$gt": 0}},
+    {"maximumTickets": {"$type": "string"}},
+    {"badges": "limited_seats"},
+]}
+
+# source name -> callable(db, full) returning the data rules consume
+BADGE_SOURCES = {}
+
+# source name -> callable(db, data) run once the badge changes are written
+SOURCE_COMMITS = {}
+
+# badge name -> {"fields": (...), "sources": (...), "evaluate": callable}
+BADGE_RULES = {}
+
+
+def register_source(name, commit=None):
+    """
+    Register a data source. `commit(db, data)`, if given, runs after the badge
+    changes computed from `data` are written (e.g. to advance a high-water mark).
+    """
+    def decorator(func):
+        BADGE_SOURCES[name] = func
+        if commit is not None:
+            SOURCE_COMMITS[name] = commit
+        return func
+    return decorator
+
+
+def register_badge_rule(name, fields=(), sources=()):
+    """
+    Register a badge rule. `evaluate(events, data)` gets {event_id: projected event}
+    and {source name: source result} and returns (winner_ids, scope_ids) where
+    scope_ids limits which events may lose the badge (None means every event).
+    """
+    def decorator(func):
+        BADGE_RULES[name] = {"fields": tuple(fields), "sources": tuple(sources), "evaluate": func}
+        return func
+    return decorator
+
+
+# -----------------------------------------------------------------------------
+# Sources
+# -----------------------------------------------------------------------------
+def _top_by_counter(db, field):
+    """IDs of the top 10% (at least one) of events by a denormalized counter, None if no event has any."""
+    total_events = db.events.count_documents({field: {"$gt": 0}})
+    if total_events == 0:
+        return None
+    return [
+        event["_id"] for event in db.events.find({field: {"$gt": 0}}, {"_id": 1})
+        .sort([(field, -1), ("_id", 1)]).limit(max(1, total_events // 10))
+    ]
+
+
+@register_source("top_liked")
+def top_liked(db, full=False):
+    return _top_by_counter(db, "likeCount")
+
+
+@register_source("top_clicked")
+def top_clicked(db, full=False):
+    return _top_by_counter(db, "clickCount")
+
+
+@register_source("recently_created")
+def recently_created(db, full=False):
+    three_days_ago = datetime.utcnow() - timedelta(days=3)
+    return [event["_id"] for event in db.events.find({"createdAt": {"$gte": three_days_ago}}, {"_id": 1})]
+
+
+def ticket_number(value):
+    """
+    Aggregation expression for a ticket field the way int() would read it:
+    numbers as-is, numeric strings (surrounding spaces allowed) as integers,
+    a missing field as 0 and anything else (null included) as null.
+    """
+    value = {"$cond": [{"$eq": [{"$type": value}, "missing"]}, 0, value]}
+    return {"$cond": [
+        {"$eq": [{"$type": value}, "string"]},
+        {"$convert": {"input": {"$trim": {"input": value}}, "to": "int", "onError": None}},
+        {"$convert": {"input": value, "to": "double", "onError": None}},
+    ]}
+
+
+def fast_selling_pipeline(db, since_date):
+    """
+    Aggregation over the daily rollup that returns, for every event with sales on or
+    after `since_date`, whether it is in the top 10% by sales percentage:
+    [{_id, salesPercentage, isTop}]. Orders above the rollup's high-water mark are
+    pulled in with $unionWith, maximumTickets comes from a $lookup into events, and
+    the ranking is done server-side with $setWindowFields.
+    """
+    high_water = get_high_water(db, "orders")
+    tail_match = {} if high_water is None else {"_id": {"$gt": high_water}}
+    return [
+        {"$match": {"date": {"$gte": since_date}, "orders": {"$gt": 0}}},
+        {"$project": {"_id": 0, "event": 1, "sold": "$orders"}},
+        {"$unionWith": {"coll": "orders", "pipeline": [
+            {"$match": tail_match},
+            {"$match": {"$expr": {"$gte": [
+                {"$dateToString": {"format": DATE_FORMAT, "date": "$createdAt"}}, since_date
+            ]}}},
+            {"$project": {"_id": 0, "event": 1, "sold": {"$literal": 1}}},
+        ]}},
+        {"$group": {"_id": "$event", "ticketsSold": {"$sum": "$sold"}}},
+        # Every event with recent sales counts towards the 10% cut, even without valid ticket data
+        {"$setWindowFields": {"output": {"totalEvents": {"$count": {}}}}},
+        {"$lookup": {
+            "from": "events",
+            "localField": "_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"maximumTickets": 1}}],
+            "as": "event",
+        }},
+        {"$match": {"event": {"$ne": []}}},
+        {"$set": {"maxTickets": ticket_number({"$first": "$event.maximumTickets"})}},
+        {"$match": {"maxTickets": {"$gt": 0}}},
+        {"$set": {"salesPercentage": {"$multiply": [{"$divide": ["$ticketsSold", "$maxTickets"]}, 100]}}},
+        {"$setWindowFields": {
+            "sortBy": {"salesPercentage": -1, "_id": 1},
+            "output": {"rank": {"$documentNumber": {}}},
+        }},
+        {"$project": {
+            "salesPercentage": 1,
+            "isTop": {"$lte": ["$rank", {"$max": [1, {"$floor": {"$divide": ["$totalEvents", 10]}}]}]},
+        }},
+    ]
+
+
+@register_source("fast_selling_ranking")
+def fast_selling_ranking(db, full=False):
+    """[{_id, salesPercentage, isTop}] for events with sales in the last 3 days (see fast_selling_pipeline)."""
+    three_days_ago = datetime.utcnow() - timedelta(days=3)
+    return list(db[STATS_COLLECTION].aggregate(
+        fast_selling_pipeline(db, three_days_ago.strftime(DATE_FORMAT)), allowDiskUse=True
+    ))
+
+
+def limited_seats_pipeline(match):
+    """
+    [{_id, qualifies}] for the events matching `match` whose ticket fields are
+    valid (see ticket_number); qualifies means 10% or fewer seats remaining,
+    and maximumTickets <= 0 counts as 100% remaining.
+    """
+    return [
+        {"$match": match},
+        {"$project": {"tickets": {"$let": {
+            "vars": {
+                "max": ticket_number("$maximumTickets"),
+                "sold": ticket_number("$ticketsSoldCount"),
+            },
+            "in": {
+                "valid": {"$and": [{"$ne": ["$$max", None]}, {"$ne": ["$$sold", None]}]},
+                "remaining": {"$cond": [
+                    {"$gt": ["$$max", 0]},
+                    {"$multiply": [{"$divide": [{"$subtract": ["$$max", "$$sold"]}, "$$max"]}, 100]},
+                    100,
+                ]},
+            },
+        }}}},
+        {"$match": {"$expr": "$tickets.valid"}},
+        {"$project": {"qualifies": {"$lte": ["$tickets.remaining", 10]}}},
+    ]
+
+
+def _save_limited_seats_state(db, data):
+    db[BADGE_STATE_COLLECTION].update_one({"_id": "limited_seats"}, {"$set": data["state"]}, upsert=True)
+
+
+@register_source("limited_seats_candidates", commit=_save_limited_seats_state)
+def limited_seats_candidates(db, full=False):
+    """
+    Ticket arithmetic for limited_seats, done server-side with $expr:
+    {"winners": ids with 10% or fewer seats remaining, "scope": ids with valid
+    ticket data, "state": bookkeeping saved once the changes are written}.
+
+    Incremental runs only re-evaluate events whose ticket fields could have
+    changed since the previous run: events with new orders (the order service
+    bumps ticketsSoldCount together with inserting the order, so new orders are
+    the change signal) and events created or updated since then (ingestion sets
+    updatedAt, so an edited maximumTickets is caught). Anything else, such as a
+    refunded order or a hand edit without updatedAt, is corrected by the full
+    pass that runs every LIMITED_SEATS_FULL_INTERVAL, on the first run, or when
+    `full` is set; it reads LIMITED_SEATS_FULL_MATCH rather than every event.
+    """
+    now = datetime.utcnow()
+    state = db[BADGE_STATE_COLLECTION].find_one({"_id": "limited_seats"}) or {}
+    latest_order = db.orders.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    full = (full or state.get("eventsCheckedAt") is None or state.get("fullRunAt") is None
+            or now - state["fullRunAt"] >= LIMITED_SEATS_FULL_INTERVAL)
+
+    new_state = {"eventsCheckedAt": now, "ordersHighWater": latest_order["_id"] if latest_order else None}
+    if full:
+        new_state["fullRunAt"] = now
+
+    match = LIMITED_SEATS_FULL_MATCH
+    if not full:
+        since = state["eventsCheckedAt"] - CHANGE_LAG
+        high_water = state.get("ordersHighWater")
+        changed = set(db.orders.distinct("event", {} if high_water is None else {"_id": {"$gt": high_water}}))
+        changed.update(event["_id"] for event in db.events.find(
+            {"$or": [{"createdAt": {"$gte": since}}, {"updatedAt": {"$gte": since}}]}, {"_id": 1}
+        ))
+        if not changed:
+            return {"winners": set(), "scope": set(), "state": new_state}
+        match = {"_id": {"$in": list(changed)}}
+
+    winners, scope = set(), set()
+    for doc in db.events.aggregate(limited_seats_pipeline(match)):
+        scope.add(doc["_id"])
+        if doc["qualifies"]:
+            winners.add(doc["_id"])
+    return {"winners": winners, "scope": scope, "state": new_state}
+
+
+# -----------------------------------------------------------------------------
+# Rules
+# -----------------------------------------------------------------------------
+@register_badge_rule("top_rated", sources=("top_liked",))
+def top_rated_rule(events, data):
+    """Top 10% most liked events."""
+    if data["top_liked"] is None:
+        return None
+    return set(data["top_liked"]), None
+
+
+@register_badge_rule("popular_choice", sources=("top_clicked",))
+def popular_choice_rule(events, data):
+    """Top 10% most clicked events."""
+    if data["top_clicked"] is None:
+        return None
+    return set(data["top_clicked"]), None
+
+
+@register_badge_rule("just_announced", sources=("recently_created",))
+def just_announced_rule(events, data):
+    """Events created in the last 3 days."""
+    return set(data["recently_created"]), None
+
+
+@register_badge_rule("limited_seats", sources=("limited_seats_candidates",))
+def limited_seats_rule(events, data):
+    """Events with 10% or fewer seats remaining; events with invalid ticket data are left alone."""
+    candidates = data["limited_seats_candidates"]
+    return candidates["winners"], candidates["scope"]
+
+
+@register_badge_rule("fast_selling", sources=("fast_selling_ranking",))
+def fast_selling_rule(events, data):
+    """Top 10% of events with recent sales by tickets sold / maximumTickets; only those events are re-evaluated."""
+    ranked = data["fast_selling_ranking"]
+    if not ranked:
+        return None
+    return {doc["_id"] for doc in ranked if doc["isTop"]}, {doc["_id"] for doc in ranked}
+
+
+# -----------------------------------------------------------------------------
+# Engine
+# -----------------------------------------------------------------------------
+def _load_events(db, fields):
+    projection = {"_id": 1, "badges": 1}
+    projection.update({field: 1 for field in fields})
+    return {event["_id"]: event for event in db.events.find({}, projection)}
+
+
+def _load_badges(db, badge_names, winner_ids):
+    """{event_id: badges} for events holding any of `badge_names` or in `winner_ids` (uses the badges index)."""
+    query = {"$or": [{"badges": {"$in": list(badge_names)}}, {"_id": {"$in": list(winner_ids)}}]}
+    return {event["_id"]: event.get("badges", []) for event in db.events.find(query, {"badges": 1})}
+
+
+def write_badge_changes(db, additions, removals):
+    """Apply {event_id: [badge, ...]} additions and removals with one unordered bulk_write."""
+    operations = [
+        UpdateOne({"_id": event_id}, {"$addToSet": {"badges": {"$each": names}}})
+        for event_id, names in additions.items()
+    ] + [
+        UpdateOne({"_id": event_id}, {"$pull": {"badges": {"$in": names}}})
+        for event_id, names in removals.items()
+    ]
+    if operations:
+        db.events.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def run_badge_rules(badge_names, db=db, full=False):
+    """
+    Evaluate the given badge rules together and write all changes in one
+    bulk_write. `full` makes incremental sources (limited_seats) re-check
+    every event. Returns {badge: {"added": n, "removed": n}} for evaluated badges.
+    """
+    rules = {name: BADGE_RULES[name] for name in badge_names}
+    if not rules:
+        return {}
+
+    fields = {field for rule in rules.values() for field in rule["fields"]}
+    source_names = {source for rule in rules.values() for source in rule["sources"]}
+
+    if "fast_selling_ranking" in source_names:
+        # Fold recent orders into the rollup first so the ranking reads mostly rollup rows
+        run_rollup(db)
+    with ThreadPoolExecutor(max_workers=len(source_names) + 1) as pool:
+        events_future = pool.submit(_load_events, db, fields) if fields else None
+        source_futures = {name: pool.submit(BADGE_SOURCES[name], db, full) for name in source_names}
+        events = events_future.result() if events_future else {}
+        data = {name: future.result() for name, future in source_futures.items()}
+
+    results = {}
+    for name, rule in rules.items():
+        result = rule["evaluate"](events, data)
+        if result is None:
+            logger.info("badge skipped, nothing to evaluate", extra=kv(badge=name))
+            continue
+        results[name] = result
+
+    # Per-event badge additions / removals across every rule
+    current = _load_badges(db, results, set().union(*(winners for winners, _ in results.values())))
+    additions = {}
+    removals = {}
+    summary = {}
+    for name, (winners, scope) in results.items():
+        summary[name] = {"added": 0, "removed": 0}
+        for event_id in winners:
+            if event_id in current and name not in current[event_id]:
+                additions.setdefault(event_id, []).append(name)
+                summary[name]["added"] += 1
+        for event_id, badges in current.items():
+            if name in badges and event_id not in winners and (scope is None or event_id in scope):
+                removals.setdefault(event_id, []).append(name)
+                summary[name]["removed"] += 1
+
+    write_badge_changes(db, additions, removals)
+    for name in source_names & set(SOURCE_COMMITS):
+        SOURCE_COMMITS[name](db, data[name])
+
+    for name, changes in summary.items():
+        logger.info("badge updated", extra=kv(badge=name, added=changes["added"], removed=changes["removed"]))
+    return summary
+
+
+if __name__ == "__main__":
+    from logging_setup import configure_logging
+
+    configure_logging(level="INFO")
+    ensure_indexes(db)
+    run_badge_rules(list(BADGE_RULES))
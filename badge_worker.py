@@ -0,0 +1,341 @@
+# badge_worker.py
+"""
+Long-running badge worker.
+
+Tails MongoDB change streams on orders and events. top_rated and
+popular_choice are kept in memory: every event's likeCount / clickCount with
+its running top-10% winner set (RankedCounter), so a like or click only writes
+the events that cross the threshold. The other badges are re-run through
+badge_engine (the same rules badge_functions and the admin app's scheduler
+run) when a change can affect them:
+
+    likeCount, clickCount             -> in memory (top_rated, popular_choice)
+    orders, maximumTickets            -> limited_seats, fast_selling
+    ticketsSoldCount                  -> limited_seats
+    createdAt, new / deleted events   -> just_announced (and the other two)
+
+Time-based badges (just_announced, fast_selling's 3-day window) are re-run
+every TICK_SECONDS, fast_selling at most every FAST_SELLING_SECONDS, and every
+badge is re-run with full=True every RESYNC_SECONDS to catch anything the
+change signals missed.
+
+Change streams need a replica set (Atlas always is one). On a single-node
+mongod use --poll, which follows the newest `_id` of each interaction
+collection and the newest event `createdAt` / `updatedAt` instead; deletes
+are only seen by the hourly resync in that mode.
+
+Usage:
+    python badge_worker.py           # change streams
+    python badge_worker.py --poll    # polling fallback
+"""
+import heapq
+import logging
+import sys
+import time
+from datetime import datetime
+
+from pymongo.errors import OperationFailure
+
+import config
+from logging_setup import configure_logging, kv
+from mongo_client import db
+from db_indexes import ensure_indexes
+from badge_engine import run_badge_rules, write_badge_changes
+
+WORKER_BADGES = ("top_rated", "popular_choice", "just_announced", "limited_seats", "fast_selling")
+# Counter field -> badge held by the top 10% of events by that counter (tracked in memory)
+RANKED_BADGES = {"likeCount": "top_rated", "clickCount": "popular_choice"}
+# Badges re-run through badge_engine
+ENGINE_BADGES = ("just_announced", "limited_seats", "fast_selling")
+# Event field -> engine badges a change to it can flip; other fields (title, badges, ...) flip none
+EVENT_FIELD_BADGES = {
+    "createdAt": ("just_announced",),
+    "maximumTickets": ("limited_seats", "fast_selling"),
+    "ticketsSoldCount": ("limited_seats",),
+}
+# Interaction collection -> engine badges a change in it can flip
+TRIGGERS = {
+    "orders": ("limited_seats", "fast_selling"),
+}
+TIME_BASED_BADGES = ("just_announced", "fast_selling")
+INTERACTION_COLLECTIONS = ("likes", "clicks", "orders")
+# Interaction collection -> counter field it feeds (polling mode)
+COUNTER_SOURCES = {"likes": "likeCount", "clicks": "clickCount"}
+
+# Changes are applied at most this often (seconds)
+BATCH_SECONDS = getattr(config, "BADGE_WORKER_BATCH_SECONDS", 1)
+# Polling interval for --poll mode (seconds)
+POLL_SECONDS = getattr(config, "BADGE_WORKER_POLL_SECONDS", 5)
+# Time-based badges are re-run this often
+TICK_SECONDS = 60
+# fast_selling folds new interactions into the rollup first; keep that off the per-order path
+FAST_SELLING_SECONDS = getattr(config, "BADGE_WORKER_FAST_SELLING_SECONDS", 15)
+# Full re-run of every badge, to correct drift
+RESYNC_SECONDS = getattr(config, "BADGE_WORKER_RESYNC_SECONDS", 3600)
+
+logger = logging.getLogger(__name__)
+
+
+def _rank_key(item):
+    """Sort key of an (event_id, count) pair: highest count first, then _id (as badge_engine ranks)."""
+    event_id, count = item
+    return -count, event_id
+
+
+def _as_count(value):
+    return value if isinstance(value, (int, float)) and value > 0 else 0
+
+
+class RankedCounter:
+    """
+    Per-event counts with the top 10% (at least one) winner set, ranked like
+    badge_engine's top_liked / top_clicked sources. The winner set is only
+    recomputed when an update can cross the threshold.
+    """
+
+    def __init__(self, counts=None):
+        self.counts = {event_id: count for event_id, count in (counts or {}).items() if _as_count(count)}
+        self.winners = set()
+        self.boundary = None    # rank key of the last winner
+        self._recompute()
+
+    def _top_count(self):
+        return max(1, len(self.counts) // 10) if self.counts else 0
+
+    def _recompute(self):
+        top = heapq.nsmallest(self._top_count(), self.counts.items(), key=_rank_key)
+        previous = self.winners
+        self.winners = {event_id for event_id, _ in top}
+        self.boundary = _rank_key(top[-1]) if top else None
+        return previous ^ self.winners
+
+    def set(self, event_id, count):
+        """Set an event's count. Returns the events whose winner status changed."""
+        count = _as_count(count)
+        previous = self.counts.get(event_id, 0)
+        if count == previous:
+            return set()
+        top_count = self._top_count()
+        if count:
+            self.counts[event_id] = count
+        else:
+            self.counts.pop(event_id, None)
+
+        if self._top_count() != top_count:
+            return self._recompute()
+        if event_id in self.winners:
+            # A winner that went up stays one; one that went down may be overtaken
+            return self._recompute() if count < previous else set()
+        if count and _rank_key((event_id, count)) < self.boundary:
+            return self._recompute()
+        return set()
+
+
+class BadgeWorker:
+
+    def __init__(self, db):
+        self.db = db
+        self.ranked = {field: RankedCounter() for field in RANKED_BADGES}
+        self.flipped = {field: set() for field in RANKED_BADGES}    # events to rewrite per counter
+        self.dirty = set()
+        self.resynced_at = 0
+        self.ticked_at = 0
+        self.fast_selling_at = 0
+
+    # ------------------------------
+    # State
+    def load_counters(self):
+        """(Re)load every event's counters; the winners match what run_badge_rules just wrote."""
+        for field in RANKED_BADGES:
+            self.ranked[field] = RankedCounter({
+                event["_id"]: event[field] for event in self.db.events.find({field: {"$gt": 0}}, {field: 1})
+            })
+            self.flipped[field].clear()
+
+    def set_count(self, field, event_id, value):
+        self.flipped[field].update(self.ranked[field].set(event_id, value))
+
+    def mark(self, badges):
+        self.dirty.update(badges)
+
+    # ------------------------------
+    # Incoming changes
+    def on_event_document(self, doc):
+        """A new or replaced event: take its counters and re-run the engine badges."""
+        for field in RANKED_BADGES:
+            self.set_count(field, doc["_id"], doc.get(field))
+        self.mark(ENGINE_BADGES)
+
+    def on_event_update(self, event_id, updated, removed=()):
+        for field in list(updated) + list(removed):
+            name = field.split(".")[0]
+            if name in RANKED_BADGES:
+                self.set_count(name, event_id, updated.get(field))
+            self.mark(EVENT_FIELD_BADGES.get(name, ()))
+
+    def on_event_deleted(self, event_id):
+        for field in RANKED_BADGES:
+            self.set_count(field, event_id, 0)
+        # One event less can move the fast_selling 10% cut
+        self.mark(("fast_selling",))
+
+    def handle_change(self, change):
+        collection = change["ns"]["coll"]
+        operation = change["operationType"]
+        if collection != "events":
+            self.mark(TRIGGERS.get(collection, ()))
+            return
+        event_id = change["documentKey"]["_id"]
+        if operation == "update":
+            description = change.get("updateDescription") or {}
+            self.on_event_update(event_id, description.get("updatedFields", {}),
+                                 description.get("removedFields", []))
+        elif operation == "delete":
+            self.on_event_deleted(event_id)
+        elif change.get("fullDocument"):
+            self.on_event_document(change["fullDocument"])
+
+    # ------------------------------
+    # Evaluation
+    def resync(self):
+        """Re-run every badge, with incremental rules doing a full pass, then reload the counters."""
+        summary = run_badge_rules(WORKER_BADGES, db=self.db, full=True)
+        self.load_counters()
+        self.dirty.clear()
+        self.resynced_at = self.ticked_at = self.fast_selling_at = time.monotonic()
+        logger.info("badges resynced", extra=kv(badges=len(summary)))
+
+    def ranked_changes(self):
+        """Badge additions / removals for the events that crossed a threshold since the last flush."""
+        additions, removals = {}, {}
+        for field, badge in RANKED_BADGES.items():
+            winners = self.ranked[field].winners
+            for event_id in self.flipped[field]:
+                target = additions if event_id in winners else removals
+                target.setdefault(event_id, []).append(badge)
+            self.flipped[field].clear()
+        return additions, removals
+
+    def flush(self):
+        """Write the threshold crossings and re-run the engine badges affected since the last flush."""
+        now = time.monotonic()
+        if now - self.resynced_at >= RESYNC_SECONDS:
+            return self.resync()
+
+        additions, removals = self.ranked_changes()
+        if additions or removals:
+            write_badge_changes(self.db, additions, removals)
+            logger.info("badges written", extra=kv(
+                added=sum(map(len, additions.values())), removed=sum(map(len, removals.values())),
+            ))
+
+        if now - self.ticked_at >= TICK_SECONDS:
+            self.dirty.update(TIME_BASED_BADGES)
+            self.ticked_at = now
+        badges = set(self.dirty)
+        if "fast_selling" in badges and now - self.fast_selling_at < FAST_SELLING_SECONDS:
+            badges.discard("fast_selling")    # stays dirty for a later flush
+        if not badges:
+            return
+        self.dirty -= badges
+        if "fast_selling" in badges:
+            self.fast_selling_at = now
+        summary = run_badge_rules(sorted(badges), db=self.db)
+        changes = [counts["added"] + counts["removed"] for counts in summary.values()]
+        if any(changes):
+            logger.info("badges written", extra=kv(badges=",".join(sorted(badges)), changes=sum(changes)))
+
+    # ------------------------------
+    # Run loops
+    def run_change_streams(self):
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": ["events", *TRIGGERS]},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        }}]
+        # Open the stream before the first run so nothing between the two is missed
+        with self.db.watch(pipeline, max_await_time_ms=500) as stream:
+            self.resync()
+            next_flush = time.monotonic() + BATCH_SECONDS
+            while stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    self.handle_change(change)
+                if time.monotonic() >= next_flush:
+                    self.flush()
+                    next_flush = time.monotonic() + BATCH_SECONDS
+
+    def _latest_id(self, collection):
+        doc = self.db[collection].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        return doc["_id"] if doc else None
+
+    def _latest_event_change(self):
+        """Newest createdAt / updatedAt across events (both are indexed)."""
+        latest = []
+        for field in ("createdAt", "updatedAt"):
+            doc = self.db.events.find_one({field: {"$type": "date"}}, {field: 1}, sort=[(field, -1)])
+            if doc:
+                latest.append(doc[field])
+        return max(latest, default=None)
+
+    def _refresh_counts(self, event_ids):
+        """Re-read the counters of `event_ids` (polling mode)."""
+        for event in self.db.events.find({"_id": {"$in": list(event_ids)}}, dict.fromkeys(RANKED_BADGES, 1)):
+            for field in RANKED_BADGES:
+                self.set_count(field, event["_id"], event.get(field))
+
+    def poll_interactions(self, high_water):
+        """Follow new likes / clicks / orders past `high_water` ({collection: _id}); returns the new marks."""
+        touched = set()
+        for name in INTERACTION_COLLECTIONS:
+            query = {} if high_water[name] is None else {"_id": {"$gt": high_water[name]}}
+            for doc in self.db[name].find(query, {"event": 1}).sort("_id", 1):
+                high_water[name] = doc["_id"]
+                if name in COUNTER_SOURCES and doc.get("event") is not None:
+                    touched.add(doc["event"])
+                self.mark(TRIGGERS.get(name, ()))
+        if touched:
+            self._refresh_counts(touched)
+        return high_water
+
+    def poll_events(self, since):
+        """Events created or updated after `since`; returns the newest change seen."""
+        changed = self.db.events.find(
+            {"$or": [{"createdAt": {"$gt": since}}, {"updatedAt": {"$gt": since}}]},
+            dict(dict.fromkeys(RANKED_BADGES, 1), createdAt=1, updatedAt=1),
+        )
+        for doc in changed:
+            # Which fields changed is unknown here, so treat it like a new event
+            self.on_event_document(doc)
+            for field in ("createdAt", "updatedAt"):
+                if isinstance(doc.get(field), datetime) and doc[field] > since:
+                    since = doc[field]
+        return since
+
+    def run_polling(self):
+        high_water = {name: self._latest_id(name) for name in INTERACTION_COLLECTIONS}
+        events_high_water = self._latest_event_change()
+        self.resync()
+        while True:
+            high_water = self.poll_interactions(high_water)
+            if events_high_water is None:
+                events_high_water = self._latest_event_change()
+            else:
+                events_high_water = self.poll_events(events_high_water)
+            self.flush()
+            time.sleep(POLL_SECONDS)
+
+    def run(self, poll=False):
+        if poll:
+            return self.run_polling()
+        try:
+            return self.run_change_streams()
+        except OperationFailure as e:
+            # e.g. "The $changeStream stage is only supported on replica sets"
+            logger.warning("change streams unavailable, falling back to polling", extra=kv(error=e))
+            return self.run_polling()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    ensure_indexes(db)
+    BadgeWorker(db).run(poll="--poll" in sys.argv[1:])
@@ -0,0 +1,140 @@
+# bench_data.py
+"""
+Synthetic, reproducible data for the benchmark suite (bench_rec.py).
+
+`generate_dataset` fills an empty database with a catalog of `num_events`
+events spread over a handful of categories, a background population of users
+with random likes/clicks/orders (so insights and badges have something to rank),
+and one "probe" user per requested interaction count. Everything is derived
+from `seed`, and the denormalized counters are written consistently with the
+generated interactions.
+"""
+import calendar
+import random
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+
+from event_counters import COUNTER_FIELDS
+
+CATEGORY_NAMES = [
+    "Music", "Business", "Food & Drink", "Health", "Technology",
+    "Arts", "Sports", "Education", "Community", "Travel",
+]
+
+WORDS = (
+    "live concert festival jazz rock workshop startup networking summit conference "
+    "wine tasting street food cooking class yoga wellness retreat marathon football "
+    "cricket exhibition gallery painting photography coding hackathon python data "
+    "science lecture seminar charity volunteer meetup city tour hiking weekend family "
+    "kids night market comedy theatre film screening book club career fair design"
+).split()
+
+# Share of a probe user's interactions per collection
+PROBE_MIX = {"orders": 0.2, "likes": 0.3, "clicks": 0.5}
+
+USER_FIELDS = {"orders": "buyer", "likes": "liker", "clicks": "clicker"}
+
+INSERT_CHUNK = 5000
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _insert_chunked(collection, documents):
+    for start in range(0, len(documents), INSERT_CHUNK):
+        collection.insert_many(documents[start:start + INSERT_CHUNK], ordered=False)
+
+
+def _object_id_at(rng, created_at):
+    """An ObjectId stamped with `created_at`, as if the document had been inserted then."""
+    seconds = int(calendar.timegm(created_at.utctimetuple()))
+    return ObjectId(seconds.to_bytes(4, "big") + rng.getrandbits(64).to_bytes(8, "big"))
+
+
+def _interaction(source, rng, event_id, user_id, now):
+    created_at = now - timedelta(days=rng.randint(0, 30), seconds=rng.randint(0, 86399))
+    doc = {
+        # Back-dated ids, so the rollup (which follows _id) sees them as old interactions
+        "_id": _object_id_at(rng, created_at),
+        "event": event_id,
+        USER_FIELDS[source]: user_id,
+        "createdAt": created_at,
+    }
+    if source == "orders":
+        doc["stripeId"] = f"cs_bench_{rng.getrandbits(64):016x}"
+        doc["totalAmount"] = str(rng.randint(0, 1000))
+    return doc
+
+
+def generate_dataset(db, num_events, probe_interactions=(0,), background_users=200,
+                     background_interactions=5, seed=42):
+    """
+    Populate `db` (expected to be empty). `background_interactions` is the mean
+    number of interactions per event from background users. Returns
+    {"events": [ids], "categories": [ids], "probe_users": {count: user_id_str}}.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    categories = [{"_id": ObjectId(), "name": name} for name in CATEGORY_NAMES]
+    db.categories.insert_many(categories)
+
+    events = []
+    for index in range(num_events):
+        max_tickets = rng.randint(50, 200)
+        events.append({
+            "_id": ObjectId(),
+            "url": f"https://bench.example/e/{index}",
+            "title": _text(rng, 4),
+            "description": _text(rng, 30),
+            "category": rng.choice(categories)["_id"],
+            "createdAt": now - timedelta(days=rng.randint(0, 60)),
+            "startDateTime": now + timedelta(days=rng.randint(0, 30)),
+            "endDateTime": now + timedelta(days=rng.randint(30, 35)),
+            "price": str(rng.randint(0, 100)),
+            "isFree": False,
+            "maximumTickets": max_tickets,
+            "ticketsSoldCount": rng.randint(0, max_tickets),
+            "badges": [],
+        })
+    event_ids = [event["_id"] for event in events]
+
+    users = [{"_id": ObjectId(), "firstName": f"bench{i}"} for i in range(background_users)]
+    probe_users = {count: ObjectId() for count in probe_interactions}
+    db.users.insert_many(users + [{"_id": uid, "firstName": f"probe{count}"} for count, uid in probe_users.items()])
+
+    interactions = {source: [] for source in USER_FIELDS}
+    total_background = num_events * background_interactions
+    for _ in range(total_background):
+        source = rng.choices(list(PROBE_MIX), weights=[1, 3, 6])[0]
+        interactions[source].append(
+            _interaction(source, rng, rng.choice(event_ids), rng.choice(users)["_id"], now)
+        )
+    for count, user_id in probe_users.items():
+        for source, share in PROBE_MIX.items():
+            for _ in range(round(count * share)):
+                interactions[source].append(_interaction(source, rng, rng.choice(event_ids), user_id, now))
+
+    # Denormalized counters consistent with the generated interactions
+    counts = {}
+    for source, docs in interactions.items():
+        field = COUNTER_FIELDS[source]
+        for doc in docs:
+            key = (doc["event"], field)
+            counts[key] = counts.get(key, 0) + 1
+    for event in events:
+        for field in COUNTER_FIELDS.values():
+            event[field] = counts.get((event["_id"], field), 0)
+
+    _insert_chunked(db.events, events)
+    for source, docs in interactions.items():
+        if docs:
+            _insert_chunked(db[source], docs)
+
+    return {
+        "events": event_ids,
+        "categories": [c["_id"] for c in categories],
+        "probe_users": {count: str(uid) for count, uid in probe_users.items()},
+    }
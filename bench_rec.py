@@ -0,0 +1,282 @@
+# bench_rec.py
+"""
+Reproducible latency benchmarks for the recommender, the insight handlers and
+the badge jobs, against synthetic data (bench_data.py) in mongomock or a local
+mongod. Never point it at a real database: the target database is dropped.
+
+    python bench_rec.py --mock                           # mongomock, quick grid
+    python bench_rec.py --mongo-uri mongodb://localhost:27017/eventpro_bench --full
+    python bench_rec.py --mock --save-baseline           # record bench_baseline.json
+    python bench_rec.py --mock --baseline bench_baseline.json   # exit 1 on regression
+
+Every case reports p50/p95/p99/mean latency, the peak Python allocation while
+it ran (tracemalloc, measured in a separate untimed pass) and the process peak
+RSS. Results are written as JSON (--output). The rollup is brought up to date
+before the insight cases, as the rollup worker would keep it in production.
+
+mongomock lacks $unionWith, $merge, $setWindowFields, $lookup sub-pipelines and
+the $type expression, so under --mock the recommend, like_insights,
+click_insights, badge_limited_seats and badge_fast_selling cases are reported
+as skipped (see MOCK_UNSUPPORTED). Those cases need a real mongod.
+
+The committed bench_baseline.json is a --mock quick-grid baseline, so it only
+guards the cases mongomock can run. To guard the rest, record a mongod baseline
+on the machine that runs the comparison and compare against that file:
+
+    python bench_rec.py --mongo-uri mongodb://localhost:27017/eventpro_bench --save-baseline
+    python bench_rec.py --mongo-uri mongodb://localhost:27017/eventpro_bench --baseline bench_baseline.json
+
+A baseline recorded against the other backend is rejected rather than compared.
+"""
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import mongo_client
+from api_common import INSIGHT_EVENT_PROJECTION, insight_total
+from bench_data import generate_dataset
+from contentBasedRecSystem import get_recommended_event_ids
+from db_indexes import ensure_indexes
+from engagement_rollup import run_rollup
+from event_insights import get_interaction_insights, percentage_rank
+from load_test import percentile
+from rec_model_store import EventModelStore, use_model_store
+
+QUICK_EVENTS = (1000, 10000)
+QUICK_INTERACTIONS = (0, 100, 1000)
+FULL_EVENTS = (1000, 10000, 50000, 200000)
+FULL_INTERACTIONS = (0, 10, 100, 1000, 10000)
+
+BADGE_JOBS = ("top_rated", "popular_choice", "just_announced", "limited_seats", "fast_selling")
+
+# Case kind -> what mongomock is missing for it; these are skipped under --mock
+MOCK_UNSUPPORTED = {
+    "recommend": "$unionWith",
+    "like_insights": "$merge (rollup)",
+    "click_insights": "$merge (rollup)",
+    "badge_limited_seats": "$type expression",
+    "badge_fast_selling": "$merge, $unionWith, $setWindowFields",
+}
+
+DEFAULT_URI = "mongodb://localhost:27017/eventpro_bench"
+BASELINE_PATH = "bench_baseline.json"
+
+
+# -----------------------------------------------------------------------------
+# Measurement
+# -----------------------------------------------------------------------------
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure(func, repeat, warmup=1):
+    """Time `func` `repeat` times after `warmup` calls, then trace one extra call for memory."""
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_alloc = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "runs": repeat,
+        "p50Ms": round(percentile(timings, 50), 3),
+        "p95Ms": round(percentile(timings, 95), 3),
+        "p99Ms": round(percentile(timings, 99), 3),
+        "meanMs": round(sum(timings) / len(timings), 3),
+        "peakAllocMb": round(peak_alloc / (1024 * 1024), 3),
+        "peakRssMb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_case(results, name, func, repeat, skip=None):
+    """Measure one case; `skip` (a reason) records it as skipped without running it."""
+    if skip:
+        results[name] = {"skipped": skip}
+        print(f"{name:<48} SKIPPED (unsupported: {skip})")
+        return
+    try:
+        results[name] = measure(func, repeat)
+    except Exception as e:
+        results[name] = {"error": f"{type(e).__name__}: {e}"}
+    summary = results[name]
+    if "error" in summary:
+        print(f"{name:<48} ERROR {summary['error']}")
+    else:
+        print(f"{name:<48} p50 {summary['p50Ms']:>9.2f} ms  p95 {summary['p95Ms']:>9.2f} ms  "
+              f"p99 {summary['p99Ms']:>9.2f} ms  alloc {summary['peakAllocMb']:>7.1f} MB")
+
+
+# -----------------------------------------------------------------------------
+# Cases
+# -----------------------------------------------------------------------------
+def insights_call(db, source, count_field, event_oid):
+    """What the /event_*_insights handlers do for one request."""
+    def call():
+        event = db.events.find_one({"_id": event_oid}, INSIGHT_EVENT_PROJECTION)
+        insights = get_interaction_insights(db, source, event_oid, datetime.utcnow())
+        total = insight_total(event, insights, source)
+        percentage_rank(db.events, event_oid, count_field, total)
+    return call
+
+
+def badge_call(job):
+    def call():
+        import badge_functions
+        getattr(badge_functions, f"update_{job}_badges")()
+    return call
+
+
+def open_client(args):
+    if args.mock:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("mongomock is not installed (pip install mongomock)")
+        return mongomock.MongoClient(args.mongo_uri)
+
+    from pymongo import MongoClient
+
+    return MongoClient(args.mongo_uri, **mongo_client.client_options())
+
+
+def run_suite(args):
+    client = open_client(args)
+    mongo_client.use_client(client)
+    db = client.get_database()
+    if not db.name.endswith("_bench") and not args.force:
+        sys.exit(f"Refusing to drop database '{db.name}' (name must end in _bench, or pass --force)")
+
+    unsupported = MOCK_UNSUPPORTED if args.mock else {}
+    results = {}
+    for num_events in args.events:
+        client.drop_database(db.name)
+        dataset = generate_dataset(db, num_events, probe_interactions=args.interactions, seed=args.seed)
+        ensure_indexes(db)
+        print(f"--- {num_events} events ---")
+
+        store = EventModelStore(path=args.model_path)
+        run_case(results, f"model_build[events={num_events}]", lambda: store.build(db), repeat=1)
+        use_model_store(store)
+
+        for count, user_id in dataset["probe_users"].items():
+            run_case(
+                results, f"recommend[events={num_events},interactions={count}]",
+                lambda user_id=user_id: get_recommended_event_ids(user_id, db),
+                args.repeat, skip=unsupported.get("recommend"),
+            )
+
+        if not args.mock:
+            run_rollup(db)
+        busiest = db.events.find_one({}, {"_id": 1}, sort=[("likeCount", -1)])["_id"]
+        run_case(results, f"like_insights[events={num_events}]",
+                 insights_call(db, "likes", "likeCount", busiest), args.repeat,
+                 skip=unsupported.get("like_insights"))
+        run_case(results, f"click_insights[events={num_events}]",
+                 insights_call(db, "clicks", "clickCount", busiest), args.repeat,
+                 skip=unsupported.get("click_insights"))
+
+        for job in BADGE_JOBS:
+            run_case(results, f"badge_{job}[events={num_events}]", badge_call(job), args.badge_repeat,
+                     skip=unsupported.get(f"badge_{job}"))
+
+    client.drop_database(db.name)
+    return results
+
+
+# -----------------------------------------------------------------------------
+# Baseline comparison
+# -----------------------------------------------------------------------------
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Cases whose p95 latency or peak allocation regressed beyond `tolerance` (a fraction)."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        # Errored or skipped cases have no timings to compare
+        if not previous or "p95Ms" not in current or "p95Ms" not in previous:
+            continue
+        if (current["p95Ms"] > previous["p95Ms"] * (1 + tolerance)
+                and current["p95Ms"] - previous["p95Ms"] > min_delta_ms):
+            regressions.append(f"{name}: p95 {previous['p95Ms']} -> {current['p95Ms']} ms")
+        if current["peakAllocMb"] > previous["peakAllocMb"] * (1 + tolerance) + 1:
+            regressions.append(f"{name}: peak alloc {previous['peakAllocMb']} -> {current['peakAllocMb']} MB")
+    return regressions
+
+
+def parse_sizes(value):
+    return tuple(int(part) for part in value.split(",") if part.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mock", action="store_true", help="run against mongomock instead of a mongod")
+    parser.add_argument("--mongo-uri", default=DEFAULT_URI)
+    parser.add_argument("--force", action="store_true", help="allow a database name without _bench")
+    parser.add_argument("--full", action="store_true", help="1k-200k events, 0-10k interactions per user")
+    parser.add_argument("--events", type=parse_sizes, help="comma-separated catalog sizes")
+    parser.add_argument("--interactions", type=parse_sizes, help="comma-separated interactions per probe user")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--badge-repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--model-path", default="bench_model.pkl")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="fail if results regress against this file")
+    parser.add_argument("--save-baseline", action="store_true", help=f"also write results to {BASELINE_PATH}")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (fraction)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore p95 changes smaller than this")
+    args = parser.parse_args()
+
+    args.events = args.events or (FULL_EVENTS if args.full else QUICK_EVENTS)
+    args.interactions = args.interactions or (FULL_INTERACTIONS if args.full else QUICK_INTERACTIONS)
+
+    results = run_suite(args)
+    report = {
+        "meta": {
+            "createdAt": datetime.utcnow().isoformat(),
+            "backend": "mongomock" if args.mock else "mongod",
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "seed": args.seed,
+        },
+        "cases": results,
+    }
+    with open(args.output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as fh:
+            json.dump(report, fh, indent=2)
+    print(f"Wrote {len(results)} case(s) to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        # mongomock and mongod timings are not comparable
+        if baseline["meta"]["backend"] != report["meta"]["backend"]:
+            sys.exit(f"{args.baseline} was recorded against {baseline['meta']['backend']}, "
+                     f"not {report['meta']['backend']}")
+        regressions = compare(results, baseline["cases"], args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("Regressions against baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
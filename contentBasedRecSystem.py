@@ -1,36 +1,29 @@
+import asyncio
+import logging
+import time
 import numpy as np
 from bson.objectid import ObjectId
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
-import re
+import scipy.sparse as sp
 from datetime import datetime
 
-def preprocess_text(text, is_category=False):
-    """Clean and preprocess text data"""
-    if not isinstance(text, str):
-        return ""
-    
-    # For categories, only convert to lowercase and strip whitespace
-    if is_category:
-        return text.lower().strip()
-    
-    # For other text (title, description), apply full preprocessing
-    text = text.lower()
-    text = re.sub(r'[^\w\s]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
-def get_event_features(event):
-    """Extract and normalize event features"""
-    features = {}
-    
-    # Text features only
-    features['title'] = preprocess_text(event.get('title', ''))
-    features['description'] = preprocess_text(event.get('description', ''))
-    features['category'] = preprocess_text(event.get('category', ''), is_category=True)
-    
-    return features
+from logging_setup import kv
+from metrics import phase
+from rec_model_store import get_model_store
+
+# Weight of each interaction type in the user profile
+INTERACTION_WEIGHTS = {'orders': 0.7,
+                       'likes': 0.2,
+                       'clicks': 0.1}
+
+# Interaction collection -> field holding the user id
+INTERACTION_FIELDS = {'orders': 'buyer',
+                      'likes': 'liker',
+                      'clicks': 'clicker'}
+
+# Users scored per matrix block in batch mode (bounds the dense score block)
+BATCH_BLOCK_SIZE = 64
+
+logger = logging.getLogger(__name__)
 
 def get_recommended_event_ids(user_id, db, top_n=10):
     """
@@ -38,142 +31,352 @@ def get_recommended_event_ids(user_id, db, top_n=10):
     Uses a sophisticated feature engineering approach focusing on category, title, and description.
     Strictly recommends only events from user's preferred categories.
     """
-    user_obj_id = ObjectId(user_id)
-    
-    # Dynamic weights based on user interaction frequency
-    
-    
-    weights = {'orders': 0.7, 
-               'likes': 0.2, 
-               'clicks': 0.1}
-    
-    # Collect user interactions
-    event_weights = {}
-    category_weights = {}  # Track category preferences
-    
-    # Process orders
-    for doc in db.orders.find({"buyer": user_obj_id}, {"event": 1}):
-        event_weights[doc["event"]] = event_weights.get(doc["event"], 0) + weights['orders']
-    
-    # Process likes
-    for doc in db.likes.find({"liker": user_obj_id}, {"event": 1}):
-        event_weights[doc["event"]] = event_weights.get(doc["event"], 0) + weights['likes']
-
-    # Process clicks
-    for doc in db.clicks.find({"clicker": user_obj_id}, {"event": 1}):
-        event_weights[doc["event"]] = event_weights.get(doc["event"], 0) + weights['clicks']
+    recommended_ids, _ = recommend_with_categories(user_id, db, top_n)
+    return recommended_ids
 
+
+def recommend_with_categories(user_id, db, top_n=10):
+    """
+    Same as get_recommended_event_ids, but returns (recommended_ids, preferred_categories)
+    so callers such as the recommendation cache know which categories the result depends on.
+    """
+    started = time.perf_counter()
+    with phase("interaction_fetch"):
+        event_weights = get_event_weights(ObjectId(user_id), db)
+    fetched = time.perf_counter()
     if not event_weights:
-        return []
-
-    # Fetch all events
-    events = list(db.events.find({}))
-    if not events:
-        return []
-
-    # Debug: Print raw event data for user interactions
-    print("\nUser Interaction Events:")
-    for event_id, weight in event_weights.items():
-        event = next((e for e in events if e["_id"] == event_id), None)
-        if event:
-            print(f"Event ID: {event_id}")
-            print(f"Title: {event.get('title', 'N/A')}")
-            print(f"Category: {event.get('category', 'N/A')}")
-            print(f"Weight: {weight}")
-            print("---")
-
-    # Build category preferences from user interactions
-    for event_id, weight in event_weights.items():
-        event = next((e for e in events if e["_id"] == event_id), None)
-        if event and 'category' in event:
-            # Use raw category without preprocessing for now
-            category = event['category']
-            category_weights[category] = category_weights.get(category, 0) + weight
-
-    # Get top preferred categories (categories with highest weights)
-    preferred_categories = sorted(category_weights.items(), key=lambda x: x[1], reverse=True)
-    preferred_categories = [cat for cat, _ in preferred_categories[:3]]  # Keep top 3 categories
-
-    if not preferred_categories:
-        return []
-
-    # Prepare features for all events
-    event_features = []
-    event_ids = []
-    event_categories = []  # Store categories separately
-    
-    for event in events:
-        features = get_event_features(event)
-        # Combine title and description for content analysis
-        event_features.append(f"{features['title']} {features['description']}")
-        event_ids.append(event["_id"])
-        # Use raw category without preprocessing
-        event_categories.append(event.get('category', ''))
-
-    # Create TF-IDF vectors for text features
-    vectorizer = TfidfVectorizer(
-        stop_words='english',
-        ngram_range=(1, 2),
-        max_features=1000
+        return [], []
+
+    # Vectorizer + term matrix come from the persistent model store
+    with phase("event_fetch"):
+        store = get_model_store(db)
+    recommended_ids, preferred_categories = score_event_weights(store, event_weights, top_n)
+    _log_scored(user_id, event_weights, recommended_ids, started, fetched)
+    return recommended_ids, preferred_categories
+
+
+async def recommend_with_categories_async(user_id, adb, store, top_n=10, executor=None):
+    """
+    recommend_with_categories for the async server: the interaction read goes
+    through the motor database `adb` and the CPU-bound scoring runs
+    on `executor` so it never blocks the event loop. `store` is the already
+    loaded model store (get_model_store itself is synchronous).
+    """
+    started = time.perf_counter()
+    with phase("interaction_fetch"):
+        event_weights = await get_event_weights_async(ObjectId(user_id), adb)
+    fetched = time.perf_counter()
+    if not event_weights:
+        return [], []
+
+    loop = asyncio.get_running_loop()
+    recommended_ids, preferred_categories = await loop.run_in_executor(
+        executor, score_event_weights, store, event_weights, top_n
     )
-    text_matrix = vectorizer.fit_transform(event_features)
-
-    # Build user profile
-    indices = []
-    weights_list = []
-    for i, eid in enumerate(event_ids):
-        if eid in event_weights:
-            indices.append(i)
-            weights_list.append(event_weights[eid])
-
-    if not indices:
-        return []
-
-    # Convert sparse matrix to dense array for user profile calculation
-    text_array = text_matrix.toarray()
-    user_vectors = text_array[indices]
-    weight_array = np.array(weights_list).reshape(-1, 1)
-    weighted_sum = (user_vectors * weight_array).sum(axis=0)
-    total_weight = weight_array.sum()
-    user_profile = weighted_sum / total_weight
-
-    # Get candidate events from preferred categories only
-    candidate_indices = []
-    candidate_categories = []  # Track categories of candidates
-    for i, (eid, category) in enumerate(zip(event_ids, event_categories)):
-        if eid not in event_weights and category in preferred_categories:
-            candidate_indices.append(i)
-            candidate_categories.append(category)
-
-    if not candidate_indices:
-        return []
-
-    # Calculate content-based similarities only for preferred category events
-    candidate_vectors = text_array[candidate_indices]
-    content_similarities = cosine_similarity(candidate_vectors, user_profile.reshape(1, -1)).flatten()
-
-    # Sort and return recommendations based on content similarity
-    sorted_indices = np.argsort(content_similarities)[::-1]
-    recommended_ids = []
-    recommended_categories = []  # Track categories of recommendations
-
-    for idx in sorted_indices[:top_n]:
-        original_index = candidate_indices[idx]
-        recommended_ids.append(str(event_ids[original_index]))
-        recommended_categories.append(candidate_categories[idx])
-
-    # Debug logging
-    print("\nDebug Information:")
-    print(f"User's preferred categories: {preferred_categories}")
-    print(f"Category weights: {category_weights}")
-    print(f"Recommended categories: {recommended_categories}")
-    
-    # Verify all recommendations are from preferred categories
-    for cat in recommended_categories:
-        if cat not in preferred_categories:
-            print(f"\nWARNING: Found recommendation from non-preferred category: {cat}")
-            print(f"Preferred categories: {preferred_categories}")
-            print(f"User's category weights: {category_weights}")
-            return []  # Return empty list if we find any non-preferred categories
+    _log_scored(user_id, event_weights, recommended_ids, started, fetched)
+    return recommended_ids, preferred_categories
 
-    return recommended_ids
+
+def _log_scored(user_id, event_weights, recommended_ids, started, fetched):
+    if logger.isEnabledFor(logging.DEBUG):
+        finished = time.perf_counter()
+        logger.debug("recommendations scored", extra=kv(
+            user=user_id,
+            interacted=len(event_weights),
+            recommended=len(recommended_ids),
+            fetch_ms=(fetched - started) * 1000,
+            score_ms=(finished - fetched) * 1000,
+        ))
+
+
+def event_weights_pipeline(user_obj_id):
+    """
+    One aggregation over orders, likes and clicks ($unionWith), grouped by event
+    with a count per interaction type. Each branch matches on its user index.
+    Events come back in first-interaction order (orders, then likes, then clicks),
+    which keeps category tie-breaking the same as reading the collections in turn.
+    """
+    branches = []
+    for rank, (collection, user_field) in enumerate(INTERACTION_FIELDS.items()):
+        branches.append((collection, [
+            {"$match": {user_field: user_obj_id}},
+            {"$project": {
+                "_id": 0,
+                "event": 1,
+                "source": {"$literal": collection},
+                "seen": {"rank": {"$literal": rank}, "id": "$_id"},
+            }},
+        ]))
+
+    (_, pipeline), *rest = branches
+    for collection, branch in rest:
+        pipeline.append({"$unionWith": {"coll": collection, "pipeline": branch}})
+    pipeline.append({"$group": {
+        "_id": "$event",
+        **{
+            collection: {"$sum": {"$cond": [{"$eq": ["$source", collection]}, 1, 0]}}
+            for collection in INTERACTION_FIELDS
+        },
+        "firstSeen": {"$min": "$seen"},
+    }})
+    pipeline.append({"$sort": {"firstSeen": 1}})
+    return pipeline
+
+
+def get_event_weights(user_obj_id, db):
+    """{event_id: summed interaction weight} over the user's orders, likes and clicks, in one round trip."""
+    first_collection = next(iter(INTERACTION_FIELDS))
+    event_weights = {}
+    for doc in db[first_collection].aggregate(event_weights_pipeline(user_obj_id)):
+        event_weights[doc["_id"]] = _summed_weight(doc)
+    return event_weights
+
+
+def _summed_weight(counts):
+    """
+    Weight of an event given {collection: interaction count}. Accumulated one
+    interaction at a time, in collection order, so the float weights are
+    bit-for-bit those of the per-document loop (and equal on every path).
+    """
+    weight = 0
+    for collection in INTERACTION_FIELDS:
+        for _ in range(counts.get(collection, 0)):
+            weight += INTERACTION_WEIGHTS[collection]
+    return weight
+
+
+async def get_event_weights_async(user_obj_id, adb):
+    """get_event_weights on a motor database: the same $unionWith aggregation, awaited."""
+    first_collection = next(iter(INTERACTION_FIELDS))
+    event_weights = {}
+    async for doc in adb[first_collection].aggregate(event_weights_pipeline(user_obj_id)):
+        event_weights[doc["_id"]] = _summed_weight(doc)
+    return event_weights
+
+
+def score_event_weights(store, event_weights, top_n=10):
+    """Rank candidates for one user's interaction weights. Returns (ids, preferred_categories)."""
+    if not store.is_ready():
+        return [], []
+
+    with store.lock:
+        return _score_user(store, event_weights, top_n)
+
+
+def _score_user(store, event_weights, top_n):
+    """Score candidate events for one user against the model store (caller holds store.lock)."""
+    # Rows (and weights) of the events the user interacted with, via the store's id index
+    interacted = [
+        (store.row_of[event_id], weight)
+        for event_id, weight in event_weights.items()
+        if event_id in store.row_of
+    ]
+    if not interacted:
+        return [], []
+    rows = np.fromiter((row for row, _ in interacted), dtype=np.intp, count=len(interacted))
+    weight_array = np.fromiter((weight for _, weight in interacted), dtype=float, count=len(interacted))
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for row, weight in interacted:
+            logger.debug("interacted event", extra=kv(
+                event=store.event_ids[row], category=store.categories[row] or "N/A", weight=weight
+            ))
+
+    preferred_codes, category_weights, seen_codes = _preferred_codes(store, rows, weight_array)
+    if preferred_codes is None:
+        return [], []
+    preferred_categories = [store.category_values[code] for code in preferred_codes]
+
+    # Weighted user profile built straight from the sparse rows (no densified catalog)
+    with phase("vectorize"):
+        text_matrix = store.matrix
+        user_vectors = text_matrix[rows]
+        total_weight = weight_array.sum()
+        user_profile = np.asarray(user_vectors.T @ weight_array).ravel() / total_weight
+
+    with phase("score"):
+        candidate_indices = _candidate_rows(store, preferred_codes, rows)
+        if not len(candidate_indices):
+            return [], preferred_categories
+
+        # Calculate content-based similarities only for preferred category events
+        candidate_vectors = text_matrix[candidate_indices]
+        content_similarities = _cosine_scores(candidate_vectors, user_profile)
+
+        # Sort and return recommendations based on content similarity
+        top_rows = candidate_indices[_top_k_indices(content_similarities, top_n)]
+        recommended_ids = [str(store.event_ids[row]) for row in top_rows]
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("category preferences", extra=kv(
+            preferred=preferred_categories,
+            weights={store.category_values[c]: float(category_weights[c]) for c in seen_codes},
+            recommended=[store.categories[row] for row in top_rows],
+            candidates=len(candidate_indices),
+        ))
+
+    return recommended_ids, preferred_categories
+
+
+
+def _preferred_codes(store, rows, weights):
+    """
+    Top 3 category codes by summed weight, for interacted `rows` given in
+    first-interaction order; ties go to the category interacted with first.
+    Returns (codes, category_weights, seen_codes), or (None, None, None) when
+    none of the rows has a category.
+    """
+    codes = store.category_codes[rows]
+    has_category = codes >= 0
+    if not has_category.any():
+        return None, None, None
+    category_weights = np.bincount(
+        codes[has_category], weights=weights[has_category], minlength=len(store.category_values)
+    )
+    seen_codes, first_seen = np.unique(codes[has_category], return_index=True)
+    order = np.lexsort((first_seen, -category_weights[seen_codes]))
+    return seen_codes[order[:3]], category_weights, seen_codes
+
+
+def _candidate_rows(store, preferred_codes, interacted_rows):
+    """Live events in a preferred category the user has not interacted with."""
+    candidate_mask = store.alive & np.isin(store.category_codes, preferred_codes)
+    candidate_mask[interacted_rows] = False
+    return np.flatnonzero(candidate_mask)
+
+
+def _cosine_scores(candidate_vectors, user_profile):
+    """
+    Cosine similarity of each sparse candidate row against a dense profile
+    vector. A zero profile scores every candidate 0, so ties decide the order.
+    """
+    profile_norm = np.linalg.norm(user_profile)
+    if profile_norm == 0:
+        return np.zeros(candidate_vectors.shape[0])
+
+    dots = candidate_vectors @ user_profile
+    row_norms = np.sqrt(np.asarray(candidate_vectors.multiply(candidate_vectors).sum(axis=1)).ravel())
+    # Zero rows score 0, same as sklearn's cosine_similarity
+    row_norms[row_norms == 0] = np.inf
+    return dots / (row_norms * profile_norm)
+
+
+def _top_k_indices(scores, k):
+    """
+    Indices of the k highest scores, best first, without a full sort.
+    Ties are ordered by descending position, matching np.argsort(scores)[::-1].
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=int)
+
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+        # argpartition splits ties at the boundary arbitrarily; keep every tied score
+        top = np.flatnonzero(scores >= scores[top].min())
+    else:
+        top = np.arange(len(scores))
+
+    order = np.lexsort((-top, -scores[top]))
+    return top[order][:k]
+
+
+
+def get_recommendations_for_users(user_ids, db, top_n=10):
+    """
+    Batch version of get_recommended_event_ids.
+    Loads interactions for all users with one aggregation per collection, builds a
+    sparse user x event weight matrix and computes every user profile in one
+    sparse product. Pass user_ids=None to score every user with interactions.
+    Returns {user_id (str): [event_id (str), ...]}.
+    """
+    results = recommend_batch_with_categories(user_ids, db, top_n)
+    return {user_id: recommended_ids for user_id, (recommended_ids, _) in results.items()}
+
+
+def recommend_batch_with_categories(user_ids, db, top_n=10):
+    """
+    Same as get_recommendations_for_users, but returns
+    {user_id (str): (recommended_ids, preferred_categories)}.
+    """
+    user_oids = None if user_ids is None else [ObjectId(uid) for uid in user_ids]
+    results = {} if user_oids is None else {str(uid): ([], []) for uid in user_oids}
+
+    store = get_model_store(db)
+    if not store.is_ready():
+        return results
+
+    # (user, event) -> {collection: count, "firstSeen": (collection rank, first _id)}
+    pairs = {}
+    for rank, (collection, user_field) in enumerate(INTERACTION_FIELDS.items()):
+        pipeline = []
+        if user_oids is not None:
+            pipeline.append({"$match": {user_field: {"$in": user_oids}}})
+        pipeline.append({"$group": {
+            "_id": {"user": f"${user_field}", "event": "$event"},
+            "count": {"$sum": 1},
+            "firstId": {"$min": "$_id"},
+        }})
+        for doc in db[collection].aggregate(pipeline, allowDiskUse=True):
+            pair = pairs.setdefault((doc["_id"]["user"], doc["_id"]["event"]), {"firstSeen": (rank, doc["firstId"])})
+            pair[collection] = doc["count"]
+
+    # Score against a snapshot so /recommendations misses (which take store.lock)
+    # are not blocked for the whole batch
+    model = store.snapshot()
+    # Each user's interacted rows and weights in first-interaction order,
+    # exactly as get_event_weights + _score_user see them
+    interactions = {}
+    for (user, event_id), pair in sorted(pairs.items(), key=lambda item: item[1]["firstSeen"]):
+        row = model.row_of.get(event_id)
+        if row is not None:
+            interactions.setdefault(user, []).append((row, _summed_weight(pair)))
+    if not interactions:
+        return results
+
+    users = list(interactions)
+    rows, cols, vals = [], [], []
+    for u, user in enumerate(users):
+        for row, weight in interactions[user]:
+            rows.append(u)
+            cols.append(row)
+            vals.append(weight)
+    num_events = model.matrix.shape[0]
+    weight_matrix = sp.csr_matrix((vals, (rows, cols)), shape=(len(users), num_events))
+
+    # Every user profile in one pass: row-normalised weights x term matrix
+    total_weights = np.asarray(weight_matrix.sum(axis=1)).ravel()
+    profiles = sp.diags(1.0 / total_weights) @ weight_matrix @ model.matrix
+    profile_norms = np.sqrt(np.asarray(profiles.multiply(profiles).sum(axis=1)).ravel())
+    row_norms = np.sqrt(np.asarray(model.matrix.multiply(model.matrix).sum(axis=1)).ravel())
+    row_norms[row_norms == 0] = np.inf
+
+    for block_start in range(0, len(users), BATCH_BLOCK_SIZE):
+        block = range(block_start, min(block_start + BATCH_BLOCK_SIZE, len(users)))
+        block_scores = (model.matrix @ profiles[block_start:block.stop].T).toarray()
+
+        for offset, u in enumerate(block):
+            user_rows = np.fromiter((row for row, _ in interactions[users[u]]), dtype=np.intp)
+            user_weights = np.fromiter((weight for _, weight in interactions[users[u]]), dtype=float)
+            preferred_codes, _, _ = _preferred_codes(model, user_rows, user_weights)
+            if preferred_codes is None:
+                continue
+            preferred_categories = [model.category_values[code] for code in preferred_codes]
+            results[str(users[u])] = ([], preferred_categories)
+
+            candidate_rows = _candidate_rows(model, preferred_codes, user_rows)
+            if not len(candidate_rows):
+                continue
+
+            if profile_norms[u] == 0:
+                # Same rule as _cosine_scores: everything ties at 0
+                scores = np.zeros(len(candidate_rows))
+            else:
+                scores = block_scores[candidate_rows, offset] / (row_norms[candidate_rows] * profile_norms[u])
+            top = _top_k_indices(scores, top_n)
+            results[str(users[u])] = (
+                [str(model.event_ids[candidate_rows[i]]) for i in top],
+                preferred_categories
+            )
+
+    return results
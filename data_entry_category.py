@@ -1,10 +1,4 @@
-from pymongo import MongoClient
-import config 
-
-# MongoDB Atlas connection string
-mongodb_uri = config.MONGODB_URI
-client = MongoClient(mongodb_uri)
-db = client.get_database()
+from mongo_client import db
 
 # List of original category slugs.
 category_slugs = [
@@ -0,0 +1,143 @@
+# db_indexes.py
+"""
+Indexes the hot queries rely on, and a plan check that proves they are used.
+
+Every entry point calls `ensure_indexes(db)` at startup; creating an index that
+already exists is a no-op on the server. An index that cannot be created (e.g.
+the unique url index on a database that still has duplicate urls) is logged
+and skipped, so the entry point keeps serving.
+
+Usage:
+    python db_indexes.py           # create indexes, then check query plans
+    python db_indexes.py --check   # only check query plans
+"""
+import logging
+import sys
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+
+from logging_setup import kv
+
+logger = logging.getLogger(__name__)
+
+# collection -> [(keys, options), ...]
+REQUIRED_INDEXES = {
+    "likes": [
+        ([("event", 1), ("createdAt", 1)], {}),
+        ([("liker", 1)], {}),
+    ],
+    "clicks": [
+        ([("event", 1), ("createdAt", 1)], {}),
+        ([("clicker", 1)], {}),
+    ],
+    "orders": [
+        ([("buyer", 1)], {}),
+        ([("createdAt", 1)], {}),
+        ([("event", 1), ("createdAt", 1)], {}),
+    ],
+    "events": [
+        ([("endDateTime", 1)], {}),
+        ([("category", 1)], {}),
+        ([("createdAt", 1)], {}),
+        ([("updatedAt", 1)], {}),
+        ([("likeCount", -1), ("_id", 1)], {}),
+        ([("clickCount", -1), ("_id", 1)], {}),
+        # full limited_seats passes and migrate_ticket_fields filter on maximumTickets
+        ([("maximumTickets", 1), ("ticketsSoldCount", 1)], {}),
+        # badge_engine reads the current holders of a badge
+        ([("badges", 1)], {}),
+        # ingestion upserts are keyed on url; unique so concurrent imports cannot
+        # duplicate an event (events without a url are not indexed). On existing
+        # databases it is skipped until dedupe_event_urls.py has merged duplicates.
+        ([("url", 1)], {"unique": True, "partialFilterExpression": {"url": {"$type": "string"}}}),
+    ],
+    "event_daily_stats": [
+        ([("event", 1), ("date", 1)], {"unique": True}),
+        ([("date", 1)], {}),
+    ],
+}
+
+
+def hot_queries():
+    """(collection, filter, sort) shapes of the hot queries, with representative values."""
+    now = datetime.utcnow()
+    some_id = ObjectId()
+    return [
+        ("likes", {"event": some_id, "createdAt": {"$gte": now - timedelta(days=14)}}, None),
+        ("clicks", {"event": some_id, "createdAt": {"$gte": now - timedelta(days=14)}}, None),
+        ("likes", {"liker": some_id}, None),
+        ("clicks", {"clicker": some_id}, None),
+        ("orders", {"buyer": some_id}, None),
+        ("orders", {"createdAt": {"$gte": now - timedelta(days=3)}}, None),
+        ("events", {"endDateTime": {"$lt": now}}, None),
+        ("events", {"category": some_id}, None),
+        ("events", {"createdAt": {"$gte": now - timedelta(days=3)}}, None),
+        ("events", {"likeCount": {"$gt": 0}}, [("likeCount", -1), ("_id", 1)]),
+        ("events", {"clickCount": {"$gt": 0}}, [("clickCount", -1), ("_id", 1)]),
+        ("events", {"url": "https://www.eventbrite.com/e/example"}, None),
+        ("events", {"badges": {"$in": ["top_rated", "fast_selling"]}}, None),
+        # badge_engine.LIMITED_SEATS_FULL_MATCH
+        ("events", {"$or": [
+            {"maximumTickets": {"$gt": 0}},
+            {"maximumTickets": {"$type": "string"}},
+            {"badges": "limited_seats"},
+        ]}, None),
+        ("event_daily_stats", {"event": some_id}, None),
+    ]
+
+
+def ensure_indexes(db):
+    """Create every required index. Returns the names of the indexes in place per collection."""
+    created = {}
+    for collection, indexes in REQUIRED_INDEXES.items():
+        created[collection] = []
+        for keys, options in indexes:
+            try:
+                created[collection].append(db[collection].create_index(keys, **options))
+            except OperationFailure as e:
+                # e.g. duplicate urls for the unique url index (see dedupe_event_urls.py)
+                logger.warning("index not created", extra=kv(collection=collection, keys=keys, error=e))
+    return created
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def check_query_plans(db):
+    """
+    Explain every hot query and raise RuntimeError if any of them would fall back
+    to a collection scan. Needs a real mongod (mongomock has no query planner).
+    """
+    failures = []
+    for collection, query, sort in hot_queries():
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in set(_plan_stages(winning_plan)):
+            failures.append(f"{collection} {query}" + (f" sort {sort}" if sort else ""))
+
+    if failures:
+        raise RuntimeError("Queries falling back to COLLSCAN:\n  " + "\n  ".join(failures))
+    return len(hot_queries())
+
+
+if __name__ == "__main__":
+    from mongo_client import db
+
+    if "--check" not in sys.argv[1:]:
+        for collection, names in ensure_indexes(db).items():
+            print(f"{collection}: {', '.join(names)}")
+    checked = check_query_plans(db)
+    print(f"All {checked} hot queries use an index.")
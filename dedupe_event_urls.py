@@ -0,0 +1,87 @@
+# dedupe_event_urls.py
+"""
+One-off migration: merge events that share a `url`, then make the url index
+unique.
+
+Imports used to race (and the original script inserted blindly), so the same
+scraped event can exist more than once. For every duplicated url the oldest
+event is kept: the others' likes, clicks and orders are re-pointed to it, their
+like / click / order counters are added to its own, and they are deleted along with
+their term features. The rollup is rebuilt afterwards so the moved
+interactions are counted under the kept event.
+
+Until this has run, ensure_indexes() logs and skips the unique url index on a
+database that still has duplicates (or the old non-unique url index), so run
+it once after deploying.
+
+Usage:
+    python dedupe_event_urls.py
+"""
+from pymongo.errors import OperationFailure
+
+from db_indexes import REQUIRED_INDEXES
+from engagement_rollup import rebuild_rollup
+from event_counters import COUNTER_FIELDS
+from text_features import remove_event_features
+
+
+def duplicate_url_groups(db):
+    """Yield (url, [event ids, oldest first]) for every url held by more than one event."""
+    for group in db.events.aggregate([
+        {"$match": {"url": {"$type": "string"}}},
+        {"$group": {"_id": "$url", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True):
+        yield group["_id"], sorted(group["ids"])
+
+
+def merge_events(db, keep_id, duplicate_ids):
+    """Move the interactions and counters of `duplicate_ids` onto `keep_id` and delete them."""
+    for collection in COUNTER_FIELDS:
+        db[collection].update_many({"event": {"$in": duplicate_ids}}, {"$set": {"event": keep_id}})
+
+    counters = dict.fromkeys(COUNTER_FIELDS.values(), 0)
+    for event in db.events.find({"_id": {"$in": duplicate_ids}}, dict.fromkeys(counters, 1)):
+        for field in counters:
+            counters[field] += event.get(field) or 0
+    counters = {field: count for field, count in counters.items() if count}
+    if counters:
+        db.events.update_one({"_id": keep_id}, {"$inc": counters})
+
+    db.events.delete_many({"_id": {"$in": duplicate_ids}})
+    remove_event_features(db, duplicate_ids)
+
+
+def ensure_unique_url_index(db):
+    """Replace a non-unique url index with the unique one from REQUIRED_INDEXES."""
+    keys, options = next(
+        (keys, options) for keys, options in REQUIRED_INDEXES["events"] if keys == [("url", 1)]
+    )
+    for index in list(db.events.list_indexes()):
+        if list(index["key"].items()) == keys and not index.get("unique"):
+            db.events.drop_index(index["name"])
+    return db.events.create_index(keys, **options)
+
+
+def dedupe_event_urls(db):
+    """Merge duplicated urls and create the unique index. Returns the number of events removed."""
+    removed = 0
+    for _, (keep_id, *duplicate_ids) in duplicate_url_groups(db):
+        merge_events(db, keep_id, duplicate_ids)
+        removed += len(duplicate_ids)
+
+    if removed:
+        rebuild_rollup(db)
+    try:
+        ensure_unique_url_index(db)
+    except OperationFailure as e:
+        # An import inserted a new duplicate meanwhile; running the script again merges it
+        raise RuntimeError(f"Could not create the unique url index ({e}); run the migration again.") from e
+    return removed
+
+
+if __name__ == "__main__":
+    from mongo_client import db
+
+    removed = dedupe_event_urls(db)
+    print(f"Removed {removed} duplicate event(s); the url index is unique.")
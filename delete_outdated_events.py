@@ -1,20 +1,20 @@
 # delete_outdated_events.py
 import streamlit as st
 from datetime import datetime, timezone
-import config
-from pymongo import MongoClient
 
 # MongoDB setup
-mongodb_uri = config.MONGODB_URI
-client = MongoClient(mongodb_uri)
-db = client.get_database()
+from mongo_client import db
+from engagement_rollup import forget_events
+from text_features import remove_event_features
 
 def delete_outdated_events():
     """Deletes all outdated events from the DB."""
     now = datetime.now(timezone.utc)
-    result = db.events.delete_many({
-        "endDateTime": {"$lt": now}
-    })
+    outdated = {"endDateTime": {"$lt": now}}
+    event_ids = [doc["_id"] for doc in db.events.find(outdated, {"_id": 1})]
+    result = db.events.delete_many({"_id": {"$in": event_ids}})
+    remove_event_features(db, event_ids)
+    forget_events(db, event_ids)
     return result.deleted_count
 
 def get_outdated_events():
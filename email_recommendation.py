@@ -2,14 +2,10 @@
 import streamlit as st
 import json
 from bson.objectid import ObjectId
-from contentBasedRecSystem import get_recommended_event_ids
-import config
-import pymongo
+from contentBasedRecSystem import get_recommendations_for_users
 
 # MongoDB connection
-mongodb_uri = config.MONGODB_URI
-client = pymongo.MongoClient(mongodb_uri)
-db = client.get_database()
+from mongo_client import db
 
 EVENT_BASE_URL = "http://localhost:3000/events"
 
@@ -19,17 +15,22 @@ def get_user_name_email(user_doc):
     email = user_doc.get("email", "unknown@example.com")
     return first_name, last_name, email
 
-def get_event_details(event_ids):
+def get_event_titles(event_ids):
+    """Fetch titles for many events with a single $in query."""
+    valid_ids = list({ObjectId(eid) for eid in event_ids if ObjectId.is_valid(eid)})
+    if not valid_ids:
+        return {}
+    events = db.events.find({"_id": {"$in": valid_ids}}, {"title": 1})
+    return {str(event["_id"]): event.get("title", "Untitled Event") for event in events}
+
+def get_event_details(event_ids, titles=None):
+    if titles is None:
+        titles = get_event_titles(event_ids)
     event_details = []
     for eid in event_ids:
-        try:
-            event = db.events.find_one({"_id": ObjectId(eid)})
-            if event:
-                title = event.get("title", "Untitled Event")
-                link = f"{EVENT_BASE_URL}/{eid}"
-                event_details.append({"title": title, "link": link})
-        except Exception:
-            continue
+        if eid in titles:
+            link = f"{EVENT_BASE_URL}/{eid}"
+            event_details.append({"title": titles[eid], "link": link})
     return event_details
 
 def main():
@@ -44,11 +45,15 @@ def main():
 
         email_data = []
 
+        # One batch pass for every user, then one title lookup for every recommended event
+        recommendations = get_recommendations_for_users(None, db, top_n=5)
+        titles = get_event_titles({eid for ids in recommendations.values() for eid in ids})
+
         for user in users:
             user_id = str(user["_id"])
             first_name, last_name, email = get_user_name_email(user)
-            recommended_ids = get_recommended_event_ids(user_id, db, top_n=5)
-            recommended_events = get_event_details(recommended_ids)
+            recommended_ids = recommendations.get(user_id, [])
+            recommended_events = get_event_details(recommended_ids, titles)
 
             if not recommended_events:
                 continue
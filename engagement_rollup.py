@@ -0,0 +1,428 @@
+# engagement_rollup.py
+"""
+Materialized per-event daily engagement counts.
+
+`event_daily_stats` holds one document per (event, date) with the number of
+likes, clicks and orders created that day plus the latest timestamp of each:
+
+    {event, date: "YYYY-MM-DD", likes, clicks, orders, lastLikeAt, lastClickAt, lastOrderAt}
+
+The rollup remembers, per source collection, the highest `_id` it has folded in
+(`rollup_state`). `_id` is used rather than `createdAt` because the dummy data
+tools back-date `createdAt`. Readers add the small "tail" of documents above the
+high-water mark, so results are exact even between rollup runs.
+
+The mark trails the clock by ROLLUP_LAG_SECONDS: a document whose (client
+generated) ObjectId sorts below the mark but commits late is still in the tail
+when the mark passes it, as long as it commits within the lag.
+
+Deletes are not visible to the incremental fold. `remove_interaction` (and
+`forget_events` for deleted events) queue the affected (source, event, day) in
+`rollup_dirty`, and the next run recounts those rows from the raw collection.
+Deletes made by other services (the web app's unlikes, for one) are caught by
+`event_counters.repair_counters`, which compares the counters and the rollup
+with the raw collections and fixes them on drift; `--loop` runs it every
+REPAIR_INTERVAL.
+
+Runs hold a lease in `rollup_state`, so the scheduler, the badge jobs and the
+CLI never fold the same range twice.
+
+Usage:
+    python engagement_rollup.py              # incremental run
+    python engagement_rollup.py --rebuild    # full backfill
+    python engagement_rollup.py --loop 300   # incremental run every 300 seconds, plus repairs
+"""
+import asyncio
+import logging
+import os
+import socket
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+import config
+from logging_setup import kv
+
+STATS_COLLECTION = "event_daily_stats"
+STATE_COLLECTION = "rollup_state"
+DIRTY_COLLECTION = "rollup_dirty"
+REBUILD_COLLECTION = "event_daily_stats_rebuild"
+
+# How far (seconds) the high-water mark trails the clock
+ROLLUP_LAG = timedelta(seconds=getattr(config, "ROLLUP_LAG_SECONDS", 300))
+# How often (seconds) `--loop` runs the rollup
+ROLLUP_INTERVAL = getattr(config, "ROLLUP_INTERVAL_SECONDS", 300)
+# How often (seconds) `--loop` also runs event_counters.repair_counters
+REPAIR_INTERVAL = getattr(config, "COUNTER_REPAIR_SECONDS", 3600)
+# A run's lease expires after this long (seconds) if its process dies
+LEASE_SECONDS = 600
+LEASE_ID = "lease"
+
+logger = logging.getLogger(__name__)
+
+# source collection -> (count field, last-timestamp field)
+ROLLUP_SOURCES = {
+    "likes": ("likes", "lastLikeAt"),
+    "clicks": ("clicks", "lastClickAt"),
+    "orders": ("orders", "lastOrderAt"),
+}
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def ensure_rollup_indexes(db):
+    db[STATS_COLLECTION].create_index([("event", 1), ("date", 1)], unique=True)
+
+
+def get_high_water(db, source):
+    """Highest `_id` of `source` already folded into the rollup (None if never run)."""
+    state = db[STATE_COLLECTION].find_one({"_id": source})
+    return state["highWater"] if state else None
+
+
+def _latest_id(db, source, now=None):
+    """Newest `_id` of `source` created at least ROLLUP_LAG ago (None if there is none)."""
+    cutoff = ObjectId.from_datetime((now or datetime.utcnow()) - ROLLUP_LAG)
+    doc = db[source].find_one({"_id": {"$lte": cutoff}}, {"_id": 1}, sort=[("_id", -1)])
+    return doc["_id"] if doc else None
+
+
+def _acquire_lease(db, seconds=LEASE_SECONDS):
+    """Take the rollup lease; returns the owner token, or None if another run holds it."""
+    now = datetime.utcnow()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{ObjectId()}"
+    try:
+        db[STATE_COLLECTION].find_one_and_update(
+            {"_id": LEASE_ID, "$or": [{"expiresAt": {"$lt": now}}, {"expiresAt": None}]},
+            {"$set": {"owner": owner, "expiresAt": now + timedelta(seconds=seconds)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return None
+    return owner
+
+
+def _release_lease(db, owner):
+    db[STATE_COLLECTION].update_one({"_id": LEASE_ID, "owner": owner}, {"$set": {"expiresAt": None}})
+
+
+def _merge_pipeline(source, id_range, accumulate, into=STATS_COLLECTION):
+    """Group `source` documents in `id_range` by (event, day) and $merge them into `into`."""
+    count_field, last_field = ROLLUP_SOURCES[source]
+    if accumulate:
+        # Incremental run: add to whatever the rollup already holds
+        when_matched = [{"$set": {
+            count_field: {"$add": [{"$ifNull": [f"${count_field}", 0]}, f"$$new.{count_field}"]},
+            last_field: {"$max": [f"${last_field}", f"$$new.{last_field}"]},
+        }}]
+    else:
+        when_matched = "merge"
+
+    return [
+        {"$match": {"_id": id_range}},
+        {"$group": {
+            "_id": {
+                "event": "$event",
+                "date": {"$dateToString": {"format": DATE_FORMAT, "date": "$createdAt"}},
+            },
+            count_field: {"$sum": 1},
+            last_field: {"$max": "$createdAt"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "event": "$_id.event",
+            "date": "$_id.date",
+            count_field: 1,
+            last_field: 1,
+        }},
+        {"$merge": {
+            "into": into,
+            "on": ["event", "date"],
+            "whenMatched": when_matched,
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+def run_rollup(db):
+    """
+    Fold every interaction created since the last run into `event_daily_stats`
+    and recount the rows queued by deletes. Returns {source: high-water mark};
+    if another run holds the lease this one does nothing (readers add the tail).
+    """
+    owner = _acquire_lease(db)
+    if owner is None:
+        logger.info("rollup already running elsewhere")
+        return {source: get_high_water(db, source) for source in ROLLUP_SOURCES}
+    try:
+        ensure_rollup_indexes(db)
+        marks = {}
+        now = datetime.utcnow()
+        for source in ROLLUP_SOURCES:
+            upper = _latest_id(db, source, now)
+            lower = get_high_water(db, source)
+            if upper is None or (lower is not None and upper <= lower):
+                marks[source] = lower
+                continue
+
+            id_range = {"$lte": upper}
+            if lower is not None:
+                id_range["$gt"] = lower
+            list(db[source].aggregate(_merge_pipeline(source, id_range, accumulate=True), allowDiskUse=True))
+            db[STATE_COLLECTION].update_one({"_id": source}, {"$set": {"highWater": upper}}, upsert=True)
+            marks[source] = upper
+        _recount_dirty(db, marks)
+        return marks
+    finally:
+        _release_lease(db, owner)
+
+
+def rebuild_rollup(db):
+    """
+    Backfill: recompute the rollup from every raw interaction into a scratch
+    collection and rename it over `event_daily_stats`. Sources that already
+    have a high-water mark are rebuilt up to that same mark, so readers see a
+    consistent rollup + tail before and after the swap.
+    """
+    owner = _acquire_lease(db)
+    if owner is None:
+        raise RuntimeError("Another rollup run holds the lease; try again later.")
+    try:
+        started = ObjectId()
+        db[REBUILD_COLLECTION].drop()
+        db[REBUILD_COLLECTION].create_index([("event", 1), ("date", 1)], unique=True)
+
+        marks, new_marks = {}, {}
+        now = datetime.utcnow()
+        for source in ROLLUP_SOURCES:
+            upper = get_high_water(db, source)
+            if upper is None:
+                upper = new_marks[source] = _latest_id(db, source, now)
+            marks[source] = upper
+            if upper is None:
+                continue
+            list(db[source].aggregate(
+                _merge_pipeline(source, {"$lte": upper}, accumulate=False, into=REBUILD_COLLECTION),
+                allowDiskUse=True
+            ))
+
+        if REBUILD_COLLECTION in db.list_collection_names():
+            db[REBUILD_COLLECTION].rename(STATS_COLLECTION, dropTarget=True)
+        else:
+            db[STATS_COLLECTION].delete_many({})
+        # Sources without a mark had no rollup rows, so until this point their
+        # readers counted the whole raw collection
+        for source, upper in new_marks.items():
+            if upper is not None:
+                db[STATE_COLLECTION].update_one({"_id": source}, {"$set": {"highWater": upper}}, upsert=True)
+        # Deletes queued before the rebuild started are already reflected
+        db[DIRTY_COLLECTION].delete_many({"_id": {"$lt": started}})
+        ensure_rollup_indexes(db)
+        return marks
+    finally:
+        _release_lease(db, owner)
+
+
+# -----------------------------------------------------------------------------
+# Deletes
+# -----------------------------------------------------------------------------
+def _day(created_at):
+    return created_at.strftime(DATE_FORMAT) if isinstance(created_at, datetime) else None
+
+
+def mark_dirty(db, source, event_id, created_at):
+    """Queue the rollup row of a deleted interaction for a recount."""
+    db[DIRTY_COLLECTION].insert_one({"source": source, "event": event_id, "date": _day(created_at)})
+
+
+def forget_events(db, event_ids):
+    """Drop the rollup rows of deleted events."""
+    db[STATS_COLLECTION].delete_many({"event": {"$in": list(event_ids)}})
+
+
+def _recount_dirty(db, marks):
+    """Recount queued (source, event, day) rows from the raw collections, up to `marks`."""
+    queued = list(db[DIRTY_COLLECTION].find({}))
+    if not queued:
+        return
+    keys = {(doc["source"], doc["event"], doc["date"]) for doc in queued}
+    for source, event_id, date in keys:
+        count_field, last_field = ROLLUP_SOURCES[source]
+        upper = marks.get(source)
+        if upper is None:
+            continue
+        match = {"event": event_id, "_id": {"$lte": upper}}
+        if date is None:
+            match["createdAt"] = None
+        else:
+            day = datetime.strptime(date, DATE_FORMAT)
+            match["createdAt"] = {"$gte": day, "$lt": day + timedelta(days=1)}
+        counted = next(db[source].aggregate([
+            {"$match": match},
+            {"$group": {"_id": None, "count": {"$sum": 1}, "last": {"$max": "$createdAt"}}},
+        ]), None)
+        db[STATS_COLLECTION].update_one(
+            {"event": event_id, "date": date},
+            {"$set": {
+                count_field: counted["count"] if counted else 0,
+                last_field: counted["last"] if counted else None,
+            }},
+            upsert=True,
+        )
+    db[DIRTY_COLLECTION].delete_many({"_id": {"$in": [doc["_id"] for doc in queued]}})
+    logger.info("rollup rows recounted", extra=kv(rows=len(keys)))
+
+
+def run_forever(db, interval=ROLLUP_INTERVAL, repair_interval=REPAIR_INTERVAL):
+    """
+    Run the incremental rollup every `interval` seconds, and repair_counters on
+    start and every `repair_interval` seconds (the `rollup` Procfile process).
+    """
+    # event_counters builds on this module
+    from event_counters import repair_counters
+
+    repaired_at = None
+    while True:
+        started = time.monotonic()
+        try:
+            marks = run_rollup(db)
+            logger.info("rollup run finished", extra=kv(
+                seconds=round(time.monotonic() - started, 3), **{source: str(mark) for source, mark in marks.items()}
+            ))
+        except Exception:
+            logger.exception("rollup run failed")
+
+        if repaired_at is None or time.monotonic() - repaired_at >= repair_interval:
+            repaired_at = started = time.monotonic()
+            try:
+                summary = repair_counters(db)
+                logger.info("counters repaired", extra=kv(
+                    seconds=round(time.monotonic() - started, 3),
+                    **{source: result["repaired"] for source, result in summary.items()},
+                    rollupMismatched=sum(result["rollupMismatched"] for result in summary.values()),
+                ))
+            except Exception:
+                logger.exception("counter repair failed")
+        time.sleep(interval)
+
+
+# -----------------------------------------------------------------------------
+# Readers
+# -----------------------------------------------------------------------------
+def _daily_rollup_query(source, event_oid):
+    count_field, last_field = ROLLUP_SOURCES[source]
+    return (
+        {"event": event_oid, count_field: {"$gt": 0}},
+        {"date": 1, count_field: 1, last_field: 1},
+    )
+
+
+def _daily_tail_pipeline(event_oid, high_water):
+    tail_match = {"event": event_oid}
+    if high_water is not None:
+        tail_match["_id"] = {"$gt": high_water}
+    return [
+        {"$match": tail_match},
+        {"$group": {
+            "_id": {"$dateToString": {"format": DATE_FORMAT, "date": "$createdAt"}},
+            "count": {"$sum": 1},
+            "last": {"$max": "$createdAt"},
+        }}
+    ]
+
+
+def _combine_daily(source, rollup_docs, tail_docs):
+    """Fold rollup rows and tail groups into (daily, undated_count, last_timestamp)."""
+    count_field, last_field = ROLLUP_SOURCES[source]
+    daily = {}
+    undated = 0
+    last = None
+
+    rows = [(doc["date"], doc[count_field], doc.get(last_field)) for doc in rollup_docs]
+    rows += [(doc["_id"], doc["count"], doc.get("last")) for doc in tail_docs]
+    for date, count, seen_at in rows:
+        if date is None:
+            undated += count
+        else:
+            daily[date] = daily.get(date, 0) + count
+        if seen_at and (last is None or seen_at > last):
+            last = seen_at
+
+    return daily, undated, last
+
+
+def get_event_daily_counts(db, source, event_oid):
+    """
+    Per-day counts for one event from the rollup, plus the un-rolled tail.
+    Returns (daily {date_str: count}, undated_count, last_timestamp).
+    """
+    rollup_docs = list(db[STATS_COLLECTION].find(*_daily_rollup_query(source, event_oid)))
+    high_water = get_high_water(db, source)
+    tail_docs = list(db[source].aggregate(_daily_tail_pipeline(event_oid, high_water)))
+    return _combine_daily(source, rollup_docs, tail_docs)
+
+
+async def get_event_daily_counts_async(adb, source, event_oid):
+    """get_event_daily_counts on a motor database; the rollup and tail reads overlap."""
+    async def read_rollup():
+        cursor = adb[STATS_COLLECTION].find(*_daily_rollup_query(source, event_oid))
+        return await cursor.to_list(None)
+
+    async def read_tail():
+        state = await adb[STATE_COLLECTION].find_one({"_id": source})
+        high_water = state["highWater"] if state else None
+        return await adb[source].aggregate(_daily_tail_pipeline(event_oid, high_water)).to_list(None)
+
+    rollup_docs, tail_docs = await asyncio.gather(read_rollup(), read_tail())
+    return _combine_daily(source, rollup_docs, tail_docs)
+
+
+def get_event_totals(db, source, since_date=None):
+    """
+    Per-event totals for `source` from the rollup plus the un-rolled tail,
+    optionally restricted to days on or after `since_date` ("YYYY-MM-DD").
+    Returns {event_id: count} for events with a positive count.
+    """
+    count_field, _ = ROLLUP_SOURCES[source]
+    match = {count_field: {"$gt": 0}}
+    if since_date is not None:
+        match["date"] = {"$gte": since_date}
+
+    totals = {}
+    for doc in db[STATS_COLLECTION].aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$event", "total": {"$sum": f"${count_field}"}}}
+    ]):
+        totals[doc["_id"]] = doc["total"]
+
+    high_water = get_high_water(db, source)
+    tail_match = {} if high_water is None else {"_id": {"$gt": high_water}}
+    tail_pipeline = [{"$match": tail_match}]
+    if since_date is not None:
+        tail_pipeline.append({"$match": {"$expr": {"$gte": [
+            {"$dateToString": {"format": DATE_FORMAT, "date": "$createdAt"}}, since_date
+        ]}}})
+    tail_pipeline.append({"$group": {"_id": "$event", "total": {"$sum": 1}}})
+    for doc in db[source].aggregate(tail_pipeline):
+        totals[doc["_id"]] = totals.get(doc["_id"], 0) + doc["total"]
+
+    return totals
+
+
+if __name__ == "__main__":
+    from logging_setup import configure_logging
+    from mongo_client import db
+
+    configure_logging(level="INFO")
+    if "--loop" in sys.argv[1:]:
+        position = sys.argv.index("--loop") + 1
+        run_forever(db, int(sys.argv[position]) if position < len(sys.argv) else ROLLUP_INTERVAL)
+    elif "--rebuild" in sys.argv[1:]:
+        marks = rebuild_rollup(db)
+        print(f"Rebuilt {STATS_COLLECTION}: {marks}")
+    else:
+        marks = run_rollup(db)
+        print(f"Rolled up {STATS_COLLECTION}: {marks}")
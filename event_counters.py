@@ -0,0 +1,112 @@
+# event_counters.py
+"""
+Denormalized per-event interaction counters.
+
+Events carry `likeCount`, `clickCount` and `orderCount`. Python writers go
+through `record_interaction` / `remove_interaction`, which pair the raw write with
+an `$inc` on the event. Rolling-window counts (weekly growth, 3-day sales) come
+from the `event_daily_stats` rollup.
+
+`repair_counters` re-derives everything in bulk from the raw collections and
+fixes any drift (e.g. writes and deletes made by other services, which cannot
+go through `remove_interaction`). The rollup process (`engagement_rollup.py
+--loop`) runs it every REPAIR_INTERVAL.
+
+Usage:
+    python event_counters.py            # verify and repair
+    python event_counters.py --verify   # only report mismatches
+"""
+import sys
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from engagement_rollup import get_event_totals, mark_dirty, rebuild_rollup
+
+# interaction collection -> counter field on events
+COUNTER_FIELDS = {
+    "likes": "likeCount",
+    "clicks": "clickCount",
+    "orders": "orderCount",
+}
+
+
+def record_interaction(db, source, doc):
+    """Insert an interaction document and bump the event's counter."""
+    doc.setdefault("createdAt", datetime.utcnow())
+    result = db[source].insert_one(doc)
+    db.events.update_one({"_id": doc["event"]}, {"$inc": {COUNTER_FIELDS[source]: 1}})
+    return result
+
+
+def remove_interaction(db, source, query):
+    """
+    Delete one interaction document, decrement the event's counter and queue
+    its rollup row for a recount.
+    """
+    doc = db[source].find_one_and_delete(query, projection={"event": 1, "createdAt": 1})
+    if doc and doc.get("event") is not None:
+        db.events.update_one(
+            {"_id": doc["event"], COUNTER_FIELDS[source]: {"$gt": 0}},
+            {"$inc": {COUNTER_FIELDS[source]: -1}}
+        )
+        mark_dirty(db, source, doc["event"], doc.get("createdAt"))
+    return doc
+
+
+def repair_counters(db, verify_only=False):
+    """
+    Recount every interaction per event and compare with the stored counters (and
+    with the daily rollup). Mismatches are fixed unless `verify_only` is set.
+    Returns {source: {"events": n, "mismatched": n, "repaired": n, "rollupMismatched": n}}.
+    """
+    summary = {}
+    rollup_stale = False
+    for source, field in COUNTER_FIELDS.items():
+        actual = {
+            doc["_id"]: doc["count"]
+            for doc in db[source].aggregate(
+                [{"$group": {"_id": "$event", "count": {"$sum": 1}}}],
+                allowDiskUse=True
+            )
+        }
+
+        operations = []
+        checked = 0
+        for event in db.events.find({}, {field: 1}):
+            checked += 1
+            expected = actual.get(event["_id"], 0)
+            if event.get(field) != expected:
+                operations.append(UpdateOne({"_id": event["_id"]}, {"$set": {field: expected}}))
+
+        repaired = 0
+        if operations and not verify_only:
+            repaired = db.events.bulk_write(operations, ordered=False).modified_count
+
+        rolled_up = get_event_totals(db, source)
+        rollup_mismatched = sum(
+            1 for event_id in set(actual) | set(rolled_up)
+            if actual.get(event_id, 0) != rolled_up.get(event_id, 0)
+        )
+        rollup_stale = rollup_stale or rollup_mismatched > 0
+
+        summary[source] = {
+            "events": checked,
+            "mismatched": len(operations),
+            "repaired": repaired,
+            "rollupMismatched": rollup_mismatched,
+        }
+
+    if rollup_stale and not verify_only:
+        rebuild_rollup(db)
+    return summary
+
+
+if __name__ == "__main__":
+    from mongo_client import db
+
+    verify_only = "--verify" in sys.argv[1:]
+    results = repair_counters(db, verify_only=verify_only)
+    for source, result in results.items():
+        print(f"{source}: {result['mismatched']} of {result['events']} event counter(s) off, "
+              f"{result['repaired']} repaired; {result['rollupMismatched']} rollup total(s) off")
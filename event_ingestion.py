@@ -0,0 +1,392 @@
+# event_ingestion.py
+"""
+Streaming event ingestion from Excel (.xlsx), CSV or Parquet exports of the
+scraped Eventbrite data.
+
+Rows are read in fixed-size chunks (openpyxl read-only mode, pandas' chunked
+CSV reader, or Parquet record batches), transformed with column operations,
+and written with bounded unordered bulk upserts keyed on the event `url`, so
+memory stays flat and re-running an import updates events instead of
+duplicating them.
+
+Expected columns:
+    event_name, description, venue, city, country, min_ticket_price, category, url
+
+Descriptive fields are overwritten on every import, and updatedAt is bumped only
+when one of them changed. Generated fields (dates, ticket counts, badges) are
+only set when the event is first inserted. Like the original import, createdAt
+is not set: scraped rows are not new announcements, and stamping them would give
+every imported event the just_announced badge. The unique index on
+`url` (db_indexes.py, after dedupe_event_urls.py) guards against duplicates.
+Each written event's term features are stored alongside (text_features), so the
+recommender does not have to tokenize the catalog again.
+
+ingest_file runs in the calling process; ingest_file_parallel hands partitions
+of rows (bucketed by url) to a process pool so transforms and bulk writes run
+side by side.
+"""
+import multiprocessing
+import os
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from text_features import store_event_features
+
+# Rows read and transformed per chunk
+CHUNK_SIZE = 10000
+# Operations per bulk_write call
+BULK_BATCH_SIZE = 1000
+
+# Server error code of a unique index violation
+DUPLICATE_KEY = 11000
+
+# All imported events share this organizer unless told otherwise
+DEFAULT_ORGANIZER_ID = ObjectId("6776985e1324874860b8ca8d")
+
+LOCATION_COLUMNS = ("venue", "city", "country")
+
+
+# -----------------------------------------------------------------------------
+# Readers
+# -----------------------------------------------------------------------------
+def _read_excel_chunks(path, chunk_size):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name).strip() if name is not None else "" for name in header]
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == chunk_size:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def _read_parquet_chunks(path, chunk_size):
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        yield batch.to_pandas()
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """Yield DataFrames of at most `chunk_size` rows from an .xlsx, .csv or .parquet file."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        yield from _read_excel_chunks(path, chunk_size)
+    elif extension == ".csv":
+        yield from pd.read_csv(path, chunksize=chunk_size)
+    elif extension == ".parquet":
+        yield from _read_parquet_chunks(path, chunk_size)
+    else:
+        raise ValueError(f"Unsupported file type '{extension}' (expected .xlsx, .csv or .parquet)")
+
+
+# -----------------------------------------------------------------------------
+# Transform
+# -----------------------------------------------------------------------------
+def get_category_map(db):
+    """{normalized category name: category _id}."""
+    return {doc["name"].lower(): doc["_id"] for doc in db.categories.find({}, {"name": 1})}
+
+
+def _text_column(df, column):
+    if column not in df:
+        return pd.Series("", index=df.index)
+    return df[column].where(df[column].notna(), "").astype(str).str.strip()
+
+
+def _join_location(df):
+    """venue, city, country joined with ", ", skipping empty parts."""
+    location = _text_column(df, LOCATION_COLUMNS[0])
+    for column in LOCATION_COLUMNS[1:]:
+        part = _text_column(df, column)
+        separator = np.where((location != "") & (part != ""), ", ", "")
+        location = location + separator + part
+    return location
+
+
+def transform_chunk(df, category_map, organizer_id=DEFAULT_ORGANIZER_ID, rng=None, now=None):
+    """
+    Turn one chunk of raw rows into `events` documents, each split into
+    (fields, insert_only_fields). Rows without a url or without a known
+    category are dropped, and so are rows whose url appears again later in
+    the chunk. Returns (documents, skipped_count).
+    """
+    rng = rng or np.random.default_rng()
+    now = now or datetime.now()
+
+    category_names = _text_column(df, "category").str.lower().str.replace("-", " ", regex=False)
+    category_ids = category_names.map(category_map)
+    urls = _text_column(df, "url")
+    # Rows repeating a url later in the chunk supersede the earlier ones
+    keep = category_ids.notna() & (urls != "") & ~urls.duplicated(keep="last")
+    skipped = int((~keep).sum())
+    df = df[keep]
+    if df.empty:
+        return [], skipped
+    category_ids = category_ids[keep]
+    urls = urls[keep]
+
+    # Prices are stored as strings of the (float) price; 0 means free
+    raw_price = df["min_ticket_price"] if "min_ticket_price" in df else pd.Series(np.nan, index=df.index)
+    price = pd.to_numeric(raw_price, errors="coerce")
+    price_str = price.astype(str).where(price.notna(), raw_price.astype(str))
+    is_free = (price == 0).tolist()
+
+    # Random schedule and ticket info, as the original import did
+    count = len(df)
+    start = (
+        pd.Timestamp(now)
+        + pd.to_timedelta(rng.integers(0, 31, count), unit="D")
+        + pd.to_timedelta(rng.integers(0, 24, count), unit="h")
+        + pd.to_timedelta(rng.integers(0, 60, count), unit="m")
+    )
+    end = start + pd.to_timedelta(rng.integers(1, 6, count), unit="h")
+    max_tickets = rng.integers(50, 201, count)
+    tickets_sold = rng.integers(0, max_tickets + 1)
+
+    descriptive = {
+        "title": _text_column(df, "event_name").tolist(),
+        "description": _text_column(df, "description").tolist(),
+        "location": _join_location(df).tolist(),
+        "imageUrl": urls.tolist(),
+        "price": price_str.tolist(),
+        "isFree": is_free,
+        "url": urls.tolist(),
+        "category": category_ids.tolist(),
+    }
+    generated = {
+        "startDateTime": list(start.to_pydatetime()),
+        "endDateTime": list(end.to_pydatetime()),
+        "maximumTickets": max_tickets.tolist(),  # ints, see migrate_ticket_fields.py
+        "ticketsSoldCount": tickets_sold.tolist(),
+    }
+
+    documents = []
+    for values, extra in zip(zip(*descriptive.values()), zip(*generated.values())):
+        fields = dict(zip(descriptive, values))
+        fields["organizer"] = organizer_id
+        documents.append((fields, dict(zip(generated, extra))))
+    return documents, skipped
+
+
+# -----------------------------------------------------------------------------
+# Write
+# -----------------------------------------------------------------------------
+def upsert_operations(documents, now=None):
+    """
+    UpdateOne upserts keyed on url, as single-stage update pipelines so the stored
+    values can be compared: updatedAt only moves when a descriptive field actually
+    changes (an unchanged re-import leaves the event untouched and is not counted
+    as updated), and insert-only fields are only filled in where they are missing.
+    """
+    now = now or datetime.utcnow()
+    operations = []
+    for fields, insert_only in documents:
+        unchanged = {"$and": [{"$eq": [f"${name}", {"$literal": value}]} for name, value in fields.items()]}
+        operations.append(UpdateOne(
+            {"url": fields["url"]},
+            [{"$set": {
+                # Evaluated against the stored document, before the fields below are set
+                "updatedAt": {"$cond": [unchanged, "$updatedAt", now]},
+                **{name: {"$literal": value} for name, value in fields.items()},
+                **{name: {"$ifNull": [f"${name}", {"$literal": value}]}
+                   for name, value in {**insert_only, "badges": []}.items()},
+            }}],
+            upsert=True
+        ))
+    return operations
+
+
+def write_documents(collection, documents, batch_size=BULK_BATCH_SIZE):
+    """
+    Unordered bulk upserts in batches of `batch_size`. Returns (inserted, updated).
+
+    Upserts that lose an insert race on the unique url index (another import
+    inserted the same url first) fail with a duplicate key error; they are
+    retried once, and then match the winner's document.
+    """
+    inserted = updated = 0
+    for start in range(0, len(documents), batch_size):
+        operations = upsert_operations(documents[start:start + batch_size])
+        try:
+            result = collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY for error in errors):
+                raise
+            inserted += e.details["nUpserted"]
+            updated += e.details["nModified"]
+            result = collection.bulk_write([operations[error["index"]] for error in errors], ordered=False)
+        inserted += result.upserted_count
+        updated += result.modified_count
+    return inserted, updated
+
+
+def write_features(db, documents, batch_size=BULK_BATCH_SIZE):
+    """Store the term features of just-written events, looking their ids up by url."""
+    for start in range(0, len(documents), batch_size):
+        batch = [fields for fields, _ in documents[start:start + batch_size]]
+        ids = {
+            doc["url"]: doc["_id"]
+            for doc in db.events.find({"url": {"$in": [fields["url"] for fields in batch]}}, {"url": 1})
+        }
+        store_event_features(db, [
+            {"_id": ids[fields["url"]], **fields} for fields in batch if fields["url"] in ids
+        ])
+
+
+def ingest_chunk(db, df, category_map, organizer_id=DEFAULT_ORGANIZER_ID, rng=None):
+    """Transform and write one chunk. Returns {"rows", "inserted", "updated", "skipped"}."""
+    documents, skipped = transform_chunk(df, category_map, organizer_id, rng)
+    inserted, updated = write_documents(db.events, documents)
+    write_features(db, documents)
+    return {"rows": len(df), "inserted": inserted, "updated": updated, "skipped": skipped}
+
+
+def ingest_file(db, path, chunk_size=CHUNK_SIZE, limit=None, organizer_id=DEFAULT_ORGANIZER_ID,
+                seed=None, progress=None):
+    """
+    Stream `path` into the events collection. `limit` stops after that many rows;
+    `progress(totals)` is called after every chunk. Returns the running totals.
+    """
+    category_map = get_category_map(db)
+    rng = np.random.default_rng(seed)
+    totals = {"rows": 0, "inserted": 0, "updated": 0, "skipped": 0}
+
+    for df in read_chunks(path, chunk_size):
+        if limit is not None:
+            df = df.iloc[:max(0, limit - totals["rows"])]
+            if df.empty:
+                break
+        for key, value in ingest_chunk(db, df, category_map, organizer_id, rng).items():
+            totals[key] += value
+        if progress is not None:
+            progress(dict(totals))
+    return totals
+
+
+# -----------------------------------------------------------------------------
+# Parallel ingestion
+# -----------------------------------------------------------------------------
+# Category map of a worker process, loaded on its first partition
+_worker_category_map = None
+
+
+def _ingest_partition(index, df, organizer_id, seed):
+    """Worker side: transform and write one partition on this process's own client."""
+    global _worker_category_map
+    from mongo_client import get_db
+
+    db = get_db()
+    if _worker_category_map is None:
+        _worker_category_map = get_category_map(db)
+    rng = np.random.default_rng(None if seed is None else (seed, index))
+    return ingest_chunk(db, df, _worker_category_map, organizer_id, rng)
+
+
+def url_buckets(df, buckets):
+    """Bucket number of every row: a stable hash of its (normalized) url."""
+    return _text_column(df, "url").map(lambda url: zlib.crc32(url.encode("utf-8")) % buckets)
+
+
+def ingest_file_parallel(path, workers=None, chunk_size=CHUNK_SIZE, limit=None,
+                         organizer_id=DEFAULT_ORGANIZER_ID, seed=None, progress=None):
+    """
+    Like ingest_file, but rows are transformed and bulk-written by a pool of
+    `workers` processes (default: one per CPU); the calling process only reads
+    the file.
+
+    Rows are spread over one bucket per worker by a hash of their url and each
+    bucket has at most one partition in flight, so two processes never upsert
+    the same url at once (which could otherwise insert it twice). Imports
+    running side by side are kept apart by the unique url index instead.
+    Buckets are submitted once they hold `chunk_size` rows, and at the end.
+
+    A failing partition does not stop the import; it is reported in
+    totals["errors"] as {"partition", "rows", "error"}. `progress(totals)` is
+    called whenever a partition finishes. Returns the final totals.
+    """
+    workers = workers or os.cpu_count() or 1
+    totals = {
+        "rows": 0, "inserted": 0, "updated": 0, "skipped": 0,
+        "submitted": 0, "completed": 0, "failed": 0, "errors": [],
+        "elapsed": 0.0, "rowsPerSecond": 0.0, "done": False,
+    }
+    started = time.monotonic()
+    pending = {}                                   # future -> (partition, rows, bucket)
+    in_flight = {}                                 # bucket -> future
+    buffers = [[] for _ in range(workers)]         # bucket -> DataFrames not yet submitted
+
+    def collect(finished):
+        for future in finished:
+            index, size, bucket = pending.pop(future)
+            del in_flight[bucket]
+            try:
+                result = future.result()
+            except Exception as e:
+                totals["failed"] += 1
+                totals["errors"].append({"partition": index, "rows": size, "error": f"{type(e).__name__}: {e}"})
+            else:
+                for key in ("rows", "inserted", "updated", "skipped"):
+                    totals[key] += result[key]
+            totals["completed"] += 1
+        totals["elapsed"] = time.monotonic() - started
+        totals["rowsPerSecond"] = totals["rows"] / totals["elapsed"] if totals["elapsed"] else 0.0
+        if progress is not None:
+            progress({**totals, "errors": list(totals["errors"])})
+
+    def submit(pool, bucket):
+        while bucket in in_flight:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+        df = pd.concat(buffers[bucket], ignore_index=True)
+        buffers[bucket] = []
+        index = totals["submitted"]
+        future = pool.submit(_ingest_partition, index, df, organizer_id, seed)
+        pending[future] = (index, len(df), bucket)
+        in_flight[bucket] = future
+        totals["submitted"] += 1
+
+    # spawn, not fork: the parent may hold a MongoClient and scheduler threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        read = 0
+        for df in read_chunks(path, chunk_size):
+            if limit is not None:
+                df = df.iloc[:max(0, limit - read)]
+                if df.empty:
+                    break
+            read += len(df)
+            for bucket, part in df.groupby(url_buckets(df, workers), sort=False):
+                buffers[bucket].append(part)
+                if sum(map(len, buffers[bucket])) >= chunk_size:
+                    submit(pool, bucket)
+        for bucket, buffered in enumerate(buffers):
+            if buffered:
+                submit(pool, bucket)
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+
+    totals["done"] = True
+    collect(())
+    return totals
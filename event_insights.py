@@ -0,0 +1,139 @@
+# event_insights.py
+import asyncio
+from datetime import datetime, timedelta
+
+from engagement_rollup import get_event_daily_counts, get_event_daily_counts_async
+
+
+def weekly_counts_pipeline(event_oid, now):
+    """
+    This-week / last-week counts for one event. Only the last 14 days of raw
+    interactions are touched, on the {event, createdAt} index.
+    """
+    this_week_start = now - timedelta(days=7)
+    last_week_start = now - timedelta(days=14)
+    return [
+        {"$match": {"event": event_oid, "createdAt": {"$gte": last_week_start}}},
+        {"$group": {
+            "_id": None,
+            "thisWeek": {"$sum": {"$cond": [{"$gte": ["$createdAt", this_week_start]}, 1, 0]}},
+            "lastWeek": {"$sum": {"$cond": [{"$lt": ["$createdAt", this_week_start]}, 1, 0]}},
+        }}
+    ]
+
+
+def weekly_growth(this_week, last_week):
+    if last_week == 0:
+        return 100 if this_week > 0 else 0
+    return round(((this_week - last_week) / last_week) * 100)
+
+
+def summarize_interactions(daily, undated, last, weekly, now):
+    """
+    Turn the rollup histogram and weekly counts into the numbers returned by the
+    insight endpoints. `daily` maps "YYYY-MM-DD" to a count.
+    """
+    weekly = weekly or {"thisWeek": 0, "lastWeek": 0}
+    daily = sorted(daily.items())
+
+    total = sum(count for _, count in daily) + undated
+    last_days_ago = (now - last).days if total > 0 and last else 0
+
+    # Peak engagement: busiest day, the most recent one on a tie
+    if daily:
+        peak_count = max(count for _, count in daily)
+        peak_day = max(day for day, count in daily if count == peak_count)
+        peak_days_ago = (now.date() - datetime.strptime(peak_day, "%Y-%m-%d").date()).days
+    else:
+        peak_count = 0
+        peak_days_ago = 0
+
+    return {
+        "total": total,
+        "lastDaysAgo": last_days_ago,
+        "thisWeek": weekly["thisWeek"],
+        "lastWeek": weekly["lastWeek"],
+        "weeklyGrowth": weekly_growth(weekly["thisWeek"], weekly["lastWeek"]),
+        "peakDaysAgo": peak_days_ago,
+        "peakCount": peak_count,
+        "daily": daily,
+    }
+
+
+def get_interaction_insights(db, source, event_oid, now):
+    """
+    Insights for one event from `source` ("likes" or "clicks"). The histogram,
+    total and last timestamp come from the event_daily_stats rollup, so serving
+    cost does not grow with raw interaction volume.
+    """
+    daily, undated, last = get_event_daily_counts(db, source, event_oid)
+    weekly = next(db[source].aggregate(weekly_counts_pipeline(event_oid, now)), None)
+    return summarize_interactions(daily, undated, last, weekly, now)
+
+
+async def get_interaction_insights_async(adb, source, event_oid, now):
+    """get_interaction_insights on a motor database, with the rollup and weekly reads in flight together."""
+    async def read_weekly():
+        docs = await adb[source].aggregate(weekly_counts_pipeline(event_oid, now)).to_list(1)
+        return docs[0] if docs else None
+
+    (daily, undated, last), weekly = await asyncio.gather(
+        get_event_daily_counts_async(adb, source, event_oid),
+        read_weekly(),
+    )
+    return summarize_interactions(daily, undated, last, weekly, now)
+
+
+def _rank_filters(event_oid, count_field, count):
+    """(higher, tied_before) filters for percentage_rank."""
+    higher = {
+        "_id": {"$ne": event_oid},
+        count_field: {"$gt": count}
+    }
+    # Events without the field sort as 0
+    tied_value = {"$in": [0, None]} if count == 0 else count
+    tied_before = {
+        "_id": {"$lt": event_oid},
+        count_field: tied_value
+    }
+    return higher, tied_before
+
+
+def _rank_percent(total_events, higher, tied_before):
+    if total_events == 0:
+        return 0
+    rank = min(higher + tied_before + 1, total_events)
+    return round((rank / total_events) * 100)
+
+
+def percentage_rank(events, event_oid, count_field, count):
+    """
+    Percentage rank of an event among all events by `count_field` (likeCount/clickCount),
+    using `count` for the event itself.
+
+    Equivalent to the old "sort every event descending and find our position": that
+    sort was stable over natural (insertion, i.e. `_id`) order, so the rank is the
+    number of other events with a higher count, plus the tied ones with a smaller
+    `_id`, plus one. Both are counted on the {count_field: -1, _id: 1} index.
+    """
+    total_events = events.estimated_document_count()
+    if total_events == 0:
+        return 0
+
+    higher, tied_before = _rank_filters(event_oid, count_field, count)
+    return _rank_percent(
+        total_events,
+        events.count_documents(higher),
+        events.count_documents(tied_before),
+    )
+
+
+async def percentage_rank_async(events, event_oid, count_field, count):
+    """percentage_rank on a motor collection; the three counts run concurrently."""
+    higher, tied_before = _rank_filters(event_oid, count_field, count)
+    total_events, higher_count, tied_count = await asyncio.gather(
+        events.estimated_document_count(),
+        events.count_documents(higher),
+        events.count_documents(tied_before),
+    )
+    return _rank_percent(total_events, higher_count, tied_count)
@@ -0,0 +1,104 @@
+# load_test.py
+"""
+Closed-loop HTTP load test for comparing the Flask and async servers.
+
+Each of `--concurrency` clients requests the given paths round-robin for
+`--duration` seconds. The report gives requests/s, requests/s per server core
+(`--cores`, i.e. the worker count the server was started with) and latency
+percentiles. Run the same command against both servers on the same box:
+
+    gunicorn -w 4 -b 127.0.0.1:8000 BACKEND:app
+    hypercorn asgi_app:app --workers 4 --bind 127.0.0.1:8001
+
+    python load_test.py --target http://127.0.0.1:8000 --target http://127.0.0.1:8001 \
+        --cores 4 --path "/recommendations?userId=<id>" --path /event_like_insights/<id>
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_load(target, paths, concurrency, duration, timeout=30):
+    """Hammer `target` and return {"requests", "errors", "latencies"}."""
+    deadline = time.monotonic() + duration
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+
+    def client(offset):
+        local = []
+        failed = 0
+        i = offset
+        while time.monotonic() < deadline:
+            url = target.rstrip("/") + paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    response.read()
+            except (urllib.error.URLError, OSError):
+                failed += 1
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+
+    return {"requests": len(latencies), "errors": errors[0], "latencies": sorted(latencies)}
+
+
+def summarize(target, result, duration, cores):
+    latencies = result["latencies"]
+    rps = result["requests"] / duration
+    return {
+        "target": target,
+        "requests": result["requests"],
+        "errors": result["errors"],
+        "rps": round(rps, 1),
+        "rpsPerCore": round(rps / cores, 1),
+        "p50Ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95Ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99Ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", required=True, help="server base URL (repeatable)")
+    parser.add_argument("--path", action="append", required=True, help="request path (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--cores", type=int, default=1, help="worker processes the server runs")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    summaries = []
+    for target in args.target:
+        result = run_load(target, args.path, args.concurrency, args.duration)
+        summaries.append(summarize(target, result, args.duration, args.cores))
+
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+        return
+    for s in summaries:
+        print(f"{s['target']}: {s['rps']} req/s ({s['rpsPerCore']} per core), "
+              f"p50 {s['p50Ms']} ms, p95 {s['p95Ms']} ms, p99 {s['p99Ms']} ms, "
+              f"{s['errors']} error(s) in {s['requests'] + s['errors']} request(s)")
+
+
+if __name__ == "__main__":
+    main()
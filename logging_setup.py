@@ -0,0 +1,117 @@
+# logging_setup.py
+"""
+Process-wide logging: a queue-backed handler, key=value structured fields and
+per-module levels.
+
+Modules log through the standard library:
+
+    import logging
+    from logging_setup import kv
+
+    logger = logging.getLogger(__name__)
+    logger.debug("recommendations scored", extra=kv(user=user_id, ms=12.5))
+
+Entry points call `configure_logging()` once. Records are put on an in-memory
+queue by the calling thread and written to stderr by a background listener, so
+request threads never block on stream I/O.
+
+Levels come from config:
+    LOG_LEVEL    root level (default "WARNING")
+    LOG_LEVELS   {"module_name": "LEVEL", ...} per-module overrides
+"""
+import atexit
+import io
+import logging
+import logging.handlers
+import queue
+import threading
+from contextlib import contextmanager
+
+import config
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def kv(**fields):
+    """`extra=` payload for structured fields: logger.info("msg", extra=kv(a=1))."""
+    return {"fields": fields}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Appends the record's structured fields as key=value pairs."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={_format_value(value)}" for key, value in fields.items())
+        return line
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return f"{value:.3f}".rstrip("0").rstrip(".")
+    text = str(value)
+    return f'"{text}"' if " " in text else text
+
+
+def configure_logging(level=None, levels=None):
+    """
+    Install the queue handler on the root logger and start its listener.
+    Safe to call more than once; later calls only update the levels.
+    """
+    global _listener
+    root_level = level or getattr(config, "LOG_LEVEL", "WARNING")
+    module_levels = levels if levels is not None else getattr(config, "LOG_LEVELS", {})
+
+    with _configure_lock:
+        root = logging.getLogger()
+        if _listener is None:
+            log_queue = queue.SimpleQueue()
+            stream_handler = logging.StreamHandler()
+            stream_handler.setFormatter(KeyValueFormatter(LOG_FORMAT))
+            _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+            _listener.start()
+            atexit.register(_listener.stop)
+            root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+        root.setLevel(root_level)
+        for name, module_level in module_levels.items():
+            logging.getLogger(name).setLevel(module_level)
+
+
+@contextmanager
+def capture_logs(*logger_names, level=logging.INFO):
+    """
+    Collect what `logger_names` log from the calling thread inside the block
+    into a StringIO (yielded). Logger levels are process-wide and shared with
+    every other thread, so they are left alone: records below a logger's own
+    level are not captured, and callers set the level they need once at
+    startup (see capture_level).
+    """
+    buffer = io.StringIO()
+    handler = logging.StreamHandler(buffer)
+    handler.setFormatter(KeyValueFormatter("%(message)s"))
+    handler.setLevel(level)
+    thread_id = threading.get_ident()
+    handler.addFilter(lambda record: record.thread == thread_id)
+
+    loggers = [logging.getLogger(name) for name in logger_names]
+    for logger in loggers:
+        logger.addHandler(handler)
+    try:
+        yield buffer
+    finally:
+        for logger in loggers:
+            logger.removeHandler(handler)
+
+
+def capture_level(*logger_names, level=logging.INFO):
+    """Lower `logger_names` to at least `level` so capture_logs sees their records; call once at startup."""
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        if logger.getEffectiveLevel() > level:
+            logger.setLevel(level)
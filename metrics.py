@@ -0,0 +1,210 @@
+# metrics.py
+"""
+Opt-in request, recommender and MongoDB timings, exposed in the Prometheus text
+format, plus an on-demand profile of a single request.
+
+Everything is off unless config.METRICS_ENABLED is true:
+- per-route latency histograms (install_flask_metrics)
+- per-phase timers in the recommender (`with phase("score"): ...`)
+- MongoDB command timings through a pymongo CommandListener, registered on the
+  shared client by mongo_client
+- GET /metrics (render_metrics)
+
+Profiling is separate: when config.PROFILE_TOKEN is set, a request carrying
+`X-Profile: <token>` is profiled (pyinstrument if installed, else cProfile) and
+the dump is written to config.PROFILE_DIR; its path comes back in the
+X-Profile-Path response header.
+
+Metrics live in process memory, so under gunicorn each worker reports its own.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+import config
+
+METRICS_ENABLED = getattr(config, "METRICS_ENABLED", False)
+PROFILE_TOKEN = getattr(config, "PROFILE_TOKEN", None)
+PROFILE_DIR = getattr(config, "PROFILE_DIR", "profiles")
+
+# Seconds; suits both millisecond Mongo commands and multi-second requests
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}    # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            base = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            prefix = base + "," if base else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            suffix = "{" + base + "}" if base else ""
+            lines.append(f"{self.name}_sum{suffix} {series[-1]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route.", ("method", "route", "status")
+)
+PHASE_SECONDS = Histogram(
+    "recommendation_phase_duration_seconds", "Time per get_recommended_event_ids phase.", ("phase",)
+)
+MONGO_SECONDS = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command round trips.", ("command", "outcome")
+)
+ALL_METRICS = (REQUEST_SECONDS, PHASE_SECONDS, MONGO_SECONDS)
+
+
+def render_metrics():
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def phase(name):
+    """Time a recommender phase (no-op unless metrics are enabled)."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_SECONDS.observe(time.perf_counter() - started, name)
+
+
+# -----------------------------------------------------------------------------
+# MongoDB command timings
+# -----------------------------------------------------------------------------
+class CommandTimer(monitoring.CommandListener):
+    """Records the duration pymongo reports for every command."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, event.command_name, "ok")
+
+    def failed(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, event.command_name, "error")
+
+
+def event_listeners():
+    """Listeners for MongoClient(event_listeners=...)."""
+    return [CommandTimer()] if METRICS_ENABLED else []
+
+
+# -----------------------------------------------------------------------------
+# Flask integration
+# -----------------------------------------------------------------------------
+class _Profiler:
+    """pyinstrument when available, cProfile otherwise."""
+
+    def __init__(self):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            import cProfile
+
+            self.kind = "cprofile"
+            self._profiler = cProfile.Profile()
+        else:
+            self.kind = "pyinstrument"
+            self._profiler = Profiler()
+
+    def start(self):
+        if self.kind == "cprofile":
+            self._profiler.enable()
+        else:
+            self._profiler.start()
+
+    def stop_and_dump(self, label):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stem = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{label}")
+        if self.kind == "cprofile":
+            self._profiler.disable()
+            path = stem + ".prof"
+            self._profiler.dump_stats(path)
+        else:
+            self._profiler.stop()
+            path = stem + ".html"
+            with open(path, "w") as fh:
+                fh.write(self._profiler.output_html())
+        return path
+
+
+def install_flask_metrics(app):
+    """Add route timing, the X-Profile hook and GET /metrics to a Flask app."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timers():
+        g.request_started = time.perf_counter()
+        if PROFILE_TOKEN and request.headers.get("X-Profile") == PROFILE_TOKEN:
+            g.profiler = _Profiler()
+            g.profiler.start()
+
+    def _profile_label():
+        return request.url_rule.endpoint if request.url_rule else "unmatched"
+
+    @app.after_request
+    def _record_timers(response):
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            response.headers["X-Profile-Path"] = profiler.stop_and_dump(_profile_label())
+        started = g.pop("request_started", None)
+        if METRICS_ENABLED and started is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route, response.status_code)
+        return response
+
+    @app.teardown_request
+    def _stop_profiler(exc):
+        # after_request is skipped when a view's exception propagates; never leave
+        # the profiler running (cProfile would keep hooking this thread)
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.stop_and_dump(_profile_label() + "-error")
+
+    if METRICS_ENABLED:
+        @app.route("/metrics", methods=["GET"])
+        def prometheus_metrics():
+            return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,38 @@
+# migrate_ticket_fields.py
+"""
+One-off migration: store `maximumTickets` and `ticketsSoldCount` as integers.
+
+Older ingestion wrote both fields as strings, which forced every limited_seats
+run to stream the catalog into Python to int() them. Values that do not parse
+are left as they are (badge jobs keep skipping them).
+
+Usage:
+    python migrate_ticket_fields.py
+"""
+TICKET_FIELDS = ("maximumTickets", "ticketsSoldCount")
+
+
+def migrate_ticket_fields(db):
+    """Convert string ticket fields to ints server-side. Returns {field: modified count}."""
+    modified = {}
+    for field in TICKET_FIELDS:
+        result = db.events.update_many(
+            {field: {"$type": "string"}},
+            [{"$set": {field: {"$convert": {
+                "input": {"$trim": {"input": f"${field}"}},
+                "to": "int",
+                "onError": f"${field}",
+            }}}}]
+        )
+        modified[field] = result.modified_count
+
+    db.events.create_index([("maximumTickets", 1), ("ticketsSoldCount", 1)])
+    return modified
+
+
+if __name__ == "__main__":
+    from mongo_client import db
+
+    modified = migrate_ticket_fields(db)
+    for field, count in modified.items():
+        print(f"Converted {count} '{field}' value(s) to integers.")
@@ -0,0 +1,121 @@
+# mongo_client.py
+"""
+Single, lazily-created MongoDB client shared by every module in a process.
+
+Modules import the `db` proxy instead of building their own MongoClient:
+
+    from mongo_client import db
+
+Nothing connects at import time. The client is created on first use and
+re-created after a fork (gunicorn workers, multiprocessing), because a
+MongoClient must never be shared across processes.
+
+The async server (asgi_app.py) uses `get_async_db()`, a motor client built
+with the same options. motor is only imported there.
+
+Pool size, timeouts, read preference and compression come from config:
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_READ_PREFERENCE, MONGO_COMPRESSORS, MONGO_APP_NAME
+"""
+import os
+import threading
+
+from pymongo import MongoClient
+
+import config
+from metrics import event_listeners
+
+_client = None
+_client_pid = None
+_async_client = None
+_async_client_pid = None
+_lock = threading.Lock()
+
+
+def client_options():
+    """MongoClient keyword arguments built from config."""
+    return {
+        "maxPoolSize": getattr(config, "MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": getattr(config, "MONGO_MIN_POOL_SIZE", 0),
+        "connectTimeoutMS": getattr(config, "MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "serverSelectionTimeoutMS": getattr(config, "MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": getattr(config, "MONGO_SOCKET_TIMEOUT_MS", 30000),
+        "readPreference": getattr(config, "MONGO_READ_PREFERENCE", "primary"),
+        "compressors": getattr(config, "MONGO_COMPRESSORS", "zlib"),
+        "appname": getattr(config, "MONGO_APP_NAME", "eventpro-backend"),
+        # Command timings for /metrics (empty unless METRICS_ENABLED)
+        "event_listeners": event_listeners(),
+    }
+
+
+def get_client():
+    """Return this process's MongoClient, creating it on first use (or after a fork)."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                _client = MongoClient(config.MONGODB_URI, **client_options())
+                _client_pid = pid
+    return _client
+
+
+def get_db():
+    """The default database from the connection string."""
+    return get_client().get_database()
+
+
+def use_client(client):
+    """Install `client` as this process's client (benchmarks point `db` at mongomock this way)."""
+    global _client, _client_pid
+    with _lock:
+        _client = client
+        _client_pid = os.getpid()
+
+
+def get_async_client():
+    """This process's motor client. Create it from inside the running event loop."""
+    global _async_client, _async_client_pid
+    pid = os.getpid()
+    if _async_client is None or _async_client_pid != pid:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        _async_client = AsyncIOMotorClient(config.MONGODB_URI, **client_options())
+        _async_client_pid = pid
+    return _async_client
+
+
+def get_async_db():
+    """The default database on the motor client."""
+    return get_async_client().get_database()
+
+
+def _reset_after_fork():
+    # The parent's clients (and the lock) must not be used in the child
+    global _client, _client_pid, _async_client, _async_client_pid, _lock
+    _client = None
+    _client_pid = None
+    _async_client = None
+    _async_client_pid = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class LazyDatabase:
+    """Stand-in for a pymongo Database that resolves the shared client on every access."""
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+    def __repr__(self):
+        return "LazyDatabase()"
+
+
+db = LazyDatabase()
@@ -0,0 +1,286 @@
+# rec_cache.py
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+
+import config
+from contentBasedRecSystem import (
+    INTERACTION_FIELDS,
+    recommend_with_categories,
+    recommend_with_categories_async,
+    recommend_batch_with_categories,
+)
+from logging_setup import kv
+from rec_model_store import get_model_store
+
+CACHE_SIZE = getattr(config, "REC_CACHE_SIZE", 10000)
+CACHE_TTL = getattr(config, "REC_CACHE_TTL_SECONDS", 900)
+
+# How often (seconds) new orders/likes/clicks are polled for invalidation
+INVALIDATION_POLL_INTERVAL = getattr(config, "REC_CACHE_POLL_SECONDS", 2)
+
+# How often (seconds) active users are re-warmed, and what counts as "active"
+WARM_INTERVAL = getattr(config, "REC_CACHE_WARM_SECONDS", 600)
+ACTIVE_USER_DAYS = getattr(config, "REC_CACHE_ACTIVE_DAYS", 7)
+
+# The cache is per process, so every worker warms its own: users are scored
+# WARM_BATCH_SIZE at a time and each worker's warm-ups are jittered so they
+# do not all run at once
+WARM_BATCH_SIZE = getattr(config, "REC_CACHE_WARM_BATCH", 256)
+WARM_JITTER = 0.2
+
+# Index key for entries without preferred categories; dropped on every catalog change
+ANY_CATEGORY = None
+
+# Invalidation stamps older than this (seconds) are pruned
+STAMP_RETENTION = 300
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationCache:
+    """
+    Per-user recommendation cache with TTL expiry and LRU eviction.
+
+    Each entry remembers the user's preferred categories so a catalog change in
+    one category only drops the users whose results could have changed. Entries
+    without categories are indexed under ANY_CATEGORY and dropped on any change.
+    Users are keyed by their canonical ObjectId string (see cache_key).
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()    # user_id -> (expires_at, top_n, ids, categories)
+        self._by_category = {}           # category -> {user_id, ...}
+        self._user_stamps = {}           # user_id -> monotonic time of last invalidation
+        self._category_stamps = {}       # category -> monotonic time of last invalidation
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # ------------------------------
+    # Lookups
+    def get(self, user_id, top_n):
+        user_id = cache_key(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] != top_n:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(user_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[2]
+
+    def get_or_compute(self, user_id, db, top_n=10):
+        """Return cached recommendations, computing and storing them on a miss."""
+        cached = self.get(user_id, top_n)
+        if cached is not None:
+            return cached
+
+        started = time.monotonic()
+        recommended_ids, categories = recommend_with_categories(user_id, db, top_n)
+        self.put(user_id, top_n, recommended_ids, categories, started)
+        return recommended_ids
+
+    async def get_or_compute_async(self, user_id, adb, store, top_n=10, executor=None):
+        """get_or_compute for the async server (see recommend_with_categories_async)."""
+        cached = self.get(user_id, top_n)
+        if cached is not None:
+            return cached
+
+        started = time.monotonic()
+        recommended_ids, categories = await recommend_with_categories_async(
+            user_id, adb, store, top_n, executor
+        )
+        self.put(user_id, top_n, recommended_ids, categories, started)
+        return recommended_ids
+
+    def put(self, user_id, top_n, recommended_ids, categories, computed_at=None):
+        """
+        Store a result. `computed_at` is when computation started; the result is
+        dropped if the user or one of its categories was invalidated since then.
+        """
+        user_id = cache_key(user_id)
+        with self._lock:
+            if computed_at is not None and self._invalidated_since(user_id, categories, computed_at):
+                return
+            self._drop(user_id)
+            self._entries[user_id] = (time.monotonic() + self.ttl, top_n, recommended_ids, categories)
+            for category in _index_keys(categories):
+                self._by_category.setdefault(category, set()).add(user_id)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def __contains__(self, user_id):
+        user_id = cache_key(user_id)
+        with self._lock:
+            return user_id in self._entries
+
+    # ------------------------------
+    # Invalidation
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return False
+        for category in _index_keys(entry[3]):
+            users = self._by_category.get(category)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._by_category[category]
+        return True
+
+    def _invalidated_since(self, user_id, categories, since):
+        if self._user_stamps.get(user_id, 0) >= since:
+            return True
+        return any(self._category_stamps.get(c, 0) >= since for c in _index_keys(categories))
+
+    def invalidate_user(self, user_id):
+        user_id = cache_key(user_id)
+        with self._lock:
+            now = time.monotonic()
+            self._user_stamps[user_id] = now
+            if len(self._user_stamps) > self.maxsize:
+                # Stamps only matter while a computation could still be in flight
+                cutoff = now - STAMP_RETENTION
+                self._user_stamps = {u: t for u, t in self._user_stamps.items() if t >= cutoff}
+            if self._drop(user_id):
+                self.invalidations += 1
+
+    def invalidate_categories(self, categories):
+        """
+        Drop every user whose preferred categories include one of `categories`,
+        plus every user cached without categories.
+        """
+        with self._lock:
+            now = time.monotonic()
+            for category in {*categories, ANY_CATEGORY}:
+                self._category_stamps[category] = now
+                for user_id in list(self._by_category.get(category, ())):
+                    if self._drop(user_id):
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_category.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttlSeconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def cache_key(user_id):
+    """Canonical form of a user id ("67D7..." and ObjectId("67d7...") share one entry)."""
+    return str(ObjectId(user_id))
+
+
+def _index_keys(categories):
+    return categories or [ANY_CATEGORY]
+
+
+# -----------------------------------------------------------------------------
+# Background invalidation + warming
+# -----------------------------------------------------------------------------
+def _latest_id(collection):
+    doc = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return doc["_id"] if doc else ObjectId.from_datetime(datetime.utcnow())
+
+
+def start_invalidation_watcher(cache, db, interval=INVALIDATION_POLL_INTERVAL):
+    """
+    Invalidate users on new orders/likes/clicks and categories on catalog changes.
+
+    Interactions are polled by `_id` high-water mark (not `createdAt`, which is
+    back-dated by the dummy data tools and missing on some writers). Catalog
+    changes come from the model store's sync listener.
+    """
+    get_model_store(db).add_listener(cache.invalidate_categories)
+    high_water = {name: _latest_id(db[name]) for name in INTERACTION_FIELDS}
+
+    def poll_loop():
+        while True:
+            time.sleep(interval)
+            for name, user_field in INTERACTION_FIELDS.items():
+                try:
+                    cursor = db[name].find(
+                        {"_id": {"$gt": high_water[name]}},
+                        {user_field: 1}
+                    ).sort("_id", 1)
+                    for doc in cursor:
+                        high_water[name] = doc["_id"]
+                        if doc.get(user_field) is not None:
+                            cache.invalidate_user(str(doc[user_field]))
+                except Exception:
+                    logger.exception("invalidation poll failed", extra=kv(collection=name))
+
+    thread = threading.Thread(target=poll_loop, name="rec-cache-invalidation", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_active_user_ids(db, days=ACTIVE_USER_DAYS):
+    """Users with any order, like or click in the last `days` days."""
+    since = datetime.utcnow() - timedelta(days=days)
+    active = set()
+    for name, user_field in INTERACTION_FIELDS.items():
+        active.update(db[name].distinct(user_field, {"createdAt": {"$gte": since}}))
+    return [str(user) for user in active if user is not None]
+
+
+def warm_cache(cache, db, top_n=10, batch_size=WARM_BATCH_SIZE):
+    """Fill the cache for active users that are not cached yet, `batch_size` users per batch pass."""
+    user_ids = [uid for uid in get_active_user_ids(db) if uid not in cache]
+    user_ids = user_ids[:cache.maxsize]
+
+    warmed = 0
+    for start in range(0, len(user_ids), batch_size):
+        started = time.monotonic()
+        results = recommend_batch_with_categories(user_ids[start:start + batch_size], db, top_n)
+        for user_id, (recommended_ids, categories) in results.items():
+            cache.put(user_id, top_n, recommended_ids, categories, started)
+        warmed += len(results)
+    return warmed
+
+
+def start_cache_warmer(cache, db, interval=WARM_INTERVAL, top_n=10):
+    """
+    Periodically warm this process's cache for active users in a daemon
+    thread, at intervals jittered by WARM_JITTER so workers started together
+    drift apart.
+    """
+    def warm_loop():
+        while True:
+            try:
+                warm_cache(cache, db, top_n)
+            except Exception:
+                logger.exception("cache warm-up failed")
+            time.sleep(interval * random.uniform(1 - WARM_JITTER, 1 + WARM_JITTER))
+
+    thread = threading.Thread(target=warm_loop, name="rec-cache-warmer", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,529 @@
+# rec_model_store.py
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfTransformer
+
+import config
+from logging_setup import kv
+from text_features import FEATURE_VERSION, event_terms, load_event_features, source_hash
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process build lock
+    fcntl = None
+
+# Where the fitted vectorizer + event term matrix are persisted between restarts
+MODEL_PATH = getattr(config, "REC_MODEL_PATH", "rec_model.pkl")
+
+# How often (seconds) the background refresher pulls catalog changes
+REFRESH_INTERVAL = getattr(config, "REC_MODEL_REFRESH_SECONDS", 60)
+
+# How often (seconds) the refresher compares every event's text instead of
+# only recently edited ones; catches writers that do not set updatedAt
+FULL_SYNC_INTERVAL = getattr(config, "REC_MODEL_FULL_SYNC_SECONDS", 3600)
+
+# Edits are re-read this far behind the newest updatedAt seen, so writers with
+# skewed clocks or slow commits are not missed; unchanged text is skipped
+EDIT_LAG = timedelta(seconds=getattr(config, "REC_MODEL_EDIT_LAG_SECONDS", 300))
+
+# Rebuild the matrix once this fraction of its rows are tombstones
+COMPACT_RATIO = 0.25
+
+# The refresher refits the vocabulary and IDF weights once the rows written
+# since the last fit reach this fraction of the rows it was fitted on, or the
+# fit is REFIT_INTERVAL old; until then new events are scored with the terms
+# and weights of the catalog as it was at fit time
+REFIT_RATIO = getattr(config, "REC_MODEL_REFIT_RATIO", 0.2)
+REFIT_INTERVAL = timedelta(seconds=getattr(config, "REC_MODEL_REFIT_SECONDS", 86400))
+
+EVENT_PROJECTION = {"title": 1, "description": 1, "category": 1}
+SYNC_PROJECTION = dict(EVENT_PROJECTION, updatedAt=1)
+
+# Vocabulary size of the TF-IDF model
+MAX_FEATURES = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class TermVectorizer:
+    """
+    TF-IDF over precomputed (terms, counts) vectors (text_features.event_terms),
+    weighted like sklearn's TfidfVectorizer: the `max_features` most frequent
+    terms, smoothed IDF, L2-normalised rows.
+    """
+
+    def __init__(self, max_features=MAX_FEATURES):
+        self.max_features = max_features
+        self.vocabulary_ = {}
+        self.transformer = TfidfTransformer()
+
+    def _counts(self, features):
+        indptr, indices, data = [0], [], []
+        vocabulary = self.vocabulary_
+        for terms, counts in features:
+            for term, count in zip(terms, counts):
+                column = vocabulary.get(term)
+                if column is not None:
+                    indices.append(column)
+                    data.append(count)
+            indptr.append(len(indices))
+        return sp.csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int32), indptr),
+            shape=(len(features), len(vocabulary)),
+        )
+
+    def fit_transform(self, features):
+        totals = Counter()
+        for terms, counts in features:
+            totals.update(dict(zip(terms, counts)))
+        # Most frequent terms, ties in alphabetical order; columns are alphabetical
+        terms = np.array(sorted(totals), dtype=object)
+        frequency = np.array([totals[term] for term in terms], dtype=np.int64)
+        kept = np.sort(np.argsort(-frequency, kind="stable")[:self.max_features])
+        self.vocabulary_ = {term: column for column, term in enumerate(terms[kept])}
+        return self.transformer.fit_transform(self._counts(features)).tocsr()
+
+    def transform(self, features):
+        return self.transformer.transform(self._counts(features)).tocsr()
+
+
+def new_vectorizer():
+    """Same TF-IDF settings the recommender has always used"""
+    return TermVectorizer(max_features=MAX_FEATURES)
+
+
+class ModelSnapshot:
+    """Read-only scoring state taken from an EventModelStore (see EventModelStore.snapshot)."""
+
+    def __init__(self, matrix, event_ids, category_values, category_codes, row_of, alive):
+        self.matrix = matrix
+        self.event_ids = event_ids
+        self.category_values = category_values
+        self.category_codes = category_codes
+        self.row_of = row_of
+        self.alive = alive
+
+
+class EventModelStore:
+    """
+    Holds the fitted TF-IDF vectorizer and the event term matrix.
+
+    The vocabulary and IDF weights are fixed when the model is built; inserted
+    or edited events are transformed with the existing vectorizer and appended,
+    and deleted/edited rows are tombstoned through the `alive` mask. The
+    refresher refits (refit_model_store) once `needs_refit` says the catalog
+    has outgrown the fit.
+
+    Rows are assembled from the term features stored when events are written
+    (text_features.load_event_features), so neither a build nor a sync
+    re-tokenizes events whose text has not changed.
+    """
+
+    def __init__(self, path=MODEL_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.vectorizer = None
+        self.matrix = None        # CSR, one row per (possibly dead) event
+        self.event_ids = []       # row -> event ObjectId
+        self.categories = []      # row -> raw category value
+        self.category_values = []                       # code -> category value
+        self.category_code = {}                         # category value -> code
+        self.category_codes = np.zeros(0, dtype=np.int32)   # row -> code (-1 = no category)
+        self.row_of = {}          # event ObjectId -> live row
+        self.alive = np.zeros(0, dtype=bool)
+        self.source_hashes = {}   # event ObjectId -> source_hash of its live row
+        self.edit_mark = None     # newest updatedAt seen by sync
+        self.synced_at = None
+        self.fitted_at = None     # when the vectorizer was fitted
+        self.fitted_rows = 0      # rows it was fitted on
+        self.rows_since_fit = 0   # rows upserted since
+        self.listeners = []       # called with the categories touched by a catalog change
+
+    def add_listener(self, callback):
+        """Register callback(categories) to run after events are upserted or removed."""
+        self.listeners.append(callback)
+
+    def _index_categories(self):
+        """Rebuild the category codes; codes follow first appearance in row order."""
+        self.category_values = list(dict.fromkeys(c for c in self.categories if c))
+        self.category_code = {c: code for code, c in enumerate(self.category_values)}
+        self.category_codes = self._codes_for(self.categories)
+
+    def _codes_for(self, categories):
+        """Codes for `categories`, registering values not seen before."""
+        codes = np.empty(len(categories), dtype=np.int32)
+        for i, category in enumerate(categories):
+            if not category:
+                codes[i] = -1
+                continue
+            code = self.category_code.get(category)
+            if code is None:
+                code = self.category_code[category] = len(self.category_values)
+                self.category_values.append(category)
+            codes[i] = code
+        return codes
+
+    def _notify(self, categories):
+        for callback in self.listeners:
+            try:
+                callback(categories)
+            except Exception:
+                logger.exception("model store listener failed")
+
+    # ------------------------------
+    # Build / persist
+    def build(self, db):
+        """Fit the vectorizer on the whole catalog's stored term features and persist it."""
+        started = datetime.utcnow()
+        events = list(db.events.find({}, SYNC_PROJECTION))
+
+        vectorizer = new_vectorizer()
+        features = load_event_features(db, events)
+        matrix = vectorizer.fit_transform(features) if features else None
+
+        with self.lock:
+            self.vectorizer = vectorizer if features else None
+            self.matrix = matrix
+            self.event_ids = [event["_id"] for event in events]
+            self.categories = [event.get('category', '') for event in events]
+            self.row_of = {eid: row for row, eid in enumerate(self.event_ids)}
+            self.alive = np.ones(len(events), dtype=bool)
+            self.source_hashes = {event["_id"]: source_hash(event) for event in events}
+            self.edit_mark = max((e["updatedAt"] for e in events if e.get("updatedAt")), default=None)
+            self._index_categories()
+            self.synced_at = started
+            self.fitted_at = started
+            self.fitted_rows = len(events)
+            self.rows_since_fit = 0
+        self.save()
+
+    def save(self):
+        """
+        Atomically write the model to `self.path`. Each writer uses its own
+        temporary file, so workers saving at the same time cannot interleave.
+        """
+        with self.lock:
+            state = {
+                "vectorizer": self.vectorizer,
+                "matrix": self.matrix,
+                "event_ids": self.event_ids,
+                "categories": self.categories,
+                "alive": self.alive,
+                "source_hashes": self.source_hashes,
+                "edit_mark": self.edit_mark,
+                "synced_at": self.synced_at,
+                "fitted_at": self.fitted_at,
+                "fitted_rows": self.fitted_rows,
+                "rows_since_fit": self.rows_since_fit,
+                "feature_version": FEATURE_VERSION,
+            }
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    pickle.dump(state, fh, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def load(self):
+        """
+        Load a persisted model. Returns False if there is none, it predates
+        FEATURE_VERSION or it cannot be read for any reason (callers rebuild).
+        """
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "rb") as fh:
+                state = pickle.load(fh)
+            if state.get("feature_version") != FEATURE_VERSION:
+                return False
+            alive = state["alive"]
+            event_ids = state["event_ids"]
+            fields = {
+                "vectorizer": state["vectorizer"],
+                "matrix": state["matrix"],
+                "event_ids": event_ids,
+                "categories": state["categories"],
+                "alive": alive,
+                "source_hashes": state["source_hashes"],
+                "edit_mark": state["edit_mark"],
+                "synced_at": state["synced_at"],
+                # Models saved before refits were tracked are due for one
+                "fitted_at": state.get("fitted_at"),
+                "fitted_rows": state.get("fitted_rows", 0),
+                "rows_since_fit": state.get("rows_since_fit", 0),
+                "row_of": {eid: row for row, eid in enumerate(event_ids) if alive[row]},
+            }
+        except Exception:
+            logger.warning("discarding unreadable model file", exc_info=True, extra=kv(path=self.path))
+            return False
+
+        with self.lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self._index_categories()
+        return True
+
+    def is_ready(self):
+        return self.vectorizer is not None and self.matrix is not None
+
+    def snapshot(self):
+        """
+        A consistent copy of the scoring state for long computations (batch
+        scoring) that should not hold the lock. Arrays that updates replace
+        are shared; those they modify in place are copied.
+        """
+        with self.lock:
+            return ModelSnapshot(
+                matrix=self.matrix,
+                event_ids=list(self.event_ids),
+                category_values=list(self.category_values),
+                category_codes=self.category_codes,
+                row_of=dict(self.row_of),
+                alive=self.alive.copy(),
+            )
+
+    def needs_refit(self, now=None):
+        """True once the rows upserted since the fit reach REFIT_RATIO of it, or the fit is REFIT_INTERVAL old."""
+        now = now or datetime.utcnow()
+        with self.lock:
+            if not self.is_ready():
+                return False
+            if self.fitted_at is None or now - self.fitted_at >= REFIT_INTERVAL:
+                return True
+            return self.rows_since_fit >= REFIT_RATIO * max(self.fitted_rows, 1)
+
+    # ------------------------------
+    # Incremental updates
+    def upsert_events(self, events, features=None):
+        """
+        Add new events / replace edited ones using the fitted vectorizer.
+        `features` are their (terms, counts), computed from the text if omitted.
+        """
+        if not events:
+            return
+        if not self.is_ready():
+            raise RuntimeError("Model store has not been built yet.")
+
+        if features is None:
+            features = [event_terms(event) for event in events]
+        new_rows = self.vectorizer.transform(features)
+        touched = {event.get('category', '') for event in events}
+        with self.lock:
+            for event in events:
+                old_row = self.row_of.pop(event["_id"], None)
+                if old_row is not None:
+                    self.alive[old_row] = False
+                    touched.add(self.categories[old_row])
+
+            start = len(self.event_ids)
+            self.matrix = sp.vstack([self.matrix, new_rows], format="csr")
+            new_categories = [event.get('category', '') for event in events]
+            for offset, event in enumerate(events):
+                self.event_ids.append(event["_id"])
+                self.row_of[event["_id"]] = start + offset
+                self.source_hashes[event["_id"]] = source_hash(event)
+            self.categories.extend(new_categories)
+            self.rows_since_fit += len(events)
+            self.category_codes = np.concatenate([self.category_codes, self._codes_for(new_categories)])
+            self.alive = np.concatenate([self.alive, np.ones(len(events), dtype=bool)])
+            self._maybe_compact()
+        self._notify(touched)
+
+    def remove_events(self, event_ids):
+        """Tombstone deleted events."""
+        touched = set()
+        with self.lock:
+            for eid in event_ids:
+                row = self.row_of.pop(eid, None)
+                self.source_hashes.pop(eid, None)
+                if row is not None:
+                    self.alive[row] = False
+                    touched.add(self.categories[row])
+            self._maybe_compact()
+        self._notify(touched)
+
+    def _maybe_compact(self):
+        dead = len(self.alive) - int(self.alive.sum())
+        if len(self.alive) and dead / len(self.alive) >= COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        """Drop tombstoned rows from the matrix."""
+        with self.lock:
+            keep = np.flatnonzero(self.alive)
+            self.matrix = self.matrix[keep]
+            self.event_ids = [self.event_ids[row] for row in keep]
+            self.categories = [self.categories[row] for row in keep]
+            self.alive = np.ones(len(keep), dtype=bool)
+            self.row_of = {eid: row for row, eid in enumerate(self.event_ids)}
+            self._index_categories()
+
+    def sync(self, db, full=False):
+        """
+        Pull catalog changes since the last sync.
+
+        Inserts and deletes are found by diffing `_id`s (an index-only read).
+        Edits are found through `updatedAt`: every writer of event text must
+        set it (event_ingestion does; the web app has to as well). Events
+        whose updatedAt is within EDIT_LAG of the newest one seen are re-read
+        and compared by source_hash, so clock skew between writers does not
+        lose edits and unchanged events are not re-upserted. `full=True`
+        compares every event's hash, which also catches edits made without
+        updatedAt. Returns (upserted, removed) counts.
+        """
+        if not self.is_ready():
+            self.build(db)
+            return len(self.event_ids), 0
+
+        started = datetime.utcnow()
+        db_ids = {doc["_id"] for doc in db.events.find({}, {"_id": 1})}
+        with self.lock:
+            known_ids = set(self.row_of)
+            hashes = dict(self.source_hashes)
+            edit_mark = self.edit_mark
+
+        removed = known_ids - db_ids
+        if full:
+            query = {}
+        elif edit_mark is not None:
+            query = {"updatedAt": {"$gte": edit_mark - EDIT_LAG}}
+        else:
+            query = {"updatedAt": {"$ne": None}}
+        changed = {}
+        for doc in db.events.find(query, SYNC_PROJECTION):
+            if doc.get("updatedAt") and (edit_mark is None or doc["updatedAt"] > edit_mark):
+                edit_mark = doc["updatedAt"]
+            if hashes.get(doc["_id"]) != source_hash(doc):
+                changed[doc["_id"]] = doc
+        inserted_ids = [eid for eid in db_ids - known_ids if eid not in changed]
+        if inserted_ids:
+            for doc in db.events.find({"_id": {"$in": inserted_ids}}, SYNC_PROJECTION):
+                changed[doc["_id"]] = doc
+
+        if removed:
+            self.remove_events(removed)
+        if changed:
+            events = list(changed.values())
+            self.upsert_events(events, load_event_features(db, events))
+        with self.lock:
+            self.synced_at = started
+            self.edit_mark = edit_mark
+        if removed or changed:
+            self.save()
+        return len(changed), len(removed)
+
+
+# -----------------------------------------------------------------------------
+# Process-wide store
+# -----------------------------------------------------------------------------
+_store = None
+_store_lock = threading.Lock()
+_refresher = None
+
+
+@contextmanager
+def _build_lock(path):
+    """Exclusive lock shared by every process using `path`, so only one builds."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def get_model_store(db):
+    """
+    Return the process-wide model store, loading it on first use. The first
+    worker to start builds the model under a file lock; the others wait and
+    load what it saved.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = EventModelStore()
+                with _build_lock(store.path):
+                    loaded = store.load()
+                    if not loaded:
+                        store.build(db)
+                if loaded:
+                    store.sync(db)
+                _store = store
+    return _store
+
+
+def use_model_store(store):
+    """Install an already built store as the process-wide one (used by the benchmarks)."""
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def refit_model_store(store, db):
+    """
+    Refit `store` on the current catalog. Processes share the model file: the
+    first to take the build lock fits and saves, the others load its result.
+    Every cached recommendation is invalidated through the store's listeners.
+    """
+    fitted_at = store.fitted_at
+    with _build_lock(store.path):
+        refitted_elsewhere = store.load() and store.fitted_at != fitted_at and not store.needs_refit()
+        if not refitted_elsewhere:
+            store.build(db)
+    logger.info("model store refitted", extra=kv(
+        events=len(store.row_of), loaded=refitted_elsewhere
+    ))
+    store._notify(set(store.category_values))
+
+
+def start_model_refresher(db, interval=REFRESH_INTERVAL):
+    """Start a daemon thread that keeps the model store in sync with the catalog and refits it when due."""
+    global _refresher
+    if _refresher is not None:
+        return _refresher
+
+    def refresh_loop():
+        last_full = time.monotonic()
+        while True:
+            time.sleep(interval)
+            full = time.monotonic() - last_full >= FULL_SYNC_INTERVAL
+            try:
+                store = get_model_store(db)
+                if store.needs_refit():
+                    refit_model_store(store, db)
+                else:
+                    store.sync(db, full=full)
+            except Exception:
+                logger.exception("model store refresh failed")
+            else:
+                if full:
+                    last_full = time.monotonic()
+
+    _refresher = threading.Thread(target=refresh_loop, name="rec-model-refresher", daemon=True)
+    _refresher.start()
+    return _refresher
+
+
+if __name__ == "__main__":
+    from mongo_client import db
+
+    store = EventModelStore()
+    store.build(db)
+    print(f"Built recommendation model with {len(store.event_ids)} events -> {store.path}")
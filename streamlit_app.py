@@ -1,6 +1,5 @@
 import streamlit as st
-import io
-import sys
+import logging
 import uuid
 from datetime import datetime
 from functools import partial
@@ -8,9 +7,10 @@ from functools import partial
 # APScheduler for background scheduling
 from apscheduler.schedulers.background import BackgroundScheduler
 
+from logging_setup import configure_logging, capture_logs, capture_level, kv
+
 # MongoDB
-from pymongo import MongoClient
-import config
+from db_indexes import ensure_indexes
 
 from streamlit_rec import main as recommended_events_main
 
@@ -20,20 +20,29 @@ from delete_outdated_events import main as delete_outdated_events_main, delete_o
 
 from add_dummy_interactions import main as add_dummy_interactions_main
 
+from event_counters import COUNTER_FIELDS, repair_counters
+
+from streamlit_event_uploader import main as upload_events_main
+
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
-# Connect to MongoDB
-mongodb_uri = config.MONGODB_URI
-client = MongoClient(mongodb_uri)
-db = client.get_database()
+# Loggers whose INFO output the badge panel shows; levels are set once here,
+# not per run, since every session's script thread shares them
+BADGE_LOGGERS = ("badge_functions", "badge_engine", __name__)
+capture_level(*BADGE_LOGGERS)
 
-# Import your badge update functions
-from badge_functions import (
-    update_top_rated_badges,
-    update_popular_choice_badges,
-    update_just_announced_badges,
-    update_limited_seats_badges,
-    update_fast_selling_badges,
-)
+# Connect to MongoDB (one shared client for every panel)
+from mongo_client import db
+
+# Streamlit reruns this script on every interaction; only ensure indexes once per session
+if "indexes_ensured" not in st.session_state:
+    ensure_indexes(db)
+    st.session_state.indexes_ensured = True
+
+# Badge engine: evaluates all selected badges in a single pass
+from badge_engine import run_badge_rules
 
 # Import your recommendation function
 from contentBasedRecSystem import get_recommended_event_ids
@@ -61,34 +70,29 @@ for key in checkbox_keys:
 # 3. Functions for Badge Updates 
 # -----------------------------------------------------------------------------
 def run_selected_badges(top_rated, popular_choice, just_announced, limited_seats, fast_selling):
-    """Runs whichever badge-update functions correspond to the user’s selections."""
-    if top_rated:
-        update_top_rated_badges()
-    if popular_choice:
-        update_popular_choice_badges()
-    if just_announced:
-        update_just_announced_badges()
-    if limited_seats:
-        update_limited_seats_badges()
-    if fast_selling:
-        update_fast_selling_badges()
+    """Runs the selected badge rules together (see badge_engine): one bulk write."""
+    selected = {
+        "top_rated": top_rated,
+        "popular_choice": popular_choice,
+        "just_announced": just_announced,
+        "limited_seats": limited_seats,
+        "fast_selling": fast_selling,
+    }
+    return run_badge_rules([name for name, enabled in selected.items() if enabled])
 
 def run_and_capture_output():
     """Captures console output from running selected badge updates."""
-    buffer = io.StringIO()
-    old_stdout = sys.stdout
-    sys.stdout = buffer
-    try:
-        run_selected_badges(
-            st.session_state["top_rated"],
-            st.session_state["popular_choice"],
-            st.session_state["just_announced"],
-            st.session_state["limited_seats"],
-            st.session_state["fast_selling"],
-        )
-    except Exception as e:
-        print("Error during update:", e)
-    sys.stdout = old_stdout
+    with capture_logs(*BADGE_LOGGERS) as buffer:
+        try:
+            run_selected_badges(
+                st.session_state["top_rated"],
+                st.session_state["popular_choice"],
+                st.session_state["just_announced"],
+                st.session_state["limited_seats"],
+                st.session_state["fast_selling"],
+            )
+        except Exception as e:
+            logger.error("badge update failed", extra=kv(error=e))
     return buffer.getvalue()
 
 def clear_checkboxes():
@@ -305,7 +309,7 @@ elif st.session_state.selected_panel == "Delete Outdated Events":
             try:
                 delete_outdated_events()
             except Exception as e:
-                print(f"[Scheduler] Deletion error: {e}")
+                logger.exception("scheduled deletion failed")
 
         st.session_state.scheduler.add_job(
             func=job_func,
@@ -323,7 +327,7 @@ elif st.session_state.selected_panel == "Delete Outdated Events":
         st.success(f"Scheduled deletion every {selected_interval.lower()}.")
 
 elif st.session_state.selected_panel == "Upload Events From Excel":
-    from streamlit_event_uploader import *  # This runs the uploader app
+    upload_events_main()
 
 elif st.session_state.selected_panel == "Add Dummy Event Data":
     add_dummy_interactions_main()
@@ -372,6 +376,9 @@ else:
                 for c in st.session_state.selected_collections_for_deletion:
                     db[c].delete_many({})
                     st.warning(f"Cleared all documents from `{c}` collection.")
+                if set(st.session_state.selected_collections_for_deletion) & set(COUNTER_FIELDS):
+                    # Zero the event counters and rebuild the rollup for the cleared interactions
+                    repair_counters(db)
                 st.session_state.confirmation_pending = False
                 st.session_state.selected_collections_for_deletion = []
         with col_cancel:
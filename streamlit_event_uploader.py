@@ -0,0 +1,157 @@
+# streamlit_event_uploader.py
+"""
+"Upload Events From Excel" panel of the admin app.
+
+The uploaded file is saved to a temporary path and imported in the background
+with event_ingestion.ingest_file_parallel: a thread reads the file and a pool
+of worker processes transforms and bulk-writes the partitions. The job lives in
+st.session_state, so the rest of the admin app stays usable while it runs and
+the panel just polls its progress.
+"""
+import logging
+import os
+import tempfile
+import threading
+
+import pandas as pd
+import streamlit as st
+from bson.objectid import ObjectId
+
+import config
+from event_ingestion import CHUNK_SIZE, DEFAULT_ORGANIZER_ID, ingest_file_parallel
+from logging_setup import kv
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = getattr(config, "INGEST_WORKERS", None) or os.cpu_count() or 1
+# Seconds between progress refreshes while an import is running
+REFRESH_SECONDS = 1
+# st.fragment (Streamlit >= 1.37) reruns only the progress panel on a timer;
+# older versions fall back to a refresh button
+fragment = getattr(st, "fragment", None)
+
+
+class UploadJob:
+    """One background import; `totals` is replaced by each progress callback."""
+
+    def __init__(self, path, name, workers, chunk_size, organizer_id):
+        self.path = path
+        self.name = name
+        self.workers = workers
+        self.totals = {"rows": 0, "submitted": 0, "completed": 0, "failed": 0, "errors": [], "done": False}
+        self.error = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, args=(chunk_size, organizer_id), name="event-upload", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.totals)
+
+    def _report(self, totals):
+        with self._lock:
+            self.totals = totals
+
+    def _run(self, chunk_size, organizer_id):
+        try:
+            totals = ingest_file_parallel(
+                self.path, workers=self.workers, chunk_size=chunk_size,
+                organizer_id=organizer_id, progress=self._report,
+            )
+            logger.info("event upload finished", extra=kv(
+                file=self.name, rows=totals["rows"], inserted=totals["inserted"],
+                updated=totals["updated"], failed=totals["failed"],
+            ))
+        except Exception as e:
+            # Reading the file itself failed; partition errors are in totals
+            logger.exception("event upload failed", extra=kv(file=self.name))
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            os.unlink(self.path)
+
+
+def _save_upload(uploaded_file):
+    suffix = os.path.splitext(uploaded_file.name)[1].lower()
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as fh:
+        fh.write(uploaded_file.getbuffer())
+        return fh.name
+
+
+def _show_progress(job):
+    totals = job.snapshot()
+    submitted = totals["submitted"]
+    finished = totals["done"] or job.error is not None
+    if finished:
+        st.progress(1.0)
+    else:
+        # The total row count is unknown until the reader reaches the end
+        st.progress(totals["completed"] / submitted if submitted else 0.0,
+                    text=f"{totals['completed']} / {submitted} partition(s) written")
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Rows", totals["rows"])
+    col2.metric("Inserted", totals.get("inserted", 0))
+    col3.metric("Updated", totals.get("updated", 0))
+    col4.metric("Rows/s", f"{totals.get('rowsPerSecond', 0.0):,.0f}")
+    st.caption(f"{totals.get('skipped', 0)} row(s) skipped (no url or unknown category), "
+               f"{totals.get('elapsed', 0.0):.1f}s elapsed, {job.workers} worker(s)")
+
+    if totals["errors"]:
+        st.error(f"{totals['failed']} partition(s) failed")
+        st.dataframe(pd.DataFrame(totals["errors"]), hide_index=True)
+    if job.error:
+        st.error(f"Import of {job.name} stopped: {job.error}")
+    elif totals["done"]:
+        st.success(f"Finished importing {job.name}.")
+    return finished
+
+
+def _progress_panel():
+    job = st.session_state.get("upload_job")
+    if job is None:
+        return
+    st.subheader(f"Importing {job.name}")
+    if _show_progress(job) or fragment is not None:
+        return
+    if st.button("Refresh progress"):
+        st.rerun()
+
+
+if fragment is not None:
+    _progress_panel = fragment(run_every=REFRESH_SECONDS)(_progress_panel)
+
+
+def main():
+    st.title("Upload Events")
+    st.write("Import scraped events from an .xlsx, .csv or .parquet file. "
+             "Events are matched on their url, so uploading the same file again updates them.")
+
+    job = st.session_state.get("upload_job")
+    busy = job is not None and job.running
+
+    uploaded_file = st.file_uploader("Events file", type=["xlsx", "csv", "parquet"], disabled=busy)
+    col1, col2 = st.columns(2)
+    workers = col1.number_input("Worker processes", min_value=1, max_value=32, value=min(INGEST_WORKERS, 32), step=1)
+    chunk_size = col2.number_input("Rows per partition", min_value=100, value=CHUNK_SIZE, step=1000)
+    organizer = st.text_input("Organizer id", value=str(DEFAULT_ORGANIZER_ID))
+
+    if st.button("Start import", disabled=busy or uploaded_file is None):
+        if not ObjectId.is_valid(organizer):
+            st.error("Organizer id must be a 24-character hex ObjectId.")
+        else:
+            job = UploadJob(_save_upload(uploaded_file), uploaded_file.name,
+                            int(workers), int(chunk_size), ObjectId(organizer))
+            job.start()
+            st.session_state.upload_job = job
+
+    if busy:
+        st.info("An import is running. You can switch panels; it keeps going in the background.")
+    _progress_panel()
@@ -1,14 +1,11 @@
 import streamlit as st
-import pymongo
 from bson.objectid import ObjectId
 from contentBasedRecSystem import get_recommended_event_ids  # Importing the recommendation system
-import config
+from event_counters import record_interaction
 import uuid
 
-# MongoDB Atlas connection string
-mongodb_uri = config.MONGODB_URI
-client = pymongo.MongoClient(mongodb_uri)
-db = client.get_database()
+# Shared MongoDB connection
+from mongo_client import db
 
 # Hardcoded user ID
 USER_ID = "67d70380dfb519abd0a2da92"
@@ -32,11 +29,11 @@ def get_purchased_events():
     return [db.events.find_one({"_id": event["event"]}) for event in purchased_events]
 
 def like_event(event_id):
-    db.likes.insert_one({"liker": ObjectId(USER_ID), "event": ObjectId(event_id)})
+    record_interaction(db, "likes", {"liker": ObjectId(USER_ID), "event": ObjectId(event_id)})
 
 def make_order(event_id, total_amount="0"):  # Default amount set to 0 for free events
     stripe_id = str(uuid.uuid4())  # Generate a unique stripeId
-    db.orders.insert_one({
+    record_interaction(db, "orders", {
         "buyer": ObjectId(USER_ID),
         "event": ObjectId(event_id),
         "totalAmount": total_amount,
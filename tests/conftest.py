@@ -0,0 +1,61 @@
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# config.py holds deployment settings and is not committed; every other setting
+# has a getattr default, so a test database URI is all the modules need
+try:
+    import config  # noqa: F401
+except ImportError:
+    config = types.ModuleType("config")
+    config.MONGODB_URI = "mongodb://localhost:27017/eventpro_test"
+    sys.modules["config"] = config
+
+
+@pytest.fixture
+def mock_db():
+    """An empty in-memory database (mongomock)."""
+    mongomock = pytest.importorskip("mongomock")
+    return mongomock.MongoClient().eventpro_test
+
+
+# (category, title, description) of the catalog behind `model_store`
+CATALOG = [
+    ("jazz", "Late night jazz", "Jazz quartet with saxophone and piano"),
+    ("jazz", "Jazz brunch", "Jazz piano trio over brunch"),
+    ("jazz", "Big band jazz", "Swing jazz big band with saxophone"),
+    ("jazz", "Harp recital", "Solo harp evening"),
+    ("sports", "City marathon", "Run the marathon through the city"),
+    ("sports", "Trail run", "Morning trail run in the hills"),
+    ("", "Uncategorized meetup", "Jazz and saxophone fans meetup"),
+]
+
+
+@pytest.fixture
+def model_store():
+    """A fitted EventModelStore over CATALOG, installed as the process-wide store."""
+    import numpy as np
+    from bson.objectid import ObjectId
+
+    from rec_model_store import EventModelStore, new_vectorizer, use_model_store
+    from text_features import event_terms
+
+    events = [
+        {"_id": ObjectId(), "category": category, "title": title, "description": description}
+        for category, title, description in CATALOG
+    ]
+    store = EventModelStore(path=None)
+    store.vectorizer = new_vectorizer()
+    store.matrix = store.vectorizer.fit_transform([event_terms(event) for event in events])
+    store.event_ids = [event["_id"] for event in events]
+    store.categories = [event["category"] for event in events]
+    store.row_of = {event_id: row for row, event_id in enumerate(store.event_ids)}
+    store.alive = np.ones(len(events), dtype=bool)
+    store._index_categories()
+    use_model_store(store)
+    return store
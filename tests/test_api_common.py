@@ -0,0 +1,49 @@
+import json
+
+import pytest
+from bson.objectid import ObjectId
+from flask import Flask, Response
+from werkzeug.datastructures import MultiDict
+
+from api_common import (
+    MAX_PAGE_LIMIT, NDJSON_MIMETYPE, RequestError, json_array_chunks, page_response, parse_collection_args,
+)
+
+
+def test_parse_collection_args():
+    after = ObjectId()
+    query, projection, limit, ndjson = parse_collection_args(
+        MultiDict({"after": str(after), "fields": "title, ,likeCount", "limit": "20", "format": "ndjson"})
+    )
+    assert query == {"_id": {"$gt": after}}
+    assert projection == {"title": 1, "likeCount": 1}
+    assert limit == 20
+    assert ndjson is True
+    assert parse_collection_args(MultiDict()) == ({}, None, None, False)
+
+
+@pytest.mark.parametrize("args", [
+    {"after": "not-an-id"},
+    {"limit": "0"},
+    {"limit": str(MAX_PAGE_LIMIT + 1)},
+])
+def test_parse_collection_args_rejects(args):
+    with pytest.raises(RequestError):
+        parse_collection_args(MultiDict(args))
+
+
+def test_page_response_sets_next_cursor_on_full_pages():
+    page = [{"_id": ObjectId()}, {"_id": ObjectId()}]
+    with Flask(__name__).app_context():
+        full = page_response(Response, page, 2, ndjson=True)
+        partial = page_response(Response, page, 5, ndjson=False)
+    assert full.mimetype == NDJSON_MIMETYPE
+    assert len(full.get_data(as_text=True).splitlines()) == 2
+    assert full.headers["X-Next-After"] == str(page[-1]["_id"])
+    assert "X-Next-After" not in partial.headers
+    assert len(json.loads(partial.get_data(as_text=True))) == 2
+
+
+def test_json_array_chunks():
+    assert "".join(json_array_chunks([])) == "[]"
+    assert json.loads("".join(json_array_chunks([{"a": 1}, {"a": 2}]))) == [{"a": 1}, {"a": 2}]
@@ -0,0 +1,90 @@
+import random
+
+from bson.objectid import ObjectId
+
+from badge_engine import top_liked
+from badge_worker import BadgeWorker, RankedCounter
+
+
+def expected_winners(counts):
+    """Top 10% (at least one) by count desc, then _id, as badge_engine ranks."""
+    ranked = sorted((item for item in counts.items() if item[1] > 0), key=lambda item: (-item[1], item[0]))
+    return {event_id for event_id, _ in ranked[:max(1, len(ranked) // 10)]} if ranked else set()
+
+
+def test_ranked_counter_tracks_the_top_tenth():
+    rng = random.Random(5)
+    ids = sorted(ObjectId() for _ in range(60))
+    counts = {event_id: rng.randint(0, 4) for event_id in ids}
+    counter = RankedCounter(counts)
+    assert counter.winners == expected_winners(counts)
+
+    for _ in range(2000):
+        event_id = rng.choice(ids)
+        before = set(counter.winners)
+        counts[event_id] = max(0, counts[event_id] + rng.choice((-1, 1, 1, 2)))
+        flipped = counter.set(event_id, counts[event_id])
+        assert counter.winners == expected_winners(counts)
+        assert flipped == before ^ counter.winners
+
+
+def test_ranked_counter_matches_engine_source(mock_db):
+    rng = random.Random(3)
+    mock_db.events.insert_many([{"_id": ObjectId(), "likeCount": rng.randint(0, 20)} for _ in range(45)])
+    worker = BadgeWorker(mock_db)
+    worker.load_counters()
+    assert worker.ranked["likeCount"].winners == set(top_liked(mock_db))
+
+
+def make_worker():
+    ids = sorted(ObjectId() for _ in range(20))
+    worker = BadgeWorker(db=None)
+    worker.ranked["likeCount"] = RankedCounter({event_id: 10 + i for i, event_id in enumerate(ids)})
+    return worker, ids
+
+
+def update(event_id, fields, removed=()):
+    return {
+        "operationType": "update", "ns": {"coll": "events"}, "documentKey": {"_id": event_id},
+        "updateDescription": {"updatedFields": fields, "removedFields": list(removed)},
+    }
+
+
+def test_likes_below_the_threshold_write_nothing():
+    worker, ids = make_worker()
+    # Two winners: ids[19] (29) and ids[18] (28)
+    worker.handle_change(update(ids[0], {"likeCount": 11}))
+    worker.handle_change(update(ids[19], {"likeCount": 30}))
+    assert worker.ranked_changes() == ({}, {})
+    assert worker.dirty == set()
+
+
+def test_crossing_the_threshold_swaps_one_holder():
+    worker, ids = make_worker()
+    worker.handle_change(update(ids[0], {"likeCount": 29}))
+    assert worker.ranked_changes() == ({ids[0]: ["top_rated"]}, {ids[18]: ["top_rated"]})
+    assert worker.ranked_changes() == ({}, {})
+
+
+def test_field_changes_mark_only_the_badges_they_affect():
+    worker, ids = make_worker()
+    worker.handle_change(update(ids[0], {"title": "Renamed", "badges": ["top_rated"]}))
+    assert worker.dirty == set()
+    worker.handle_change(update(ids[0], {"ticketsSoldCount": 40}))
+    assert worker.dirty == {"limited_seats"}
+    worker.handle_change({"operationType": "insert", "ns": {"coll": "orders"}, "documentKey": {"_id": ObjectId()}})
+    assert worker.dirty == {"limited_seats", "fast_selling"}
+
+
+def test_new_and_deleted_events():
+    worker, ids = make_worker()
+    new_id = ObjectId()
+    worker.handle_change({
+        "operationType": "insert", "ns": {"coll": "events"}, "documentKey": {"_id": new_id},
+        "fullDocument": {"_id": new_id, "likeCount": 100},
+    })
+    assert worker.dirty == {"just_announced", "limited_seats", "fast_selling"}
+    assert worker.ranked_changes() == ({new_id: ["top_rated"]}, {ids[18]: ["top_rated"]})
+
+    worker.handle_change({"operationType": "delete", "ns": {"coll": "events"}, "documentKey": {"_id": new_id}})
+    assert worker.ranked_changes() == ({ids[18]: ["top_rated"]}, {new_id: ["top_rated"]})
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+
+from badge_engine import (
+    LIMITED_SEATS_FULL_MATCH, _load_badges, fast_selling_rule, recently_created, top_clicked, top_liked,
+    top_rated_rule,
+)
+
+
+def test_top_by_counter_takes_top_tenth(mock_db):
+    ids = sorted(ObjectId() for _ in range(25))
+    mock_db.events.insert_many(
+        [{"_id": event_id, "likeCount": 3} for event_id in ids[:20]]
+        + [{"_id": ids[20], "likeCount": 9}, {"_id": ids[21], "likeCount": 0}]
+        + [{"_id": event_id} for event_id in ids[22:]]
+    )
+    # 21 liked events -> 2 winners; ties broken by _id
+    assert top_liked(mock_db) == [ids[20], ids[0]]
+    assert top_clicked(mock_db) is None
+
+
+def test_recently_created(mock_db):
+    now = datetime.utcnow()
+    fresh, old = ObjectId(), ObjectId()
+    mock_db.events.insert_many([
+        {"_id": fresh, "createdAt": now - timedelta(days=1)},
+        {"_id": old, "createdAt": now - timedelta(days=4)},
+        {"_id": ObjectId()},
+    ])
+    assert recently_created(mock_db) == [fresh]
+
+
+def test_load_badges_reads_holders_and_winners(mock_db):
+    holder, winner, other = ObjectId(), ObjectId(), ObjectId()
+    mock_db.events.insert_many([
+        {"_id": holder, "badges": ["top_rated", "limited_seats"]},
+        {"_id": winner},
+        {"_id": other, "badges": ["limited_seats"]},
+    ])
+    assert _load_badges(mock_db, ["top_rated"], [winner]) == {holder: ["top_rated", "limited_seats"], winner: []}
+
+
+def test_rules():
+    ids = [ObjectId() for _ in range(3)]
+    assert top_rated_rule([], {"top_liked": None}) is None
+    assert top_rated_rule([], {"top_liked": ids[:2]}) == (set(ids[:2]), None)
+    ranked = [{"_id": ids[0], "isTop": True}, {"_id": ids[1], "isTop": False}]
+    assert fast_selling_rule([], {"fast_selling_ranking": ranked}) == ({ids[0]}, set(ids[:2]))
+    assert fast_selling_rule([], {"fast_selling_ranking": []}) is None
+
+
+
+def test_limited_seats_full_match_keeps_candidates_and_holders(mock_db):
+    ids = sorted(ObjectId() for _ in range(6))
+    mock_db.events.insert_many([
+        {"_id": ids[0], "maximumTickets": 100},
+        {"_id": ids[1], "maximumTickets": " 80 "},
+        {"_id": ids[2], "maximumTickets": 0, "badges": ["limited_seats"]},
+        {"_id": ids[3], "maximumTickets": 0},
+        {"_id": ids[4]},
+        {"_id": ids[5], "maximumTickets": None, "badges": ["top_rated"]},
+    ])
+    matched = [event["_id"] for event in mock_db.events.find(LIMITED_SEATS_FULL_MATCH).sort("_id", 1)]
+    assert matched == ids[:3]
@@ -0,0 +1,41 @@
+from bson.objectid import ObjectId
+
+from db_indexes import ensure_indexes
+from dedupe_event_urls import ensure_unique_url_index, merge_events
+from text_features import FEATURES_COLLECTION
+
+
+def test_merge_events_moves_interactions_and_counters(mock_db):
+    keep, extra = ObjectId(), ObjectId()
+    mock_db.events.insert_many([
+        {"_id": keep, "url": "https://example.com/a", "likeCount": 2, "orderCount": 1},
+        {"_id": extra, "url": "https://example.com/a", "likeCount": 1, "clickCount": 4, "orderCount": 2},
+    ])
+    mock_db.likes.insert_one({"event": extra})
+    mock_db.orders.insert_many([{"event": keep}, {"event": extra}, {"event": extra}])
+    mock_db[FEATURES_COLLECTION].insert_many([{"_id": keep}, {"_id": extra}])
+
+    merge_events(mock_db, keep, [extra])
+
+    event, = mock_db.events.find()
+    assert event["_id"] == keep
+    assert event["likeCount"] == 3
+    assert event["clickCount"] == 4
+    assert event["orderCount"] == 3
+    assert mock_db.likes.find_one()["event"] == keep
+    assert mock_db.orders.distinct("event") == [keep]
+    assert [doc["_id"] for doc in mock_db[FEATURES_COLLECTION].find()] == [keep]
+
+
+def test_ensure_unique_url_index_replaces_plain_index(mock_db):
+    mock_db.events.create_index([("url", 1)], name="url_1")
+    ensure_unique_url_index(mock_db)
+    indexes = {index["name"]: index for index in mock_db.events.list_indexes()}
+    assert indexes["url_1"].get("unique")
+
+
+def test_startup_survives_duplicate_urls(mock_db):
+    mock_db.events.insert_many([{"url": "https://example.com/a"}, {"url": "https://example.com/a"}])
+    created = ensure_indexes(mock_db)
+    assert "url_1" not in created["events"]
+    assert "badges_1" in created["events"]
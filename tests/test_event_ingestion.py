@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from bson.objectid import ObjectId
+
+from event_ingestion import transform_chunk, url_buckets
+
+CATEGORIES = {"live music": ObjectId(), "sports": ObjectId()}
+NOW = datetime(2025, 3, 10, 12, 0)
+
+
+def transform(rows, seed=1):
+    return transform_chunk(pd.DataFrame(rows), CATEGORIES, rng=np.random.default_rng(seed), now=NOW)
+
+
+def test_transform_chunk_fields():
+    documents, skipped = transform([{
+        "url": " https://example.com/a ", "category": "Live-Music", "event_name": "Gig",
+        "description": None, "min_ticket_price": 12.5,
+        "venue": "Hall", "city": "", "country": "NL",
+    }])
+    assert skipped == 0
+    (fields, insert_only), = documents
+    assert fields["url"] == fields["imageUrl"] == "https://example.com/a"
+    assert fields["category"] == CATEGORIES["live music"]
+    assert fields["title"] == "Gig"
+    assert fields["description"] == ""
+    assert fields["location"] == "Hall, NL"
+    assert fields["price"] == "12.5"
+    assert fields["isFree"] is False
+    assert "createdAt" not in fields and "createdAt" not in insert_only
+    assert NOW <= insert_only["startDateTime"] < insert_only["endDateTime"]
+    assert 0 <= insert_only["ticketsSoldCount"] <= insert_only["maximumTickets"] <= 200
+    assert isinstance(insert_only["maximumTickets"], int)
+
+
+def test_transform_chunk_skips_and_dedupes():
+    documents, skipped = transform([
+        {"url": "https://example.com/a", "category": "sports", "event_name": "First", "min_ticket_price": 0},
+        {"url": "", "category": "sports", "event_name": "No url", "min_ticket_price": 0},
+        {"url": "https://example.com/b", "category": "chess", "event_name": "Unknown category", "min_ticket_price": 0},
+        {"url": "https://example.com/a", "category": "sports", "event_name": "Second", "min_ticket_price": 0},
+    ])
+    assert skipped == 3
+    (fields, _), = documents
+    # The last row for a url wins
+    assert fields["title"] == "Second"
+    assert fields["price"] == "0"
+    assert fields["isFree"] is True
+
+
+def test_transform_chunk_is_reproducible_with_a_seed():
+    rows = [{"url": f"https://example.com/{i}", "category": "sports"} for i in range(5)]
+    assert transform(rows, seed=3) == transform(rows, seed=3)
+
+
+def test_url_buckets_keep_a_url_in_one_bucket():
+    df = pd.DataFrame({"url": [f"https://example.com/{i % 7}" for i in range(50)]})
+    buckets = url_buckets(df, 4)
+    for url, group in df.groupby("url"):
+        assert len(set(buckets[group.index])) == 1
+    assert set(buckets) <= set(range(4))
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+from event_insights import percentage_rank, summarize_interactions, weekly_growth
+
+NOW = datetime(2025, 3, 10, 12, 0)
+
+
+def test_summarize_interactions():
+    daily = {"2025-03-08": 4, "2025-03-01": 2, "2025-03-05": 4}
+    summary = summarize_interactions(daily, 3, datetime(2025, 3, 8, 18, 0), {"thisWeek": 8, "lastWeek": 2}, NOW)
+    assert summary == {
+        "total": 13,
+        "lastDaysAgo": 1,
+        "thisWeek": 8,
+        "lastWeek": 2,
+        "weeklyGrowth": 300,
+        # Peak tie goes to the most recent day
+        "peakDaysAgo": 2,
+        "peakCount": 4,
+        "daily": [("2025-03-01", 2), ("2025-03-05", 4), ("2025-03-08", 4)],
+    }
+
+
+def test_summarize_without_interactions():
+    summary = summarize_interactions({}, 0, None, None, NOW)
+    assert summary["total"] == 0
+    assert summary["lastDaysAgo"] == 0
+    assert summary["peakDaysAgo"] == 0
+    assert summary["peakCount"] == 0
+    assert summary["weeklyGrowth"] == 0
+    assert summary["daily"] == []
+
+
+def test_weekly_growth():
+    assert weekly_growth(5, 0) == 100
+    assert weekly_growth(0, 0) == 0
+    assert weekly_growth(3, 4) == -25
+
+
+def test_percentage_rank_orders_ties_by_id(mock_db):
+    ids = sorted(ObjectId() for _ in range(4))
+    mock_db.events.insert_many([
+        {"_id": ids[0], "likeCount": 5},
+        {"_id": ids[1], "likeCount": 9},
+        {"_id": ids[2], "likeCount": 5},
+        {"_id": ids[3]},
+    ])
+    assert percentage_rank(mock_db.events, ids[1], "likeCount", 9) == 25
+    assert percentage_rank(mock_db.events, ids[0], "likeCount", 5) == 50
+    assert percentage_rank(mock_db.events, ids[2], "likeCount", 5) == 75
+    assert percentage_rank(mock_db.events, ids[3], "likeCount", 0) == 100
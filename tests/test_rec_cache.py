@@ -0,0 +1,106 @@
+import time
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+from rec_cache import RecommendationCache, cache_key, warm_cache
+
+USER = "67d7f1a2b3c4d5e6f7a8b9c0"
+
+
+def test_hit_and_top_n_mismatch():
+    cache = RecommendationCache(maxsize=10, ttl=60)
+    cache.put(USER, 10, ["e1", "e2"], ["jazz"])
+    assert cache.get(USER, 10) == ["e1", "e2"]
+    assert cache.get(USER, 5) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_key_is_canonical():
+    cache = RecommendationCache(maxsize=10, ttl=60)
+    cache.put(USER.upper(), 10, ["e1"], ["jazz"])
+    assert cache_key(ObjectId(USER)) == USER
+    assert ObjectId(USER) in cache
+    assert cache.get(USER, 10) == ["e1"]
+
+
+def test_expired_entries_miss():
+    cache = RecommendationCache(maxsize=10, ttl=-1)
+    cache.put(USER, 10, ["e1"], ["jazz"])
+    assert cache.get(USER, 10) is None
+    assert USER not in cache
+
+
+def test_lru_eviction():
+    cache = RecommendationCache(maxsize=2, ttl=60)
+    users = [str(ObjectId()) for _ in range(3)]
+    cache.put(users[0], 10, ["a"], ["jazz"])
+    cache.put(users[1], 10, ["b"], ["jazz"])
+    cache.get(users[0], 10)
+    cache.put(users[2], 10, ["c"], ["jazz"])
+    assert users[0] in cache
+    assert users[1] not in cache
+    assert users[2] in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_user():
+    cache = RecommendationCache(maxsize=10, ttl=60)
+    other = str(ObjectId())
+    cache.put(USER, 10, ["e1"], ["jazz"])
+    cache.put(other, 10, ["e2"], ["jazz"])
+    cache.invalidate_user(USER)
+    assert USER not in cache
+    assert other in cache
+
+
+def test_invalidate_categories_drops_matching_and_uncategorized_users():
+    cache = RecommendationCache(maxsize=10, ttl=60)
+    jazz, sports, empty = (str(ObjectId()) for _ in range(3))
+    cache.put(jazz, 10, ["e1"], ["jazz", "rock"])
+    cache.put(sports, 10, ["e2"], ["sports"])
+    cache.put(empty, 10, [], [])
+    cache.invalidate_categories(["rock"])
+    assert jazz not in cache
+    assert empty not in cache
+    assert sports in cache
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_put_after_invalidation_is_discarded():
+    cache = RecommendationCache(maxsize=10, ttl=60)
+    other = str(ObjectId())
+    started = time.monotonic()
+    cache.invalidate_user(USER)
+    cache.invalidate_categories(["jazz"])
+    cache.put(USER, 10, ["stale"], ["sports"], computed_at=started)
+    cache.put(other, 10, ["stale"], ["jazz"], computed_at=started)
+    assert USER not in cache
+    assert other not in cache
+
+    # Computations started after the invalidation are kept
+    cache.put(USER, 10, ["fresh"], ["jazz"], computed_at=time.monotonic())
+    assert cache.get(USER, 10) == ["fresh"]
+
+
+def test_warm_cache_in_batches(mock_db, model_store):
+    users = [ObjectId() for _ in range(5)]
+    now = datetime.utcnow()
+    mock_db.likes.insert_many([
+        {"liker": user, "event": model_store.event_ids[0], "createdAt": now} for user in users
+    ])
+    cache = RecommendationCache(maxsize=10, ttl=60)
+    cache.put(users[0], 10, ["cached"], ["jazz"])
+
+    assert warm_cache(cache, mock_db, top_n=10, batch_size=2) == 4
+    assert cache.get(users[0], 10) == ["cached"]
+    assert all(cache.get(user, 10) for user in users[1:])
+
+
+def test_snapshot_is_isolated_from_updates(model_store):
+    snapshot = model_store.snapshot()
+    removed = model_store.event_ids[1]
+    model_store.remove_events([removed])
+    assert removed in snapshot.row_of
+    assert snapshot.alive.all()
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson.objectid import ObjectId
+
+from rec_model_store import (
+    REFIT_INTERVAL, REFIT_RATIO, EventModelStore, new_vectorizer, refit_model_store,
+)
+from text_features import event_terms
+
+
+def event(title, category="music"):
+    return {"_id": ObjectId(), "title": title, "description": "", "category": category}
+
+
+def fitted_store(path, events):
+    store = EventModelStore(path=str(path))
+    store.vectorizer = new_vectorizer()
+    store.matrix = store.vectorizer.fit_transform([event_terms(e) for e in events])
+    store.event_ids = [e["_id"] for e in events]
+    store.categories = [e["category"] for e in events]
+    store.row_of = {event_id: row for row, event_id in enumerate(store.event_ids)}
+    store.alive = np.ones(len(events), dtype=bool)
+    store.source_hashes = {}
+    store.fitted_at = datetime.utcnow()
+    store.fitted_rows = len(events)
+    store._index_categories()
+    return store
+
+
+def test_needs_refit_after_growth_or_age(tmp_path):
+    store = fitted_store(tmp_path / "model.pkl", [event(f"jazz night {i}") for i in range(10)])
+    assert not store.needs_refit()
+
+    grown = int(np.ceil(REFIT_RATIO * 10))
+    store.upsert_events([event(f"techno rave {i}") for i in range(grown - 1)])
+    assert not store.needs_refit()
+    store.upsert_events([event("techno rave")])
+    assert store.needs_refit()
+
+    store.rows_since_fit = 0
+    assert store.needs_refit(now=store.fitted_at + REFIT_INTERVAL)
+    assert not EventModelStore(path=str(tmp_path / "none.pkl")).needs_refit()
+
+
+def test_refit_state_survives_save_and_load(tmp_path):
+    store = fitted_store(tmp_path / "model.pkl", [event("jazz night"), event("rock gig")])
+    store.upsert_events([event("folk evening")])
+    store.save()
+
+    loaded = EventModelStore(path=store.path)
+    assert loaded.load()
+    assert (loaded.fitted_at, loaded.fitted_rows, loaded.rows_since_fit) == (store.fitted_at, 2, 1)
+
+
+def test_refit_loads_a_model_refitted_by_another_process(tmp_path):
+    path = tmp_path / "model.pkl"
+    stale = fitted_store(path, [event("jazz night")])
+    stale.fitted_at -= timedelta(days=30)
+    assert stale.needs_refit()
+
+    fresh = fitted_store(path, [event("jazz night"), event("techno rave", "club")])
+    fresh.save()
+    invalidated = []
+    stale.add_listener(invalidated.append)
+
+    # db=None: building would fail, so the saved refit must be picked up
+    refit_model_store(stale, db=None)
+    assert stale.fitted_at == fresh.fitted_at
+    assert len(stale.row_of) == 2
+    assert invalidated == [{"music", "club"}]
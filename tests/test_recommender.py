@@ -0,0 +1,92 @@
+import numpy as np
+from bson.objectid import ObjectId
+
+from contentBasedRecSystem import (
+    _score_user, _top_k_indices, recommend_batch_with_categories, score_event_weights,
+)
+from rec_model_store import EventModelStore
+
+
+# ------------------------------
+# _top_k_indices
+def test_top_k_matches_full_sort_with_ties():
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        scores = rng.integers(0, 5, rng.integers(1, 40)).astype(float)
+        for k in (1, 3, 10, len(scores)):
+            expected = np.argsort(scores, kind="stable")[::-1][:k]
+            assert _top_k_indices(scores, k).tolist() == expected.tolist()
+
+
+def test_top_k_bounds():
+    scores = np.array([0.2, 0.9, 0.5])
+    assert _top_k_indices(scores, 10).tolist() == [1, 2, 0]
+    assert _top_k_indices(scores, 0).tolist() == []
+    assert _top_k_indices(np.array([]), 3).tolist() == []
+
+
+# ------------------------------
+# _score_user
+def test_score_user_ranks_similar_events_in_preferred_category(model_store):
+    store = model_store
+    ids, categories = _score_user(store, {store.event_ids[0]: 1.0}, top_n=10)
+
+    assert categories == ["jazz"]
+    # Only the unseen jazz events, the one sharing no terms last
+    assert sorted(ids) == sorted(str(event_id) for event_id in store.event_ids[1:4])
+    assert ids[-1] == str(store.event_ids[3])
+
+
+def test_score_user_category_order_by_weight_then_first_interaction(model_store):
+    store = model_store
+    jazz, sports = store.event_ids[0], store.event_ids[4]
+    assert _score_user(store, {jazz: 0.5, sports: 0.5}, 10)[1] == ["jazz", "sports"]
+    assert _score_user(store, {sports: 0.5, jazz: 0.5}, 10)[1] == ["sports", "jazz"]
+    assert _score_user(store, {jazz: 0.2, sports: 0.7}, 10)[1] == ["sports", "jazz"]
+
+
+def test_score_user_without_usable_interactions(model_store):
+    store = model_store
+    assert _score_user(store, {}, 10) == ([], [])
+    assert _score_user(store, {ObjectId(): 1.0}, 10) == ([], [])
+    # Interacted only with an event that has no category
+    assert _score_user(store, {store.event_ids[6]: 1.0}, 10) == ([], [])
+
+
+def test_score_user_skips_removed_events(model_store):
+    store = model_store
+    removed = store.event_ids[2]
+    store.remove_events([removed])
+    ids, _ = _score_user(store, {store.event_ids[0]: 1.0}, 10)
+    assert str(removed) not in ids
+    assert len(ids) == 2
+
+
+def test_score_event_weights_on_empty_store():
+    assert score_event_weights(EventModelStore(path=None), {ObjectId(): 1.0}) == ([], [])
+
+
+# ------------------------------
+# Batch scoring (mongomock)
+def test_batch_matches_single_user_scoring(mock_db, model_store):
+    store = model_store
+    alice, bob, carol = ObjectId(), ObjectId(), ObjectId()
+    mock_db.likes.insert_many([
+        {"_id": ObjectId(), "liker": alice, "event": store.event_ids[0]},
+        {"_id": ObjectId(), "liker": bob, "event": store.event_ids[4]},
+    ])
+    mock_db.clicks.insert_many([
+        {"_id": ObjectId(), "clicker": alice, "event": store.event_ids[5]},
+        {"_id": ObjectId(), "clicker": alice, "event": store.event_ids[5]},
+        {"_id": ObjectId(), "clicker": bob, "event": store.event_ids[1]},
+    ])
+    mock_db.orders.insert_one({"_id": ObjectId(), "buyer": bob, "event": store.event_ids[1]})
+
+    results = recommend_batch_with_categories([alice, bob, carol], mock_db, top_n=5)
+
+    assert results[str(carol)] == ([], [])
+    assert results[str(alice)][1] == ["jazz", "sports"]
+    assert results[str(bob)][1] == ["jazz", "sports"]
+    # Same rows and order _score_user produces for the same weights
+    alice_weights = {store.event_ids[0]: 0.2, store.event_ids[5]: 0.1 + 0.1}
+    assert results[str(alice)][0] == _score_user(store, alice_weights, 5)[0]
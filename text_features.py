@@ -0,0 +1,134 @@
+import hashlib
+import re
+from collections import Counter
+from datetime import datetime
+
+from pymongo import ReplaceOne
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+def preprocess_text(text, is_category=False):
+    """Clean and preprocess text data"""
+    if not isinstance(text, str):
+        return ""
+    
+    # For categories, only convert to lowercase and strip whitespace
+    if is_category:
+        return text.lower().strip()
+    
+    # For other text (title, description), apply full preprocessing
+    text = text.lower()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+def get_event_features(event):
+    """Extract and normalize event features"""
+    features = {}
+    
+    # Text features only
+    features['title'] = preprocess_text(event.get('title', ''))
+    features['description'] = preprocess_text(event.get('description', ''))
+    features['category'] = preprocess_text(event.get('category', ''), is_category=True)
+    
+    return features
+
+def get_event_text(event):
+    """Combined title + description text used for content analysis"""
+    features = get_event_features(event)
+    return f"{features['title']} {features['description']}"
+
+
+# -----------------------------------------------------------------------------
+# Stored term features
+# -----------------------------------------------------------------------------
+# Each event's analyzed terms are computed once, when its text is written, and
+# kept in the event_features collection:
+#     {_id: event id, version, sourceHash, terms: [...], counts: [...], updatedAt}
+# terms/counts is the sparse term-frequency vector of get_event_text(event).
+# TF-IDF weights depend on the whole catalog, so the recommender applies them
+# when it assembles its matrix (rec_model_store).
+
+# Bump when preprocess_text or ANALYZER_SETTINGS change; features stored under
+# another version are recomputed on next use
+FEATURE_VERSION = 1
+FEATURES_COLLECTION = "event_features"
+
+# Tokenization of the recommender's TF-IDF model
+ANALYZER_SETTINGS = {"stop_words": "english", "ngram_range": (1, 2)}
+
+# Above this many events, read every stored feature instead of an $in lookup
+IN_QUERY_LIMIT = 1000
+WRITE_BATCH_SIZE = 1000
+
+_analyze = TfidfVectorizer(**ANALYZER_SETTINGS).build_analyzer()
+
+
+def source_hash(event):
+    """Fingerprint of the raw text the features were computed from."""
+    text = f"{event.get('title', '')}\x00{event.get('description', '')}"
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+
+def event_terms(event):
+    """(terms, counts): the event's analyzed terms, sorted, with their frequencies."""
+    counts = Counter(_analyze(get_event_text(event)))
+    terms = sorted(counts)
+    return terms, [counts[term] for term in terms]
+
+
+def feature_document(event, now=None):
+    terms, counts = event_terms(event)
+    return {
+        "_id": event["_id"],
+        "version": FEATURE_VERSION,
+        "sourceHash": source_hash(event),
+        "terms": terms,
+        "counts": counts,
+        "updatedAt": now or datetime.utcnow(),
+    }
+
+
+def _write_features(db, documents):
+    for start in range(0, len(documents), WRITE_BATCH_SIZE):
+        db[FEATURES_COLLECTION].bulk_write([
+            ReplaceOne({"_id": doc["_id"]}, doc, upsert=True)
+            for doc in documents[start:start + WRITE_BATCH_SIZE]
+        ], ordered=False)
+
+
+def store_event_features(db, events, now=None):
+    """Compute and store features for `events` (dicts with _id, title, description)."""
+    now = now or datetime.utcnow()
+    _write_features(db, [feature_document(event, now) for event in events])
+
+
+def remove_event_features(db, event_ids):
+    db[FEATURES_COLLECTION].delete_many({"_id": {"$in": list(event_ids)}})
+
+
+def load_event_features(db, events):
+    """
+    (terms, counts) for each of `events`, in order. Stored features are reused
+    when their version and source hash match; missing or stale ones (events
+    written before features existed, or edited by another app) are computed
+    and written back.
+    """
+    query = {"version": FEATURE_VERSION}
+    if len(events) <= IN_QUERY_LIMIT:
+        query["_id"] = {"$in": [event["_id"] for event in events]}
+    stored = {
+        doc["_id"]: doc
+        for doc in db[FEATURES_COLLECTION].find(query, {"sourceHash": 1, "terms": 1, "counts": 1})
+    }
+
+    now = datetime.utcnow()
+    features, recomputed = [], []
+    for event in events:
+        doc = stored.get(event["_id"])
+        if doc is None or doc["sourceHash"] != source_hash(event):
+            doc = feature_document(event, now)
+            recomputed.append(doc)
+        features.append((doc["terms"], doc["counts"]))
+    if recomputed:
+        _write_features(db, recomputed)
+    return features